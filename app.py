@@ -1,22 +1,37 @@
-from flask import Flask, make_response, render_template, request, redirect, url_for, session, flash
+from flask import Flask, Response, make_response, render_template, request, redirect, url_for, session, flash, g, jsonify
 import psycopg2
 from psycopg2 import sql, errors as pg_errors
+from psycopg2.extras import execute_values
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.exceptions import abort
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from io import BytesIO
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 from dotenv import load_dotenv
 load_dotenv() 
 
+import glob
+import hashlib
 import json
 import re
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+from db_pool import PoolConexiones, PoolAgotado
+from pdf_factura import generar_pdf_factura, zip_en_flujo, pdf_unido_en_flujo
+from cache_pdf import CachePdf, version_factura
+from render_pool import PoolRender, ColaLlena
+from catalogo import CacheCatalogo
+from importar import importar_csv, ErrorImportacion
+from exportar import exportar, EXPORTACIONES, FORMATOS
+from contrasenas import PoolContrasenas, VerificacionOcupada
+from sentencias import ConexionPreparada, contadores as contadores_sentencias, ejecutar
+from estaticos import CACHE_INMUTABLE, Estaticos, codificaciones, comprimir
 
 app = Flask(__name__)
 app.secret_key = os.environ["FLASK_SECRET_KEY"]
+# Tamaño máximo de los archivos subidos (importación de CSV)
+app.config['MAX_CONTENT_LENGTH'] = int(float(os.environ.get("IMPORTAR_MAX_MB", 50)) * 1024 * 1024)
 
 # Configuración de la base de datos
 DB_CONFIG = {
@@ -27,10 +42,262 @@ DB_CONFIG = {
     'password': os.environ["DB_PASSWORD"]
 }
 
+# Configuración del pool de conexiones
+POOL_CONFIG = {
+    'minimo': int(os.environ.get("DB_POOL_MIN", 1)),
+    'maximo': int(os.environ.get("DB_POOL_MAX", 10)),
+    'timeout': float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+    'vida_maxima': float(os.environ.get("DB_POOL_VIDA_MAXIMA", 1800)),
+    'inactividad_maxima': float(os.environ.get("DB_POOL_INACTIVIDAD_MAXIMA", 300)),
+    'verificar_tras': float(os.environ.get("DB_POOL_VERIFICAR_TRAS", 5)),
+}
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    # El pool se crea de forma perezosa y por proceso, para que cada worker
+    # (gunicorn hace fork) tenga sus propias conexiones.
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                # Las conexiones preparan las sentencias frecuentes (sentencias.py) una sola vez
+                _pool = PoolConexiones(DB_CONFIG, connection_factory=ConexionPreparada, **POOL_CONFIG)
+                _pool_pid = os.getpid()
+    return _pool
+
 def get_db_connection():
-    conn = psycopg2.connect(**DB_CONFIG)
-    return conn
+    # Una sola conexión por petición: se toma del pool la primera vez que se
+    # pide y se devuelve en el teardown. No se debe cerrar en las rutas.
+    if 'db_conn' not in g:
+        g.db_conn = get_pool().obtener()
+    return g.db_conn
+
+@app.teardown_appcontext
+def devolver_db_connection(exception):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        get_pool().devolver(conn)
+
+@app.errorhandler(PoolAgotado)
+def pool_agotado(e):
+    print(f"Pool de conexiones agotado: {e}")
+    return "El servicio está ocupado, intente nuevamente en unos segundos.", 503
+
+# Render de PDFs fuera de los workers web, en un pool de procesos acotado
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", os.cpu_count() or 2))
+PDF_MAX_COLA = int(os.environ.get("PDF_MAX_COLA", PDF_WORKERS * 2))
+PDF_TIMEOUT_COLA = float(os.environ.get("PDF_TIMEOUT_COLA", 5))
+
+_pool_render = None
+_pool_render_pid = None
+_pool_render_lock = threading.Lock()
+
+def get_pool_render():
+    global _pool_render, _pool_render_pid
+    if _pool_render is None or _pool_render_pid != os.getpid():
+        with _pool_render_lock:
+            if _pool_render is None or _pool_render_pid != os.getpid():
+                _pool_render = PoolRender(PDF_WORKERS, PDF_MAX_COLA, PDF_TIMEOUT_COLA)
+                _pool_render_pid = os.getpid()
+    return _pool_render
+
+@app.errorhandler(ColaLlena)
+def cola_render_llena(e):
+    print(f"Cola de render de PDFs llena: {e}")
+    response = make_response("Hay demasiadas descargas de PDF en curso, intente nuevamente en unos segundos.", 503)
+    response.headers['Retry-After'] = '5'
+    return response
 
+# Caché de la primera página de los catálogos (clientes y productos),
+# invalidado por LISTEN/NOTIFY
+_catalogo = None
+_catalogo_pid = None
+_catalogo_lock = threading.Lock()
+
+def get_catalogo():
+    # Uno por proceso: cada worker tiene su propio hilo de escucha
+    global _catalogo, _catalogo_pid
+    if _catalogo is None or _catalogo_pid != os.getpid():
+        with _catalogo_lock:
+            if _catalogo is None or _catalogo_pid != os.getpid():
+                # Basta para la primera página más larga que se puede pedir
+                _catalogo = CacheCatalogo(DB_CONFIG, get_db_connection, BUSQUEDA_POR_PAGINA_MAX + 1)
+                _catalogo_pid = os.getpid()
+    return _catalogo
+
+def leer_fecha_factura(args):
+    # Fecha (día) de la factura pasada en los enlaces; permite a PostgreSQL
+    # leer solo la partición de ese mes. Si no es válida se ignora.
+    try:
+        return datetime.strptime(args.get('fecha', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+def decodificar_factura(texto):
+    # Documento de obtener_factura_json() -> dict con los montos como Decimal
+    # y la fecha como date; None si la factura no existe
+    if texto is None:
+        return None
+    factura = json.loads(texto, parse_float=Decimal)
+    factura['fecha'] = date.fromisoformat(factura['fecha'])
+    return factura
+
+def cargar_factura(cur, id, fecha=None):
+    # Cabecera, cliente e ítems de una factura en una sola ida y vuelta
+    ejecutar(cur, 'factura_json', (id, fecha))
+    return decodificar_factura(cur.fetchone()[0])
+
+# Archivos estáticos con huella de contenido, precomprimidos (estaticos.py)
+estaticos = Estaticos(app.static_folder)
+
+@app.url_defaults
+def versionar_estaticos(endpoint, values):
+    # url_for('static', filename='style.css') -> /static/style.<huella>.css
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = estaticos.url(values['filename'])
+
+def servir_estatico(filename):
+    archivo = estaticos.obtener(filename, request.accept_encodings)
+    if archivo is None:
+        # Nombre sin huella (enlaces escritos a mano): caché normal de Flask
+        return app.send_static_file(filename)
+    tipo, codificacion, datos = archivo
+    response = Response(datos, mimetype=tipo)
+    if codificacion != 'identity':
+        response.headers['Content-Encoding'] = codificacion
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = CACHE_INMUTABLE
+    return response
+
+# Reemplaza la vista de Flask para /static/<filename>
+app.view_functions['static'] = servir_estatico
+
+# Páginas HTML dinámicas: se comprimen al enviarlas si superan este tamaño
+COMPRIMIR_HTML_MIN_BYTES = int(os.environ.get("COMPRIMIR_HTML_MIN_BYTES", 1024))
+
+def comprimir_html(response, datos, aceptadas):
+    # Comprime el cuerpo `datos` si es grande y el cliente acepta br o gzip
+    response.vary.add('Accept-Encoding')
+    codificacion = aceptadas.best_match(codificaciones())
+    if codificacion and len(datos) >= COMPRIMIR_HTML_MIN_BYTES:
+        response.set_data(comprimir(datos, codificacion, rapido=True))
+        response.headers['Content-Encoding'] = codificacion
+    return response
+
+@app.after_request
+def comprimir_respuesta_html(response):
+    if (response.status_code == 200 and response.mimetype == 'text/html'
+            and not response.is_streamed and 'Content-Encoding' not in response.headers):
+        comprimir_html(response, response.get_data(), request.accept_encodings)
+    return response
+
+# Caché HTTP de páginas HTML (ETag / Last-Modified). El ETag incluye el
+# contenido de las plantillas y de los estáticos que enlazan: tras un
+# despliegue que los cambie ninguna página guardada sigue siendo válida.
+def _huella_despliegue():
+    huella = hashlib.sha256(estaticos.huella().encode('utf-8'))
+    for ruta in sorted(glob.glob(os.path.join(app.root_path, app.template_folder, '*.html'))):
+        with open(ruta, 'rb') as f:
+            huella.update(f.read())
+    return huella.hexdigest()[:16]
+
+HUELLA_DESPLIEGUE = _huella_despliegue()
+
+def validadores_pagina(sesion, modificada, *datos):
+    # (etag, modificada) de una página según los datos que muestra y el
+    # usuario de la sesión (aparece en el menú). None si hay mensajes flash
+    # pendientes: la página los muestra una sola vez y no debe guardarse.
+    if '_flashes' in sesion:
+        return None
+    contenido = repr(datos + (sesion.get('usuario'), HUELLA_DESPLIEGUE))
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:32], modificada
+
+def pagina_vigente(req, validadores):
+    # True si el navegador ya tiene esta versión (se responde 304). Como
+    # indica RFC 9110, If-Modified-Since solo cuenta si no hay If-None-Match.
+    if validadores is None:
+        return False
+    etag, modificada = validadores
+    if req.if_none_match:
+        return req.if_none_match.contains_weak(etag)
+    if req.if_modified_since and modificada:
+        return modificada.replace(microsecond=0) <= req.if_modified_since
+    return False
+
+def con_validadores(response, validadores):
+    if validadores is not None:
+        etag, modificada = validadores
+        response.set_etag(etag, weak=True)
+        if modificada:
+            response.last_modified = modificada
+        # El navegador guarda la página pero la revalida en cada visita
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Caché de PDFs de facturas (memoria + disco opcional)
+cache_pdf = CachePdf(
+    max_bytes=int(float(os.environ.get("PDF_CACHE_MAX_MB", 64)) * 1024 * 1024),
+    directorio=os.environ.get("PDF_CACHE_DIR") or None,
+)
+
+@app.route('/estado')
+def estado():
+    if 'usuario' not in session:
+        return redirect(url_for('login'))
+    return jsonify({
+        'pool_db': get_pool().estadisticas(),
+        'cache_pdf': cache_pdf.estadisticas(),
+        'estaticos': estaticos.estadisticas(),
+        'render_pdf': _pool_render.estadisticas() if _pool_render_pid == os.getpid() else None,
+        'catalogo': _catalogo.estadisticas() if _catalogo_pid == os.getpid() else None,
+        'contrasenas': _pool_contrasenas.estadisticas() if _pool_contrasenas_pid == os.getpid() else None,
+        'sentencias': contadores_sentencias.estadisticas(),
+    })
+
+
+# Hash de contraseñas en un ejecutor acotado y límite de intentos de login
+HASH_HILOS = int(os.environ.get("HASH_HILOS", 2))
+HASH_MAX_COLA = int(os.environ.get("HASH_MAX_COLA", HASH_HILOS * 4))
+HASH_TIMEOUT_COLA = float(os.environ.get("HASH_TIMEOUT_COLA", 2))
+HASH_METODO = os.environ.get("HASH_METODO", "scrypt")   # p. ej. "scrypt:65536:8:1" o "pbkdf2:sha256:600000"
+LOGIN_MAX_FALLOS_USUARIO = int(os.environ.get("LOGIN_MAX_FALLOS_USUARIO", 5))
+LOGIN_MAX_FALLOS_IP = int(os.environ.get("LOGIN_MAX_FALLOS_IP", 20))
+LOGIN_VENTANA = int(os.environ.get("LOGIN_VENTANA", 900))      # segundos en que se cuentan los fallos
+LOGIN_BLOQUEO = int(os.environ.get("LOGIN_BLOQUEO", 300))      # segundos de bloqueo al superar el máximo
+
+_pool_contrasenas = None
+_pool_contrasenas_pid = None
+_pool_contrasenas_lock = threading.Lock()
+
+def get_pool_contrasenas():
+    global _pool_contrasenas, _pool_contrasenas_pid
+    if _pool_contrasenas is None or _pool_contrasenas_pid != os.getpid():
+        with _pool_contrasenas_lock:
+            if _pool_contrasenas is None or _pool_contrasenas_pid != os.getpid():
+                _pool_contrasenas = PoolContrasenas(HASH_HILOS, HASH_MAX_COLA, HASH_TIMEOUT_COLA, HASH_METODO)
+                _pool_contrasenas_pid = os.getpid()
+    return _pool_contrasenas
+
+@app.errorhandler(VerificacionOcupada)
+def verificacion_ocupada(e):
+    print(f"Cola de verificación de contraseñas llena: {e}")
+    flash("Hay muchos inicios de sesión en este momento, intente nuevamente en unos segundos.", "error")
+    plantilla = 'register.html' if request.endpoint == 'register' else 'login.html'
+    response = make_response(render_template(plantilla), 503)
+    response.headers['Retry-After'] = '5'
+    return response
+
+def claves_login(username):
+    # Los fallos se cuentan por usuario y por IP (detrás de un proxy, usar ProxyFix)
+    return [f"usuario:{username}", f"ip:{request.remote_addr}"]
+
+def login_bloqueado(conn, username):
+    with conn.cursor() as cur:
+        cur.execute('SELECT segundos_bloqueo_login(%s);', (claves_login(username),))
+        return cur.fetchone()[0]
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -51,27 +318,63 @@ def login():
             flash("La contraseña debe tener al menos 8 caracteres", "error")
             return redirect(url_for('login'))
 
-        # Conexión a la base de datos
-        conn = get_db_connection()
-        cur = conn.cursor()
-
+        # La conexión se devuelve al pool antes de verificar el hash, que
+        # puede esperar cupo en su ejecutor; se vuelve a pedir para escribir
+        user = None
         try:
-            cur.execute("SELECT * FROM obtener_usuario_por_username(%s);", (username,))
-            user = cur.fetchone()
+            with get_pool().conexion() as conn:
+                # Los intentos bloqueados se rechazan antes de calcular ningún hash
+                espera = login_bloqueado(conn, username)
+                if not espera:
+                    with conn.cursor() as cur:
+                        cur.execute("SELECT * FROM obtener_usuario_por_username(%s);", (username,))
+                        user = cur.fetchone()
+                conn.rollback()
+        except PoolAgotado:
+            raise
         except Exception as e:
             print(f"Error al buscar el usuario: {e}")
             flash("Ocurrió un error al buscar el usuario", "error")
             return redirect(url_for('login'))
-        finally:
-            cur.close()
-            conn.close()
 
-        if user and check_password_hash(user[2], password):
+        if espera:
+            flash(f"Demasiados intentos fallidos. Intente nuevamente en {espera} segundos.", "error")
+            return redirect(url_for('login'))
+
+        pool_contrasenas = get_pool_contrasenas()
+        valida, rehash = pool_contrasenas.verificar(user[2], password) if user else (False, False)
+
+        if valida:
+            # El método o costo configurado cambió: el hash nuevo también se
+            # calcula sin tener una conexión
+            nuevo_hash = pool_contrasenas.generar(password) if rehash else None
+            conn = get_db_connection()
+            with conn.cursor() as cur:
+                cur.execute('DELETE FROM intentos_login WHERE clave = %s;', (claves_login(username)[0],))
+                if nuevo_hash:
+                    cur.execute(
+                        'UPDATE usuario SET password = %s WHERE id = %s AND password = %s;',
+                        (nuevo_hash, user[0], user[2])
+                    )
+                    pool_contrasenas.registrar_rehash()
+            conn.commit()
+
             session['usuario_id'] = user[0]
             session['usuario'] = str(user[1]).upper()
             return redirect(url_for('listar_facturas'))
         else:
-            flash('Nombre de usuario o contraseña incorrectos', 'error')
+            conn = get_db_connection()
+            with conn.cursor() as cur:
+                cur.execute(
+                    'SELECT registrar_fallo_login(%s, %s, %s, %s);',
+                    (claves_login(username), [LOGIN_MAX_FALLOS_USUARIO, LOGIN_MAX_FALLOS_IP], LOGIN_VENTANA, LOGIN_BLOQUEO)
+                )
+                espera = cur.fetchone()[0]
+            conn.commit()
+            if espera:
+                flash(f"Demasiados intentos fallidos. Intente nuevamente en {espera} segundos.", "error")
+            else:
+                flash('Nombre de usuario o contraseña incorrectos', 'error')
             return redirect(url_for('login'))
 
     return render_template('login.html')
@@ -113,13 +416,16 @@ def register():
             flash("Clave secreta incorrecta.", "error")
             return redirect(url_for('register'))
 
+        # El hash se calcula antes de tomar la conexión (puede esperar cupo)
+        password_hash = get_pool_contrasenas().generar(password)
+
         # Intentar registrar usuario
         conn = get_db_connection()
         cur = conn.cursor()
         try:
             cur.execute(
                 'CALL insertar_usuario(%s, %s, %s);',
-                (username, email, generate_password_hash(password))
+                (username, email, password_hash)
             )
             conn.commit()
             flash('Usuario registrado exitosamente', 'success')
@@ -133,7 +439,6 @@ def register():
             flash('Ocurrió un error al registrar el usuario.', 'error')
         finally:
             cur.close()
-            conn.close()
 
         return redirect(url_for('register'))
 
@@ -150,71 +455,144 @@ def logout():
     return redirect(url_for('login'))
 
 
+# Paginación del listado de facturas
+FACTURAS_POR_PAGINA = int(os.environ.get("FACTURAS_POR_PAGINA", 50))
+FACTURAS_POR_PAGINA_MAX = int(os.environ.get("FACTURAS_POR_PAGINA_MAX", 200))
+
+def obtener_por_pagina(args, defecto=FACTURAS_POR_PAGINA, maximo=FACTURAS_POR_PAGINA_MAX):
+    # Tamaño de página pedido en ?por_pagina=, acotado a [1, maximo]
+    try:
+        por_pagina = int(args.get('por_pagina', defecto))
+    except ValueError:
+        por_pagina = defecto
+    return max(1, min(por_pagina, maximo))
+
+def leer_cursor(valor):
+    # Cursor con formato "<fecha ISO>_<id>"; si no es válido se ignora
+    if not valor:
+        return None
+    try:
+        fecha, id_ = valor.rsplit('_', 1)
+        return datetime.fromisoformat(fecha), int(id_)
+    except ValueError:
+        return None
+
+def escribir_cursor(factura):
+    # factura[5] es la fecha completa (fecha_orden) y factura[0] el id
+    return f"{factura[5].isoformat()}_{factura[0]}"
+
+
+def leer_filtros_facturas(args):
+    # Valida los filtros de búsqueda de facturas. Devuelve los filtros tal como
+    # llegaron (para reconstruir URLs) y sus valores normalizados para SQL.
+    # Lanza ValueError con el mensaje para el usuario si algo no es válido.
+    numero = args.get('numero', '').strip().upper()
+    cliente = args.get('cliente', '').strip()
+    desde = args.get('desde', '').strip()
+    hasta = args.get('hasta', '').strip()
+    filtros = {k: v for k, v in (('numero', numero), ('cliente', cliente), ('desde', desde), ('hasta', hasta)) if v}
+
+    # Validación: número de factura completo (FACT-1001) o sus primeros dígitos (100)
+    if numero:
+        if not re.match(r"^(FACT-)?\d{1,10}$", numero):
+            raise ValueError("El número de factura debe ser numérico (ej: 1001 o FACT-1001).")
+        if not numero.startswith('FACT-'):
+            numero = f"FACT-{numero}"
+
+    # Validación: cliente solo letras (incluyendo ñ y tildes)
+    if cliente and not re.match(r"^[A-Za-zÑñÁÉÍÓÚáéíóú\s]+$", cliente):
+        raise ValueError("El nombre del cliente solo puede contener letras y espacios.")
+
+    # Validación: rango de fechas
+    try:
+        fecha_desde = datetime.strptime(desde, '%Y-%m-%d').date() if desde else None
+        fecha_hasta = datetime.strptime(hasta, '%Y-%m-%d').date() if hasta else None
+    except ValueError:
+        raise ValueError("Las fechas deben tener el formato AAAA-MM-DD.")
+    if fecha_desde and fecha_hasta and fecha_desde > fecha_hasta:
+        raise ValueError("La fecha inicial no puede ser posterior a la fecha final.")
+
+    return filtros, {
+        'numero': numero or None,
+        'cliente': cliente or None,
+        'desde': fecha_desde,
+        'hasta': fecha_hasta,
+    }
+
+def pagina_facturas(facturas, por_pagina, anteriores, cursor):
+    # Recorta la fila extra pedida a obtener_facturas() y arma los cursores
+    # de la página anterior y la siguiente
+    hay_mas = len(facturas) > por_pagina
+    if hay_mas:
+        facturas = facturas[1:] if anteriores else facturas[:-1]
+
+    paginacion = None
+    if facturas:
+        hay_siguiente = hay_mas if not anteriores else True
+        hay_anterior = hay_mas if anteriores else cursor is not None
+        paginacion = {
+            'por_pagina': por_pagina,
+            'siguiente': escribir_cursor(facturas[-1]) if hay_siguiente else None,
+            'anterior': escribir_cursor(facturas[0]) if hay_anterior else None,
+        }
+    return facturas, paginacion
+
 @app.route('/facturas', methods=['GET', 'POST'])
 def listar_facturas():
     if 'usuario' not in session:
         return redirect(url_for('login'))
 
+    # La búsqueda se envía por GET para poder paginar sus resultados; un POST
+    # (formularios antiguos) se redirige a la URL equivalente.
+    if request.method == 'POST':
+        filtros = {k: request.form.get(k, '').strip() for k in ('numero', 'cliente', 'desde', 'hasta')}
+        return redirect(url_for('listar_facturas', **{k: v for k, v in filtros.items() if v}))
+
     facturas = []
+    paginacion = None
     error = None
 
+    try:
+        filtros, busqueda = leer_filtros_facturas(request.args)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for('listar_facturas'))
+
+    validadores = None
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                if request.method == 'POST':
-                    numero = request.form.get('numero', '').strip()
-                    cliente = request.form.get('cliente', '').strip()
-                    fecha = request.form.get('fecha', '').strip()
-
-                    condiciones = []
-                    valores = []
-
-                    # Validación: número de factura debe ser exactamente 4 dígitos
-                    if numero:
-                        if not numero.isdigit() or len(numero) != 4:
-                            flash("El número de factura debe contener exactamente 4 dígitos numéricos.", "danger")
-                            return redirect(url_for('listar_facturas'))
-                        condiciones.append("RIGHT(f.numero, 4) = %s")
-                        valores.append(numero)
-
-                    # Validación: cliente solo letras (incluyendo ñ y tildes)
-                    if cliente:
-                        import re
-                        if not re.match(r"^[A-Za-zÑñÁÉÍÓÚáéíóú\s]+$", cliente):
-                            flash("El nombre del cliente solo puede contener letras y espacios.", "danger")
-                            return redirect(url_for('listar_facturas'))
-                        condiciones.append("c.nombre ILIKE %s")
-                        valores.append(f"%{cliente}%")
-
-                    # Validación básica de fecha
-                    if fecha:
-                        condiciones.append("CAST(f.fecha AS TEXT) ILIKE %s")
-                        valores.append(f"%{fecha}%")
-
-                    query = """
-                        SELECT f.id, f.numero, f.fecha, c.nombre, f.total
-                        FROM facturas f
-                        JOIN clientes c ON f.cliente_id = c.id
-                    """
-
-                    if condiciones:
-                        query += " WHERE " + " AND ".join(condiciones)
-
-                    query += " ORDER BY f.fecha DESC"
-
-                    cur.execute(query, tuple(valores))
-                    facturas = cur.fetchall()
-                else:
-                    cur.execute('SELECT * FROM obtener_facturas();')
-                    facturas = cur.fetchall()
+                # Si nada cambió desde la versión que tiene el navegador, 304
+                # sin consultar las facturas ni renderizar
+                ejecutar(cur, 'version_facturas')
+                cambios, modificada = cur.fetchone()
+                validadores = validadores_pagina(session, modificada, 'facturas', cambios)
+                if pagina_vigente(request, validadores):
+                    return con_validadores(make_response('', 304), validadores)
+
+                por_pagina = obtener_por_pagina(request.args)
+                cursor_despues = leer_cursor(request.args.get('despues'))
+                cursor_antes = leer_cursor(request.args.get('antes'))
+                anteriores = cursor_antes is not None and cursor_despues is None
+                cursor = cursor_antes if anteriores else cursor_despues
+
+                # Se pide una fila extra para saber si hay más páginas
+                cur.execute(
+                    'SELECT * FROM obtener_facturas(%s, %s, %s, %s, %s, %s, %s, %s);',
+                    (por_pagina + 1, cursor[0] if cursor else None, cursor[1] if cursor else None, anteriores,
+                     busqueda['numero'], busqueda['cliente'], busqueda['desde'], busqueda['hasta'])
+                )
+                facturas, paginacion = pagina_facturas(cur.fetchall(), por_pagina, anteriores, cursor)
     except Exception as e:
         error = "Ocurrió un error al obtener las facturas. Intente más tarde."
         print(f"Error en listar_facturas: {e}")
 
     if error:
         flash(error, 'danger')
+        validadores = None
 
-    return render_template('factura.html', facturas=facturas)
+    response = make_response(render_template('factura.html', facturas=facturas, paginacion=paginacion, filtros=filtros))
+    return con_validadores(response, validadores)
 
 @app.route('/factura/nueva', methods=['GET', 'POST'])
 def nueva_factura():
@@ -225,105 +603,90 @@ def nueva_factura():
         # Obtener datos del formulario
         cliente_id = request.form['cliente_id']
         items = []
-        total = 0
 
-        # CAMBIO 8 
-        # Validación: verificar si el cliente existe
+        # Leer las filas del formulario
+        pedidos = []
+        for i in range(1, 6):  # Máximo 5 items por factura
+            producto_id = request.form.get(f'producto_id_{i}')
+            cantidad = request.form.get(f'cantidad_{i}')
+            if producto_id and cantidad:
+                try:
+                    pedidos.append((int(producto_id), int(cantidad)))
+                except ValueError:
+                    flash('Error al procesar el item.', 'error')
+                    return redirect(url_for('nueva_factura'))
+
+        # CAMBIO 8
+        # Validación en una sola consulta: existencia del cliente más el stock
+        # de todos los productos solicitados (id = ANY(...)). El precio lo toma
+        # crear_factura() del catálogo.
         try:
             conn = get_db_connection()
             cur = conn.cursor()
-            cur.execute("SELECT COUNT(*) FROM clientes WHERE id = %s;", (cliente_id,))
-            cliente_existe = cur.fetchone()[0] > 0
+            cur.execute('''
+                SELECT c.existe, p.id, p.stock
+                FROM (SELECT EXISTS (SELECT 1 FROM clientes WHERE id = %s) AS existe) c
+                LEFT JOIN productos p ON p.id = ANY(%s);
+            ''', (cliente_id, [producto_id for producto_id, _ in pedidos]))
+            filas = cur.fetchall()
             cur.close()
-            conn.close()
-
-            if not cliente_existe:
-                flash("El cliente no existe.", "error")
-                return redirect(url_for('nueva_factura'))
         except Exception as e:
-            print(f"Error al verificar cliente: {e}")
+            print(f"Error al verificar cliente y productos: {e}")
             flash("Error al verificar el cliente.", "error")
             return redirect(url_for('nueva_factura'))
 
-        # Procesar items
-        for i in range(1, 6):  # Máximo 5 items por factura
-            producto_id = request.form.get(f'producto_id_{i}')
-            cantidad = request.form.get(f'cantidad_{i}')
-            try:
-                if producto_id and cantidad:
-                    conn = get_db_connection()
-                    cur = conn.cursor()
-
-                    # Obtener precio y stock del producto
-                    cur.execute('SELECT precio, stock FROM productos WHERE id = %s;', (producto_id,))
-                    producto = cur.fetchone()
-
-                    if not producto:
-                        flash(f"El producto con ID {producto_id} no existe.", "error")
-                        cur.close()
-                        conn.close()
-                        return redirect(url_for('nueva_factura'))
-
-                    precio, stock_disponible = producto
-                    cantidad = int(cantidad)
-
-                    if cantidad > stock_disponible:
-                        flash(f"La cantidad solicitada ({cantidad}) excede el stock disponible ({stock_disponible}) para el producto ID {producto_id}.", "error")
-                        cur.close()
-                        conn.close()
-                        return redirect(url_for('nueva_factura'))
-
-                    subtotal = float(precio) * cantidad
-                    items.append({
-                        'producto_id': producto_id,
-                        'cantidad': cantidad,
-                        'precio': precio,
-                        'subtotal': subtotal
-                    })
-                    total += subtotal
-            except Exception as e:
-                print(f"Error al procesar el item: {e}")
-                flash('Error al procesar el item.', 'error')
+        if not filas[0][0]:
+            flash("El cliente no existe.", "error")
+            return redirect(url_for('nueva_factura'))
+
+        # Procesar items en memoria sobre el resultado de la consulta
+        productos = {fila[1]: fila[2] for fila in filas if fila[1] is not None}
+        solicitado = {}
+        for producto_id, cantidad in pedidos:
+            if producto_id not in productos:
+                flash(f"El producto con ID {producto_id} no existe.", "error")
                 return redirect(url_for('nueva_factura'))
-            finally:
-                cur.close()
-                conn.close()
-        
+
+            if cantidad <= 0:
+                flash(f"La cantidad para el producto ID {producto_id} debe ser mayor que cero.", "error")
+                return redirect(url_for('nueva_factura'))
+
+            stock_disponible = productos[producto_id]
+
+            # Un mismo producto puede venir en varias filas: se valida la suma
+            solicitado[producto_id] = solicitado.get(producto_id, 0) + cantidad
+            if solicitado[producto_id] > stock_disponible:
+                flash(f"La cantidad solicitada ({solicitado[producto_id]}) excede el stock disponible ({stock_disponible}) para el producto ID {producto_id}.", "error")
+                return redirect(url_for('nueva_factura'))
+
+            items.append({
+                'producto_id': producto_id,
+                'cantidad': cantidad
+            })
+
         # --- VALIDACIÓN CRÍTICA ---
         if not items:
             flash('Error: Una factura debe tener al menos un producto.', 'error')
             return redirect(url_for('nueva_factura'))  # Redirige de vuelta al formulario
 
         try:
-            # Insertar factura con número generado
             conn = get_db_connection()
             cur = conn.cursor()
 
-            # Obtener el próximo número de factura de la secuencia
-            cur.execute("SELECT * FROM obtener_siguiente_numero_factura()")
-            numero_factura = f"FACT-{cur.fetchone()[0]}"
-
-            cur.execute(
-                'SELECT insertar_factura(%s, %s, %s);', (numero_factura, cliente_id, total)
-                )
+            # Crear la factura en una sola llamada y transacción: número,
+            # cabecera, items y descuento de stock (con control de stock)
+            productos_json = json.dumps([
+                {'producto_id': item['producto_id'], 'cantidad': item['cantidad']} for item in items
+            ])
+            cur.execute('SELECT crear_factura(%s, %s);', (cliente_id, productos_json))
             factura_id = cur.fetchone()[0]
             conn.commit()
-
-            # Insertar items de factura y actualizar stock
-            for item in items:
-                cur.execute(
-                    'CALL insertar_factura_item(%s, %s, %s, %s, %s);',
-                    (factura_id, item['producto_id'], item['cantidad'], item['precio'], item['subtotal'])
-                )
-
-                # Actualizar el stock del producto
-                cur.execute(
-                    'UPDATE productos SET stock = stock - %s WHERE id = %s;',
-                    (item['cantidad'], item['producto_id'])
-                )
-
-
-            conn.commit()
+        except pg_errors.RaiseException as e:
+            # Errores de validación del procedimiento (p. ej. stock insuficiente
+            # por una venta concurrente)
+            conn.rollback()
+            flash(e.diag.message_primary, 'error')
+            return redirect(url_for('nueva_factura'))
         except Exception as e:
             print(f"Error al insertar la factura: {e}")
             conn.rollback()
@@ -331,29 +694,10 @@ def nueva_factura():
             return redirect(url_for('nueva_factura'))
         finally:
             cur.close()
-            conn.close()
         return redirect(url_for('ver_factura', id=factura_id))
     else:
-        try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-
-            # Obtener clientes
-            cur.execute('SELECT * FROM obtener_clientes();')
-            clientes = cur.fetchall()
-
-            # Obtener productos
-            cur.execute('SELECT * FROM obtener_productos();')
-            productos = cur.fetchall()
-
-        except Exception as e:
-            print(f"Error al obtener clientes o productos: {e}")
-            flash('Error al cargar los datos.', 'error')
-            return redirect(url_for('listar_facturas'))
-        finally:
-            cur.close()
-            conn.close()
-        return render_template('nueva_factura.html', clientes=clientes, productos=productos)
+        # Clientes y productos se buscan desde el formulario (/api/clientes, /api/productos)
+        return render_template('nueva_factura.html')
 
 @app.route('/factura/<int:id>', methods=['GET'])
 def ver_factura(id):
@@ -362,26 +706,30 @@ def ver_factura(id):
     
     conn = get_db_connection()
     cur = conn.cursor()
+    fecha = leer_fecha_factura(request.args)
+
+    # Versión de la factura: si el navegador ya la tiene, 304 sin leer los
+    # items ni renderizar
+    ejecutar(cur, 'version_factura', (id, fecha))
+    version = cur.fetchone()
+    factura = None
+    if version:
+        validadores = validadores_pagina(session, version[1], 'factura', id, version[0], version[2])
+        if pagina_vigente(request, validadores):
+            cur.close()
+            return con_validadores(make_response('', 304), validadores)
 
-    # Obtener factura
-    cur.execute('''SELECT * FROM obtener_factura_por_id(%s);''', (id,))
-    factura = cur.fetchone()
+        # Obtener factura con sus items
+        factura = cargar_factura(cur, id, fecha)
+    cur.close()
     #Cambio 9
     # Validación: si no existe la factura, redirigir con mensaje
     if not factura:
-        cur.close()
-        conn.close()
         flash("La factura no existe o ha sido eliminada.", "error")
         return redirect(url_for('listar_facturas'))
 
-    # Obtener items
-    cur.execute('''SELECT * FROM obtener_items_factura(%s);''', (id,))
-    items = cur.fetchall()
-
-    cur.close()
-    conn.close()
-
-    return render_template('ver_factura.html', factura=factura, items=items)
+    response = make_response(render_template('ver_factura.html', factura=factura, items=factura['items']))
+    return con_validadores(response, validadores)
 
 
 @app.route('/factura/editar/<int:id>', methods=['GET', 'POST'])
@@ -395,9 +743,17 @@ def editar_factura(id):
         conn = get_db_connection()
         cur = conn.cursor()
 
-        # Obtener datos básicos de la factura
-        cur.execute('SELECT id, cliente_id, total, numero FROM facturas WHERE id = %s;', (id,))
-        factura = cur.fetchone()
+        # Obtener datos básicos de la factura. Los enlaces traen su fecha
+        # (día) para leer una sola partición; si falta, se busca primero.
+        fecha = leer_fecha_factura(request.args)
+        if fecha is None:
+            ejecutar(cur, 'fecha_factura', (id,))
+            fila = cur.fetchone()
+            fecha = fila[0] if fila else None
+        factura = None
+        if fecha is not None:
+            ejecutar(cur, 'factura_edicion', (id, fecha, fecha))
+            factura = cur.fetchone()
 
         if not factura:
             flash('Factura no encontrada', 'danger')
@@ -408,17 +764,16 @@ def editar_factura(id):
             cliente_id = request.form['cliente_id']
             items = []
 
-            # Procesar los 5 posibles productos del formulario
+            # Procesar los 5 posibles productos del formulario (el precio lo
+            # pone el procedimiento: del catálogo para los productos nuevos)
             for i in range(1, 6):
                 producto_id = request.form.get(f'producto_id_{i}')
                 cantidad = request.form.get(f'cantidad_{i}')
                 
                 if producto_id and cantidad and int(cantidad) > 0:
-                    precio = request.form.get(f'precio_{i}')
                     items.append({
-                        'producto_id': producto_id,
-                        'cantidad': cantidad,
-                        'precio': precio
+                        'producto_id': int(producto_id),
+                        'cantidad': int(cantidad)
                     })
 
             try:
@@ -426,32 +781,22 @@ def editar_factura(id):
                 productos_json = json.dumps(items)
                 
                 # Ejecutar el procedimiento almacenado
-                cur.execute("CALL actualizar_factura_con_productos(%s, %s, %s)", (id, cliente_id, productos_json))
+                cur.execute("CALL actualizar_factura_con_productos(%s, %s, %s, %s)",
+                            (id, cliente_id, productos_json, fecha))
                 conn.commit()
+                cache_pdf.invalidar(id)
                 
                 flash('Factura actualizada correctamente', 'success')
-                return redirect(url_for('ver_factura', id=id))
+                return redirect(url_for('ver_factura', id=id, fecha=fecha))
 
             except Exception as e:
                 conn.rollback()
                 flash(f'Error al actualizar factura: {str(e)}', 'danger')
 
         # Obtener datos para el formulario (GET o POST con error)
-        cur.execute('''
-            SELECT fi.id, fi.producto_id, p.nombre, fi.cantidad, fi.precio, fi.subtotal
-            FROM factura_items fi
-            JOIN productos p ON fi.producto_id = p.id
-            WHERE fi.factura_id = %s
-            ORDER BY fi.id;
-        ''', (id,))
+        ejecutar(cur, 'items_edicion', (id, factura[5]))
         items = cur.fetchall()
 
-        cur.execute('SELECT id, nombre FROM clientes ORDER BY nombre;')
-        clientes = cur.fetchall()
-
-        cur.execute('SELECT id, nombre, precio FROM productos ORDER BY nombre;')
-        productos = cur.fetchall()
-
         # Preparar datos para los selects
         productos_seleccionados = {}
         cantidades_seleccionadas = {}
@@ -468,8 +813,6 @@ def editar_factura(id):
             'editar_factura.html',
             factura=factura,
             items=items,
-            clientes=clientes,
-            productos=productos,
             productos_seleccionados=productos_seleccionados,
             cantidades_seleccionadas=cantidades_seleccionadas
         )
@@ -480,32 +823,64 @@ def editar_factura(id):
     finally:
         if cur:
             cur.close()
-        if conn:
-            conn.close()
 
-@app.route('/factura/borrar/<int:id>')
+# Borrado de facturas: solo por POST (un enlace GET lo pueden seguir
+# buscadores o la precarga del navegador)
+BORRAR_MAX_FACTURAS = 500  # facturas por borrado masivo
+
+def borrar_facturas_ids(factura_ids):
+    # Borra las facturas, sus items y devuelve el stock en una transacción
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('SELECT borrar_facturas(%s::INT[]);', (factura_ids,))
+            borradas = cur.fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    for factura_id in factura_ids:
+        cache_pdf.invalidar(factura_id)
+    return borradas
+
+@app.route('/factura/borrar/<int:id>', methods=['POST'])
 def borrar_factura(id):
     if 'usuario' not in session:
         return redirect(url_for('login'))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
     try:
-        # Borrar items de la factura
-        cur.execute('CALL borrar_items_factura(%s);', (id,))
-        conn.commit()
-        # Borrar la factura
-        cur.execute('CALL borrar_factura(%s);', (id,))
-        conn.commit()
-        flash("Factura eliminada exitosamente.", "success")
+        if borrar_facturas_ids([id]):
+            flash("Factura eliminada exitosamente.", "success")
+        else:
+            flash("La factura no existe o ya fue eliminada.", "error")
     except Exception as e:
-            print(f"Error al eliminar la factura: {e}")
-            conn.rollback()
-            flash("Error al eliminar la factura.", "error")
-    finally:
-        cur.close()
-        conn.close()
+        print(f"Error al eliminar la factura: {e}")
+        flash("Error al eliminar la factura.", "error")
+
+    return redirect(url_for('listar_facturas'))
+
+@app.route('/facturas/borrar', methods=['POST'])
+def borrar_facturas_lote():
+    if 'usuario' not in session:
+        return redirect(url_for('login'))
+
+    try:
+        factura_ids = sorted({int(i) for i in request.form.getlist('ids')})
+    except ValueError:
+        flash("La selección de facturas no es válida.", "error")
+        return redirect(url_for('listar_facturas'))
+
+    if not factura_ids:
+        flash("No se seleccionó ninguna factura.", "error")
+    elif len(factura_ids) > BORRAR_MAX_FACTURAS:
+        flash(f"Se pueden eliminar como máximo {BORRAR_MAX_FACTURAS} facturas a la vez.", "error")
+    else:
+        try:
+            borradas = borrar_facturas_ids(factura_ids)
+            flash(f"Facturas eliminadas: {borradas}.", "success")
+        except Exception as e:
+            print(f"Error al eliminar facturas: {e}")
+            flash("Error al eliminar las facturas.", "error")
 
     return redirect(url_for('listar_facturas'))
 
@@ -548,6 +923,7 @@ def registrar_cliente():
         try:
             cur.execute('CALL insertar_cliente(%s, %s, %s, %s, %s);', (ruc, nombre, direccion, telefono, email))
             conn.commit()
+            get_catalogo().invalidar('clientes')
             flash("Cliente registrado exitosamente.", "success")
         except pg_errors.UniqueViolation:
             conn.rollback()
@@ -558,7 +934,6 @@ def registrar_cliente():
             flash("Error al registrar el cliente.", "error")
         finally:
             cur.close()
-            conn.close()
     
     return render_template('registrar_cliente.html')
 
@@ -602,6 +977,7 @@ def registrar_producto():
         try:
             cur.execute('CALL registrar_producto(%s, %s, %s, %s);', (nombre, descripcion, precio, stock))
             conn.commit()
+            get_catalogo().invalidar('productos')
             flash("Producto registrado exitosamente.", "success")
         except pg_errors.RaiseException as e:
             print(f"Error al registrar el producto: {e}")
@@ -616,179 +992,487 @@ def registrar_producto():
             flash("Error al registrar el producto.", "error")
         finally:
             cur.close()
-            conn.close()
 
     return render_template('registrar_producto.html')
 
+# Importación masiva de clientes y productos desde CSV
+IMPORTAR_MAX_ERRORES = int(os.environ.get("IMPORTAR_MAX_ERRORES", 1000))
+
+@app.route('/importar', methods=['GET', 'POST'])
+def importar():
+    if 'usuario' not in session:
+        return redirect(url_for('login'))
+
+    resumen = None
+    if request.method == 'POST':
+        tipo = request.form.get('tipo')
+        archivo = request.files.get('archivo')
+        if not archivo or not archivo.filename:
+            flash("Seleccione un archivo CSV.", "error")
+            return redirect(url_for('importar'))
+
+        try:
+            # El archivo subido se envía a PostgreSQL con COPY sin leerlo entero
+            resumen = importar_csv(
+                get_db_connection(), tipo, archivo.stream,
+                delimitador=request.form.get('delimitador') or ',',
+                estricto=bool(request.form.get('estricto')),
+                max_errores=IMPORTAR_MAX_ERRORES,
+            )
+        except ErrorImportacion as e:
+            flash(str(e), "error")
+            return redirect(url_for('importar'))
+        except UnicodeDecodeError:
+            flash("El archivo debe estar codificado en UTF-8.", "error")
+            return redirect(url_for('importar'))
+        except pg_errors.BadCopyFileFormat as e:
+            # p. ej. comillas sin cerrar o más columnas que la cabecera
+            flash(f"El archivo no es un CSV válido: {e.diag.message_primary} ({e.diag.context.strip()}).", "error")
+            return redirect(url_for('importar'))
+
+        if resumen['aplicado'] and (resumen['insertados'] or resumen['actualizados']):
+            get_catalogo().invalidar(tipo)
+        if not resumen['aplicado']:
+            flash("Se encontraron errores; no se importó ninguna fila.", "error")
+        elif resumen['errores_total']:
+            flash("Importación completada con errores: las filas con errores se omitieron.", "error")
+        else:
+            flash("Importación completada correctamente.", "success")
+
+    return render_template('importar.html', resumen=resumen)
+
+# Búsqueda incremental (typeahead) de clientes y productos para los formularios
+BUSQUEDA_POR_PAGINA = int(os.environ.get("BUSQUEDA_POR_PAGINA", 20))
+BUSQUEDA_POR_PAGINA_MAX = 100
+
+def leer_cursor_nombre(valor):
+    # Cursor de catálogos con formato "<nombre>_<id>"; si no es válido se ignora
+    if not valor:
+        return None
+    try:
+        nombre, id_ = valor.rsplit('_', 1)
+        return nombre, int(id_)
+    except ValueError:
+        return None
+
+def leer_busqueda_catalogo(args):
+    # (texto, límite, cursor) de una búsqueda en /api/clientes o /api/productos
+    texto = args.get('q', '').strip()
+    try:
+        limite = int(args.get('limite', BUSQUEDA_POR_PAGINA))
+    except ValueError:
+        limite = BUSQUEDA_POR_PAGINA
+    limite = max(1, min(limite, BUSQUEDA_POR_PAGINA_MAX))
+    return texto, limite, leer_cursor_nombre(args.get('despues'))
+
+def pagina_catalogo(filas, columnas, limite):
+    # Convierte hasta limite + 1 filas en la respuesta JSON de la búsqueda
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    resultados = [dict(zip(columnas, fila)) for fila in filas]
+    for resultado in resultados:
+        if 'precio' in resultado:
+            resultado['precio'] = float(resultado['precio'])
+    return {
+        'resultados': resultados,
+        'siguiente': f"{filas[-1][1]}_{filas[-1][0]}" if hay_mas else None,
+    }
+
+def buscar_en_catalogo(funcion, columnas, catalogo_en_cache):
+    # Devuelve una página de resultados y el cursor de la siguiente. La
+    # primera página sin texto sale del caché, que guarda solo esas filas.
+    texto, limite, cursor = leer_busqueda_catalogo(request.args)
+
+    if not texto and cursor is None:
+        filas = catalogo_en_cache()[:limite + 1]
+    else:
+        with get_db_connection().cursor() as cur:
+            ejecutar(cur, funcion,
+                     (texto or None, limite + 1, cursor[0] if cursor else None, cursor[1] if cursor else None))
+            filas = cur.fetchall()
+
+    return pagina_catalogo(filas, columnas, limite)
+
+@app.route('/api/clientes')
+def api_clientes():
+    if 'usuario' not in session:
+        return jsonify({'error': 'Debes iniciar sesión.'}), 401
+    return jsonify(buscar_en_catalogo('buscar_clientes', ('id', 'nombre', 'ruc'), get_catalogo().clientes))
+
+@app.route('/api/productos')
+def api_productos():
+    if 'usuario' not in session:
+        return jsonify({'error': 'Debes iniciar sesión.'}), 401
+    return jsonify(buscar_en_catalogo('buscar_productos', ('id', 'nombre', 'precio'), get_catalogo().productos))
+
 @app.route('/factura/pdf/<int:id>')
 def exportar_factura_pdf(id):
     if 'usuario' not in session:
         return redirect(url_for('login'))
 
-    conn = None
-    cur = None
+    # La conexión se devuelve al pool antes de renderizar: esperar cupo en el
+    # pool de render no debe dejar a las demás rutas sin conexiones
+    try:
+        with get_pool().conexion() as conn:
+            with conn.cursor() as cur:
+                # Obtener datos de la factura con sus ítems
+                factura = cargar_factura(cur, id, leer_fecha_factura(request.args))
+            conn.rollback()
+    except PoolAgotado:
+        raise
+    except Exception as e:
+        flash(f'Error al obtener datos de la factura: {str(e)}', 'danger')
+        return redirect(url_for('listar_facturas'))
+
+    if not factura:
+        flash('Factura no encontrada', 'danger')
+        return redirect(url_for('listar_facturas'))
+
+    # PDF (se reutiliza el ya generado si la factura no cambió)
+    version = version_factura(factura)
+    if request.if_none_match.contains(version):
+        response = make_response('', 304)
+        response.set_etag(version)
+        return response
+
+    clave = (id, version)
+    pdf = cache_pdf.obtener(clave)
+    if pdf is None:
+        pdf = get_pool_render().ejecutar(generar_pdf_factura, factura)
+        cache_pdf.guardar(clave, pdf)
+
+    response = make_response(pdf)
+    response.headers['Content-Type'] = 'application/pdf'
+    response.headers['Content-Disposition'] = f"attachment; filename=factura_{factura['numero']}.pdf"
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.set_etag(version)
+
+    return response
+
+
+# Exportación masiva de PDFs
+PDF_LOTE = 50  # facturas leídas de la base de datos por consulta
+# El PDF unido se arma en memoria (no se puede escribir hasta tener todas las
+# páginas); el ZIP se envía factura por factura y no tiene límite
+PDF_UNIDO_MAX_FACTURAS = 200
+# Cupos del pool de render que pueden ocupar, entre todas, las exportaciones
+# en curso: el resto queda para las descargas individuales
+PDF_EXPORTACION_EN_VUELO = max(1, int(os.environ.get("PDF_EXPORTACION_EN_VUELO", PDF_WORKERS // 2)))
+_cupos_exportacion = threading.BoundedSemaphore(PDF_EXPORTACION_EN_VUELO)
+
+def cargar_lote_facturas(cur, facturas):
+    # Varias facturas (id, fecha) en una consulta, con el mismo documento que
+    # cargar_factura(); con la fecha cada una se lee de su partición
+    cur.execute('''
+        SELECT obtener_factura_json(u.id, u.fecha)::TEXT FROM unnest(%s::INT[], %s::DATE[]) AS u(id, fecha);
+    ''', ([id for id, _ in facturas], [fecha for _, fecha in facturas]))
+    facturas = [decodificar_factura(fila[0]) for fila in cur.fetchall()]
+    return [factura for factura in facturas if factura is not None]
+
+def enviar_render_exportacion(factura):
+    # Espera un cupo de exportación (sin límite de tiempo: la exportación
+    # puede esperar) y lo libera cuando el PDF termina, se consuma o no
+    _cupos_exportacion.acquire()
+    try:
+        futuro = get_pool_render().enviar(generar_pdf_factura, factura, timeout=None)
+    except Exception:
+        _cupos_exportacion.release()
+        raise
+    futuro.add_done_callback(lambda _: _cupos_exportacion.release())
+    return futuro
+
+def generar_pdfs_facturas(facturas):
+    # Devuelve (nombre, pdf) en el orden de facturas, pares (id, fecha). Se
+    # mantienen como máximo PDF_EXPORTACION_EN_VUELO PDFs en vuelo para que la
+    # memoria sea constante. Los PDFs generados se guardan en el caché con la
+    # misma clave que las descargas individuales.
+    ventana = PDF_EXPORTACION_EN_VUELO
+    pendientes = deque()
+
+    def siguiente():
+        nombre, clave, futuro = pendientes.popleft()
+        pdf = futuro.result()
+        if clave is not None:
+            cache_pdf.guardar(clave, pdf)
+        return nombre, pdf
+
+    for inicio in range(0, len(facturas), PDF_LOTE):
+        with get_pool().conexion() as conn:
+            with conn.cursor() as cur:
+                lote = cargar_lote_facturas(cur, facturas[inicio:inicio + PDF_LOTE])
+            conn.rollback()
+
+        for factura in lote:
+            clave = (factura['id'], version_factura(factura))
+            pdf = cache_pdf.obtener(clave)
+            if pdf is not None:
+                futuro = Future()
+                futuro.set_result(pdf)
+                clave = None   # ya está en el caché
+            else:
+                futuro = enviar_render_exportacion(factura)
+            pendientes.append((f"factura_{factura['numero']}.pdf", clave, futuro))
+
+            while len(pendientes) >= ventana:
+                yield siguiente()
+
+    while pendientes:
+        yield siguiente()
+
+@app.route('/facturas/pdf')
+def exportar_facturas_pdf():
+    if 'usuario' not in session:
+        return redirect(url_for('login'))
+
+    formato = request.args.get('formato', 'zip')
+    if formato not in ('zip', 'pdf'):
+        flash("Formato de exportación inválido (use zip o pdf).", "danger")
+        return redirect(url_for('listar_facturas'))
+
+    try:
+        filtros, busqueda = leer_filtros_facturas(request.args)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for('listar_facturas'))
+
+    try:
+        cliente_id = request.args.get('cliente_id', '').strip()
+        cliente_id = int(cliente_id) if cliente_id else None
+        ids = [int(x) for x in request.args.get('ids', '').replace(' ', '').split(',') if x]
+    except ValueError:
+        flash("Los identificadores de factura y cliente deben ser numéricos.", "danger")
+        return redirect(url_for('listar_facturas'))
+
+    if not (filtros or cliente_id or ids):
+        flash("Indique un rango de fechas, un cliente o una lista de facturas para exportar.", "danger")
+        return redirect(url_for('listar_facturas'))
+
+    condiciones = []
+    valores = []
+    if busqueda['numero']:
+        condiciones.append("f.numero LIKE %s")
+        valores.append(busqueda['numero'] + '%')
+    if busqueda['cliente']:
+        condiciones.append("c.nombre ILIKE %s")
+        valores.append(f"%{busqueda['cliente']}%")
+    if busqueda['desde']:
+        condiciones.append("f.fecha >= %s")
+        valores.append(busqueda['desde'])
+    if busqueda['hasta']:
+        condiciones.append("f.fecha < %s::DATE + 1")
+        valores.append(busqueda['hasta'])
+    if cliente_id:
+        condiciones.append("f.cliente_id = %s")
+        valores.append(cliente_id)
+    if ids:
+        condiciones.append("f.id = ANY(%s)")
+        valores.append(ids)
 
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT f.id, f.fecha::DATE FROM facturas f JOIN clientes c ON f.cliente_id = c.id WHERE "
+                + " AND ".join(condiciones) + " ORDER BY f.fecha, f.id;",
+                tuple(valores)
+            )
+            facturas = cur.fetchall()
+    except Exception as e:
+        print(f"Error al buscar facturas para exportar: {e}")
+        flash("Error al buscar las facturas a exportar.", "danger")
+        return redirect(url_for('listar_facturas'))
+
+    if not facturas:
+        flash("No hay facturas que coincidan con el filtro.", "danger")
+        return redirect(url_for('listar_facturas'))
+    if formato == 'pdf' and len(facturas) > PDF_UNIDO_MAX_FACTURAS:
+        flash(f"El PDF unido admite como máximo {PDF_UNIDO_MAX_FACTURAS} facturas "
+              f"({len(facturas)} coinciden con el filtro); expórtelas en ZIP.", "danger")
+        return redirect(url_for('listar_facturas'))
 
-        # Obtener datos de la factura
-        cur.execute('SELECT * FROM obtener_factura_por_id(%s);', (id,))
-        factura = cur.fetchone()
+    # La respuesta se envía a medida que los PDFs están listos
+    pdfs = generar_pdfs_facturas(facturas)
+    fecha = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if formato == 'zip':
+        cuerpo = zip_en_flujo(pdfs)
+        mimetype = 'application/zip'
+        nombre = f'facturas_{fecha}.zip'
+    else:
+        cuerpo = pdf_unido_en_flujo(pdfs)
+        mimetype = 'application/pdf'
+        nombre = f'facturas_{fecha}.pdf'
 
-        if not factura:
-            flash('Factura no encontrada', 'danger')
-            return redirect(url_for('listar_facturas'))
+    response = Response(cuerpo, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={nombre}'
+    return response
 
-        # Obtener ítems
-        cur.execute('SELECT * FROM obtener_items_factura(%s);', (id,))
-        items = cur.fetchall()
 
+# Panel de ventas: lee solo los resúmenes ventas_diarias_producto/cliente,
+# que los triggers mantienen al crear, editar o borrar facturas
+DASHBOARD_DIAS = int(os.environ.get("DASHBOARD_DIAS", 30))
+
+@app.route('/dashboard')
+def dashboard():
+    if 'usuario' not in session:
+        return redirect(url_for('login'))
+
+    try:
+        hasta = request.args.get('hasta', '').strip()
+        hasta = datetime.strptime(hasta, '%Y-%m-%d').date() if hasta else datetime.now().date()
+        desde = request.args.get('desde', '').strip()
+        desde = datetime.strptime(desde, '%Y-%m-%d').date() if desde else hasta - timedelta(days=DASHBOARD_DIAS - 1)
+    except ValueError:
+        flash("Las fechas deben tener el formato AAAA-MM-DD.", "danger")
+        return redirect(url_for('dashboard'))
+    if desde > hasta:
+        flash("La fecha inicial no puede ser posterior a la fecha final.", "danger")
+        return redirect(url_for('dashboard'))
+
+    ventas = productos = clientes = []
+    try:
+        with get_db_connection().cursor() as cur:
+            cur.execute('SELECT * FROM dashboard_ventas_por_dia(%s, %s);', (desde, hasta))
+            ventas = cur.fetchall()
+            cur.execute('SELECT * FROM dashboard_top_productos(%s, %s, 10);', (desde, hasta))
+            productos = cur.fetchall()
+            cur.execute('SELECT * FROM dashboard_top_clientes(%s, %s, 10);', (desde, hasta))
+            clientes = cur.fetchall()
     except Exception as e:
-        flash(f'Error al obtener datos de la factura: {str(e)}', 'danger')
+        print(f"Error en dashboard: {e}")
+        flash("Ocurrió un error al obtener las ventas. Intente más tarde.", "danger")
+
+    resumen = {
+        'facturas': sum(v[1] for v in ventas),
+        'importe': sum(v[2] for v in ventas),
+        'maximo': max((v[2] for v in ventas), default=0),
+    }
+    return render_template('dashboard.html', desde=desde, hasta=hasta, ventas=ventas,
+                           productos=productos, clientes=clientes, resumen=resumen)
+
+
+# Exportación completa para contabilidad (CSV / NDJSON, opcionalmente gzip)
+EXPORTAR_ITERSIZE = int(os.environ.get("EXPORTAR_ITERSIZE", 2000))
+
+@app.route('/exportar')
+def exportar_datos():
+    if 'usuario' not in session:
+        return redirect(url_for('login'))
+
+    tipo = request.args.get('tipo', 'facturas')
+    formato = request.args.get('formato', 'csv')
+    usar_gzip = request.args.get('gzip') in ('1', 'true', 'si')
+    if tipo not in EXPORTACIONES or formato not in FORMATOS:
+        flash("Exportación inválida (tipo: facturas o items; formato: csv o ndjson).", "danger")
+        return redirect(url_for('listar_facturas'))
+
+    try:
+        _, busqueda = leer_filtros_facturas(request.args)
+    except ValueError as e:
+        flash(str(e), "danger")
         return redirect(url_for('listar_facturas'))
-    finally:
-        if cur: cur.close()
-        if conn: conn.close()
-
-    # PDF
-    pdf_buffer = BytesIO()
-    doc = SimpleDocTemplate(pdf_buffer, pagesize=letter)
-    elements = []
-
-    styles = getSampleStyleSheet()
-    title_style = styles['Title']
-    title_style.textColor = colors.HexColor("#2c3e50")
-
-    elements.append(Paragraph(f"<b>Factura #{factura[1]}</b>", title_style))
-
-    # Paleta personalizada
-    azul_oscuro = colors.HexColor("#2c3e50")
-    blanco = colors.white
-    gris_claro = colors.HexColor("#f4f4f4")
-
-    # Datos de factura
-    factura_info = [
-        ["Fecha:", str(factura[2])],
-        ["Cliente:", factura[5]],
-        ["Dirección:", factura[6]],
-        ["Teléfono:", factura[7]],
-        ["RUC:", factura[8]],
-        ["Email:", factura[9]],
-    ]
-
-    table_factura_info = Table(factura_info, hAlign='LEFT', colWidths=[100, 300])
-    table_factura_info.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), azul_oscuro),
-        ('TEXTCOLOR', (0, 0), (-1, 0), blanco),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BACKGROUND', (0, 1), (-1, -1), gris_claro),
-        ('GRID', (0, 0), (-1, -1), 0.5, azul_oscuro),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-    ]))
-    elements.append(table_factura_info)
-    elements.append(Paragraph("<br/><br/>", styles['Normal']))
-
-    # Ítems
-    items_data = [["Producto", "Cantidad", "Precio Unitario", "Subtotal"]]
-    for item in items:
-        items_data.append([
-            item[1],
-            item[2],
-            f"S/.{item[3]:.2f}",
-            f"S/.{item[4]:.2f}"
-        ])
-
-    table_items = Table(items_data, colWidths=[doc.width / 4.0] * 4, hAlign='LEFT')
-    table_items.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), azul_oscuro),
-        ('TEXTCOLOR', (0, 0), (-1, 0), blanco),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('ALIGN', (0, 1), (-1, -1), 'CENTER'),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.whitesmoke),
-        ('GRID', (0, 0), (-1, -1), 0.5, azul_oscuro),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-    ]))
-    elements.append(table_items)
-    elements.append(Paragraph("<br/><br/>", styles['Normal']))
-
-    # Total
-    total_data = [["", "", "Total:", f"S/.{factura[3]:.2f}"]]
-    table_total = Table(total_data, colWidths=[doc.width / 4.0] * 4, hAlign='LEFT')
-    table_total.setStyle(TableStyle([
-        ('BACKGROUND', (2, 0), (3, 0), azul_oscuro),
-        ('TEXTCOLOR', (2, 0), (3, 0), blanco),
-        ('FONTNAME', (2, 0), (3, 0), 'Helvetica-Bold'),
-        ('ALIGN', (2, 0), (3, 0), 'RIGHT'),
-        ('GRID', (2, 0), (3, 0), 0.5, azul_oscuro),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
-    ]))
-    elements.append(table_total)
-
-    doc.build(elements)
-    pdf_buffer.seek(0)
-
-    response = make_response(pdf_buffer.read())
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=factura_{factura[1]}.pdf'
 
+    cliente_id = request.args.get('cliente_id', '').strip()
+    if cliente_id and not cliente_id.isdigit():
+        flash("El identificador de cliente debe ser numérico.", "danger")
+        return redirect(url_for('listar_facturas'))
+    cliente_id = int(cliente_id) if cliente_id else None
+
+    def cuerpo():
+        # Conexión propia del generador: vive mientras se envía la respuesta
+        # y vuelve al pool aunque el cliente corte la descarga
+        with get_pool().conexion() as conn:
+            yield from exportar(conn, tipo, formato, usar_gzip, EXPORTAR_ITERSIZE,
+                                desde=busqueda['desde'], hasta=busqueda['hasta'], cliente_id=cliente_id)
+
+    nombre = f"{tipo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{formato}"
+    if usar_gzip:
+        nombre += '.gz'
+        mimetype = 'application/gzip'
+    else:
+        mimetype = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+
+    response = Response(cuerpo(), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={nombre}'
     return response
 
 
+# Paginación de la página de stock (independiente del listado de facturas)
+STOCK_POR_PAGINA = int(os.environ.get("STOCK_POR_PAGINA", 50))
+STOCK_POR_PAGINA_MAX = int(os.environ.get("STOCK_POR_PAGINA_MAX", 200))
+
 @app.route('/productos/actualizar_stock', methods=['GET', 'POST'])
 def actualizar_stock():
     if 'usuario' not in session:
         return redirect(url_for('login'))
 
-    productos = []
-    error = None
+    texto = request.values.get('q', '').strip()
 
     if request.method == 'POST':
-        try:
-            conn = get_db_connection()
-            cur = conn.cursor()
-
-            for key in request.form:
-                if key.startswith('stock_'):
-                    try:
-                        producto_id = int(key.split('_')[1])
-                        nuevo_stock = int(request.form[key])
-
-                        if nuevo_stock < 0:
-                            flash(f"El stock para el producto ID {producto_id} no puede ser negativo.", "danger")
-                            continue
-
-                        cur.execute('UPDATE productos SET stock = %s WHERE id = %s;', (nuevo_stock, producto_id))
-                    except ValueError:
-                        flash(f"Entrada inválida para el producto con clave {key}.", "danger")
-                        continue
+        # El formulario solo envía las filas modificadas
+        cambios = []
+        for key, valor in request.form.items():
+            if not key.startswith('stock_'):
+                continue
+            try:
+                producto_id = int(key.split('_')[1])
+                nuevo_stock = int(valor)
+            except ValueError:
+                flash(f"Entrada inválida para el producto con clave {key}.", "danger")
+                continue
+            if nuevo_stock < 0:
+                flash(f"El stock para el producto ID {producto_id} no puede ser negativo.", "danger")
+                continue
+            cambios.append((producto_id, nuevo_stock))
 
+        conn = get_db_connection()
+        try:
+            actualizados = 0
+            if cambios:
+                with conn.cursor() as cur:
+                    # Una sola sentencia para todos los cambios; las filas cuyo
+                    # stock ya es el enviado no se reescriben
+                    execute_values(cur, '''
+                        UPDATE productos p
+                        SET stock = v.stock
+                        FROM (VALUES %s) AS v(id, stock)
+                        WHERE p.id = v.id AND p.stock IS DISTINCT FROM v.stock;
+                    ''', cambios, template='(%s::INT, %s::INT)', page_size=len(cambios))
+                    actualizados = cur.rowcount
             conn.commit()
-            flash("Stock actualizado correctamente.", "success")
+            if actualizados:
+                flash(f"Stock actualizado correctamente ({actualizados} productos).", "success")
+            else:
+                flash("No hubo cambios en el stock.", "info")
         except Exception as e:
             conn.rollback()
             flash(f"Error al actualizar el stock: {e}", "error")
-        finally:
-            cur.close()
-            conn.close()
-        return redirect(url_for('actualizar_stock'))
+        return redirect(url_for('actualizar_stock', q=texto or None, despues=request.form.get('despues') or None))
 
+    productos = []
+    siguiente = None
+    por_pagina = obtener_por_pagina(request.args, STOCK_POR_PAGINA, STOCK_POR_PAGINA_MAX)
+    cursor = leer_cursor_nombre(request.args.get('despues'))
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT id, nombre, stock FROM productos ORDER BY nombre;')
-        productos = cur.fetchall()
+        with get_db_connection().cursor() as cur:
+            # Búsqueda por nombre y paginación por cursor sobre (nombre, id)
+            cur.execute(
+                'SELECT id, nombre, stock FROM buscar_productos(%s, %s, %s, %s);',
+                (texto or None, por_pagina + 1, cursor[0] if cursor else None, cursor[1] if cursor else None)
+            )
+            productos = cur.fetchall()
+        if len(productos) > por_pagina:
+            productos = productos[:por_pagina]
+            siguiente = f"{productos[-1][1]}_{productos[-1][0]}"
     except Exception as e:
-        error = f"Error al obtener productos: {e}"
-        flash(error, "danger")
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
-
-    return render_template('actualizar_stock.html', productos=productos)
+        flash(f"Error al obtener productos: {e}", "danger")
+
+    return render_template(
+        'actualizar_stock.html',
+        productos=productos,
+        texto=texto,
+        despues=request.args.get('despues') if cursor else None,
+        siguiente=siguiente,
+    )
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
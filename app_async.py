@@ -0,0 +1,184 @@
+"""Modo asíncrono (Quart + asyncpg) para las rutas de solo lectura más usadas.
+
+Sirve el listado de facturas, el detalle de una factura y las búsquedas de
+catálogos con las mismas plantillas, validaciones y sesión que app.py; el resto
+de las rutas sigue en la aplicación síncrona. Un proxy envía estas rutas aquí:
+
+    hypercorn app_async:app --bind 0.0.0.0:8001
+
+Mientras una petición espera a PostgreSQL no ocupa ningún hilo, así que un
+solo proceso atiende miles de clientes lentos; las conexiones a la base de
+datos siguen acotadas por el pool.
+"""
+import asyncio
+import os
+
+import asyncpg
+from quart import Quart, abort, flash, jsonify, make_response, redirect, render_template, request, session, url_for
+
+import app as app_sync
+from app import (
+    comprimir_html, con_validadores, decodificar_factura, leer_busqueda_catalogo, leer_cursor, leer_fecha_factura,
+    leer_filtros_facturas, obtener_por_pagina, pagina_catalogo, pagina_facturas, pagina_vigente,
+    validadores_pagina, versionar_estaticos,
+)
+from sentencias import SENTENCIAS
+
+app = Quart(__name__)
+# Misma clave que la aplicación síncrona: la cookie de sesión sirve en ambas
+app.secret_key = app_sync.app.secret_key
+# Mismas URLs con huella para los estáticos (los sirve la aplicación síncrona)
+app.url_defaults(versionar_estaticos)
+
+# Configuración del pool de conexiones asíncrono
+ASYNC_POOL_CONFIG = {
+    'min_size': int(os.environ.get("ASYNC_DB_POOL_MIN", 2)),
+    'max_size': int(os.environ.get("ASYNC_DB_POOL_MAX", 20)),
+    'max_inactive_connection_lifetime': float(os.environ.get("DB_POOL_INACTIVIDAD_MAXIMA", 300)),
+}
+ASYNC_DB_POOL_TIMEOUT = float(os.environ.get("ASYNC_DB_POOL_TIMEOUT", os.environ.get("DB_POOL_TIMEOUT", 10)))
+
+_pool = None
+
+@app.before_serving
+async def abrir_pool():
+    global _pool
+    _pool = await asyncpg.create_pool(
+        host=app_sync.DB_CONFIG['host'],
+        port=int(app_sync.DB_CONFIG['port']),
+        database=app_sync.DB_CONFIG['database'],
+        user=app_sync.DB_CONFIG['user'],
+        password=app_sync.DB_CONFIG['password'],
+        **ASYNC_POOL_CONFIG,
+    )
+
+@app.after_serving
+async def cerrar_pool():
+    await _pool.close()
+
+async def consultar(consulta, *args):
+    # Toma una conexión solo durante la consulta; si no hay una libre a
+    # tiempo se responde 503, igual que con PoolAgotado en la app síncrona
+    async with _pool.acquire(timeout=ASYNC_DB_POOL_TIMEOUT) as conn:
+        return await conn.fetch(consulta, *args)
+
+@app.after_request
+async def comprimir_respuesta_html(response):
+    if (response.status_code == 200 and response.mimetype == 'text/html'
+            and 'Content-Encoding' not in response.headers):
+        comprimir_html(response, await response.get_data(), request.accept_encodings)
+    return response
+
+@app.errorhandler(asyncio.TimeoutError)
+async def pool_agotado(e):
+    print(f"Pool de conexiones asíncrono agotado: {e!r}")
+    return "El servicio está ocupado, intente nuevamente en unos segundos.", 503
+
+
+@app.route('/facturas')
+async def listar_facturas():
+    if 'usuario' not in session:
+        return redirect(url_for('login'))
+
+    facturas = []
+    paginacion = None
+    error = None
+
+    try:
+        filtros, busqueda = leer_filtros_facturas(request.args)
+    except ValueError as e:
+        await flash(str(e), "danger")
+        return redirect(url_for('listar_facturas'))
+
+    validadores = None
+    try:
+        cambios, modificada = (await consultar(SENTENCIAS['version_facturas'][1]))[0]
+        validadores = validadores_pagina(session, modificada, 'facturas', cambios)
+        if pagina_vigente(request, validadores):
+            return con_validadores(await make_response('', 304), validadores)
+
+        por_pagina = obtener_por_pagina(request.args)
+        cursor_despues = leer_cursor(request.args.get('despues'))
+        cursor_antes = leer_cursor(request.args.get('antes'))
+        anteriores = cursor_antes is not None and cursor_despues is None
+        cursor = cursor_antes if anteriores else cursor_despues
+
+        # Se pide una fila extra para saber si hay más páginas
+        filas = await consultar(
+            'SELECT * FROM obtener_facturas($1, $2, $3, $4, $5, $6, $7, $8);',
+            por_pagina + 1, cursor[0] if cursor else None, cursor[1] if cursor else None, anteriores,
+            busqueda['numero'], busqueda['cliente'], busqueda['desde'], busqueda['hasta'],
+        )
+        facturas, paginacion = pagina_facturas(filas, por_pagina, anteriores, cursor)
+    except asyncio.TimeoutError:
+        raise
+    except Exception as e:
+        error = "Ocurrió un error al obtener las facturas. Intente más tarde."
+        print(f"Error en listar_facturas: {e}")
+
+    if error:
+        await flash(error, 'danger')
+        validadores = None
+
+    html = await render_template('factura.html', facturas=facturas, paginacion=paginacion, filtros=filtros)
+    return con_validadores(await make_response(html), validadores)
+
+@app.route('/factura/<int:id>')
+async def ver_factura(id):
+    if 'usuario' not in session:
+        return redirect(url_for('login'))
+
+    fecha = leer_fecha_factura(request.args)
+    version = await consultar('SELECT * FROM obtener_version_factura($1, $2);', id, fecha)
+    factura = None
+    if version:
+        validadores = validadores_pagina(session, version[0][1], 'factura', id, version[0][0], version[0][2])
+        if pagina_vigente(request, validadores):
+            return con_validadores(await make_response('', 304), validadores)
+
+        filas = await consultar('SELECT obtener_factura_json($1, $2)::TEXT;', id, fecha)
+        factura = decodificar_factura(filas[0][0])
+    if not factura:
+        await flash("La factura no existe o ha sido eliminada.", "error")
+        return redirect(url_for('listar_facturas'))
+
+    html = await render_template('ver_factura.html', factura=factura, items=factura['items'])
+    return con_validadores(await make_response(html), validadores)
+
+async def buscar_en_catalogo(funcion, columnas):
+    # Sin el caché de catálogos de la app síncrona: la primera página también
+    # se consulta (buscar_* sin texto devuelve el mismo orden)
+    texto, limite, cursor = leer_busqueda_catalogo(request.args)
+    filas = await consultar(
+        f'SELECT * FROM {funcion}($1, $2, $3, $4);',
+        texto or None, limite + 1, cursor[0] if cursor else None, cursor[1] if cursor else None,
+    )
+    return pagina_catalogo(filas, columnas, limite)
+
+@app.route('/api/clientes')
+async def api_clientes():
+    if 'usuario' not in session:
+        return jsonify({'error': 'Debes iniciar sesión.'}), 401
+    return jsonify(await buscar_en_catalogo('buscar_clientes', ('id', 'nombre', 'ruc')))
+
+@app.route('/api/productos')
+async def api_productos():
+    if 'usuario' not in session:
+        return jsonify({'error': 'Debes iniciar sesión.'}), 401
+    return jsonify(await buscar_en_catalogo('buscar_productos', ('id', 'nombre', 'precio')))
+
+
+# Las plantillas enlazan a rutas de la aplicación síncrona (url_for('login'),
+# url_for('nueva_factura'), ...). Se registran aquí con las mismas URLs para
+# poder construir esos enlaces; el proxy nunca debería enviarlas a este proceso.
+async def no_servida(**kwargs):
+    abort(404)
+
+for regla in app_sync.app.url_map.iter_rules():
+    if regla.endpoint != 'static' and regla.endpoint not in app.view_functions:
+        app.add_url_rule(regla.rule, regla.endpoint, no_servida,
+                         methods=sorted(regla.methods - {'HEAD', 'OPTIONS'}))
+
+
+if __name__ == '__main__':
+    app.run(port=8001)
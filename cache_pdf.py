@@ -0,0 +1,126 @@
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+def version_factura(factura):
+    """Versión de contenido de una factura: cambia si cambia cualquier dato
+    que aparece en el PDF, por lo que nunca se sirve un PDF obsoleto."""
+    contenido = repr(factura)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()[:32]
+
+
+class CachePdf:
+    """Caché de PDFs de facturas con clave (factura_id, versión).
+
+    - Nivel en memoria: LRU acotado por tamaño total en bytes.
+    - Nivel en disco opcional (`directorio`): sobrevive a reinicios y se
+      comparte entre los workers de la misma máquina.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, directorio=None):
+        self.max_bytes = max_bytes
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()   # (factura_id, version) -> bytes
+        self._bytes = 0
+
+        self._aciertos_memoria = 0
+        self._aciertos_disco = 0
+        self._fallos = 0
+        self._expulsadas = 0
+
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, factura_id, version):
+        return os.path.join(self.directorio, f"factura_{factura_id}_{version}.pdf")
+
+    def _guardar_memoria(self, clave, pdf):
+        # Llamar con el lock tomado
+        if len(pdf) > self.max_bytes:
+            return
+        anterior = self._entradas.pop(clave, None)
+        if anterior is not None:
+            self._bytes -= len(anterior)
+        self._entradas[clave] = pdf
+        self._bytes += len(pdf)
+        while self._bytes > self.max_bytes:
+            _, expulsado = self._entradas.popitem(last=False)
+            self._bytes -= len(expulsado)
+            self._expulsadas += 1
+
+    def obtener(self, clave):
+        with self._lock:
+            pdf = self._entradas.get(clave)
+            if pdf is not None:
+                self._entradas.move_to_end(clave)
+                self._aciertos_memoria += 1
+                return pdf
+
+        if self.directorio:
+            try:
+                with open(self._ruta(*clave), 'rb') as f:
+                    pdf = f.read()
+            except OSError:
+                pdf = None
+            if pdf is not None:
+                with self._lock:
+                    self._guardar_memoria(clave, pdf)
+                    self._aciertos_disco += 1
+                return pdf
+
+        with self._lock:
+            self._fallos += 1
+        return None
+
+    def guardar(self, clave, pdf):
+        factura_id, _ = clave
+        with self._lock:
+            # Las versiones anteriores de la misma factura ya no se usarán
+            for otra in [c for c in self._entradas if c[0] == factura_id and c != clave]:
+                self._bytes -= len(self._entradas.pop(otra))
+            self._guardar_memoria(clave, pdf)
+
+        if self.directorio:
+            self._borrar_disco(factura_id, excepto=clave)
+            ruta = self._ruta(*clave)
+            temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(temporal, 'wb') as f:
+                    f.write(pdf)
+                os.replace(temporal, ruta)  # escritura atómica
+            except OSError as e:
+                print(f"No se pudo guardar el PDF en disco: {e}")
+
+    def invalidar(self, factura_id):
+        """Elimina todas las versiones cacheadas de una factura."""
+        with self._lock:
+            for clave in [c for c in self._entradas if c[0] == factura_id]:
+                self._bytes -= len(self._entradas.pop(clave))
+        if self.directorio:
+            self._borrar_disco(factura_id)
+
+    def _borrar_disco(self, factura_id, excepto=None):
+        conservar = self._ruta(*excepto) if excepto else None
+        for ruta in glob.glob(os.path.join(self.directorio, f"factura_{factura_id}_*.pdf")):
+            if ruta != conservar:
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    pass
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'entradas': len(self._entradas),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'directorio': self.directorio,
+                'aciertos_memoria': self._aciertos_memoria,
+                'aciertos_disco': self._aciertos_disco,
+                'fallos': self._fallos,
+                'expulsadas': self._expulsadas,
+            }
@@ -0,0 +1,369 @@
+"""Generador de carga para el flujo completo de facturación.
+
+Cada usuario virtual inicia sesión y repite una mezcla de acciones (listado y
+búsqueda de facturas, nueva factura, detalle y PDF) durante el tiempo
+indicado. Al terminar imprime en JSON, por acción, las peticiones, los errores,
+el throughput y las latencias p50/p95/p99, para comparar entre versiones.
+
+Por defecto ejecuta la aplicación en el mismo proceso (cliente WSGI de Flask,
+sin red) contra la base de datos del .env; con --url mide un servidor local ya
+iniciado (gunicorn, flask run, ...):
+
+    python carga.py --usuario admin --password secreto --usuarios 8 --duracion 60
+    python carga.py --url http://127.0.0.1:5000 --usuarios 32 --salida carga.json
+
+Las facturas creadas quedan en la base de datos y descuentan stock: conviene
+usar una base de pruebas.
+"""
+import argparse
+import gzip
+import http.client
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from dotenv import load_dotenv
+
+
+# Peso de cada acción en la mezcla por defecto
+MEZCLA = {
+    'listado': 35,
+    'busqueda': 15,
+    'nueva_factura': 15,
+    'ver_factura': 25,
+    'pdf': 10,
+}
+
+ENLACE_FACTURA = re.compile(r'/factura/(\d+)\?fecha=([\d-]+)')
+UBICACION_FACTURA = re.compile(r'/factura/(\d+)$')
+
+
+def descomprimir(contenido, codificacion):
+    # Se pide gzip como un navegador; el cuerpo se lee para buscar enlaces
+    return gzip.decompress(contenido) if codificacion == 'gzip' else contenido
+
+
+class ClienteWsgi:
+    """Peticiones a la aplicación en el mismo proceso (sin red)."""
+
+    def __init__(self, app):
+        self._cliente = app.test_client()
+
+    def pedir(self, metodo, ruta, datos=None):
+        respuesta = self._cliente.open(ruta, method=metodo, data=datos, headers={'Accept-Encoding': 'gzip'})
+        contenido = descomprimir(respuesta.get_data(), respuesta.headers.get('Content-Encoding'))
+        return respuesta.status_code, respuesta.headers.get('Location', ''), contenido
+
+
+class ClienteHttp:
+    """Peticiones a un servidor local con una conexión persistente por usuario."""
+
+    def __init__(self, url):
+        partes = urlsplit(url)
+        self._host = partes.hostname
+        self._puerto = partes.port or 80
+        self._prefijo = partes.path.rstrip('/')
+        self._conexion = None
+        self._cookies = SimpleCookie()
+
+    def pedir(self, metodo, ruta, datos=None):
+        cuerpo = urlencode(datos) if datos is not None else None
+        cabeceras = {'Accept-Encoding': 'gzip'}
+        if cuerpo is not None:
+            cabeceras['Content-Type'] = 'application/x-www-form-urlencoded'
+        if self._cookies:
+            cabeceras['Cookie'] = '; '.join(f"{k}={m.value}" for k, m in self._cookies.items())
+
+        for intento in range(2):
+            if self._conexion is None:
+                self._conexion = http.client.HTTPConnection(self._host, self._puerto, timeout=60)
+            try:
+                self._conexion.request(metodo, self._prefijo + ruta, body=cuerpo, headers=cabeceras)
+                respuesta = self._conexion.getresponse()
+                contenido = respuesta.read()
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # El servidor cerró la conexión persistente: se reabre una vez
+                self._conexion.close()
+                self._conexion = None
+                if intento:
+                    raise
+
+        for cookie in respuesta.headers.get_all('Set-Cookie') or ():
+            self._cookies.load(cookie)
+        ubicacion = urlsplit(respuesta.getheader('Location', '')).path
+        return respuesta.status, ubicacion, descomprimir(contenido, respuesta.getheader('Content-Encoding'))
+
+
+class Resultados:
+    """Latencias y errores por acción, compartidos por todos los usuarios."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencias = {}   # acción -> [segundos]
+        self._errores = {}     # acción -> cantidad
+        self.registrar_desde = 0.0
+
+    def registrar(self, accion, inicio, duracion, correcta):
+        if inicio < self.registrar_desde:
+            return   # calentamiento
+        with self._lock:
+            self._latencias.setdefault(accion, []).append(duracion)
+            if not correcta:
+                self._errores[accion] = self._errores.get(accion, 0) + 1
+
+    def resumen(self, segundos):
+        with self._lock:
+            latencias = {accion: sorted(valores) for accion, valores in self._latencias.items()}
+            errores = dict(self._errores)
+
+        acciones = {}
+        for accion, valores in sorted(latencias.items()):
+            acciones[accion] = {
+                'peticiones': len(valores),
+                'errores': errores.get(accion, 0),
+                'por_segundo': round(len(valores) / segundos, 2),
+                'media_ms': round(sum(valores) * 1000 / len(valores), 2),
+                'p50_ms': percentil(valores, 50),
+                'p95_ms': percentil(valores, 95),
+                'p99_ms': percentil(valores, 99),
+                'max_ms': round(valores[-1] * 1000, 2),
+            }
+        peticiones = sum(a['peticiones'] for a in acciones.values())
+        todas = sorted(v for valores in latencias.values() for v in valores)
+        return {
+            'total': {
+                'peticiones': peticiones,
+                'errores': sum(a['errores'] for a in acciones.values()),
+                'por_segundo': round(peticiones / segundos, 2),
+                'p50_ms': percentil(todas, 50),
+                'p95_ms': percentil(todas, 95),
+                'p99_ms': percentil(todas, 99),
+            },
+            'acciones': acciones,
+        }
+
+
+def percentil(ordenados, p):
+    # Percentil por rango más cercano, en milisegundos
+    if not ordenados:
+        return None
+    indice = max(0, -(-len(ordenados) * p // 100) - 1)
+    return round(ordenados[int(indice)] * 1000, 2)
+
+
+class UsuarioVirtual(threading.Thread):
+    """Un usuario que inicia sesión y repite acciones de la mezcla hasta `fin`."""
+
+    def __init__(self, numero, cliente, args, mezcla, datos, resultados, fin):
+        super().__init__(name=f'usuario-{numero}', daemon=True)
+        self.cliente = cliente
+        self.args = args
+        self.acciones, self.pesos = zip(*mezcla.items())
+        self.datos = datos
+        self.resultados = resultados
+        self.fin = fin
+        self.azar = random.Random(args.semilla + numero)
+
+    def medir(self, accion, metodo, ruta, datos=None, esperado=200, ubicacion=None):
+        inicio = time.monotonic()
+        try:
+            estado, destino, contenido = self.cliente.pedir(metodo, ruta, datos)
+        except Exception as e:
+            print(f"{self.name} {accion}: {e!r}", file=sys.stderr)
+            self.resultados.registrar(accion, inicio, time.monotonic() - inicio, False)
+            return None, None
+        duracion = time.monotonic() - inicio
+        # Una redirección al login o de vuelta al formulario también es un error
+        correcta = estado == esperado and (ubicacion is None or ubicacion.search(destino) is not None)
+        self.resultados.registrar(accion, inicio, duracion, correcta)
+        return (destino, contenido) if correcta else (None, None)
+
+    def iniciar_sesion(self):
+        destino, _ = self.medir('login', 'POST', '/login',
+                                {'username': self.args.usuario, 'password': self.args.password},
+                                esperado=302, ubicacion=re.compile(r'/facturas$'))
+        return destino is not None
+
+    def run(self):
+        if not self.iniciar_sesion():
+            return
+        while time.monotonic() < self.fin:
+            accion = self.azar.choices(self.acciones, self.pesos)[0]
+            getattr(self, accion)()
+            if self.args.pausa:
+                time.sleep(self.azar.uniform(0, 2 * self.args.pausa))
+
+    def _guardar_facturas(self, contenido):
+        facturas = ENLACE_FACTURA.findall(contenido.decode('utf-8', 'replace'))
+        if facturas:
+            self.datos.agregar_facturas(facturas)
+
+    def listado(self):
+        _, contenido = self.medir('listado', 'GET', '/facturas')
+        if contenido:
+            self._guardar_facturas(contenido)
+
+    def busqueda(self):
+        if self.datos.clientes and self.azar.random() < 0.7:
+            filtro = {'cliente': self.azar.choice(self.datos.clientes)}
+        else:
+            hasta = datetime.now().date()
+            filtro = {'desde': hasta.replace(day=1).isoformat(), 'hasta': hasta.isoformat()}
+        _, contenido = self.medir('busqueda', 'GET', '/facturas?' + urlencode(filtro))
+        if contenido:
+            self._guardar_facturas(contenido)
+
+    def nueva_factura(self):
+        datos = {'cliente_id': self.azar.choice(self.datos.cliente_ids)}
+        productos = self.azar.sample(self.datos.producto_ids, min(len(self.datos.producto_ids), self.azar.randint(1, 3)))
+        for i, producto_id in enumerate(productos, 1):
+            datos[f'producto_id_{i}'] = producto_id
+            datos[f'cantidad_{i}'] = 1
+        self.medir('nueva_factura', 'POST', '/factura/nueva', datos, esperado=302, ubicacion=UBICACION_FACTURA)
+
+    def ver_factura(self):
+        factura = self.datos.factura(self.azar)
+        if factura is None:
+            return self.listado()
+        self.medir('ver_factura', 'GET', '/factura/%s?fecha=%s' % factura)
+
+    def pdf(self):
+        factura = self.datos.factura(self.azar)
+        if factura is None:
+            return self.listado()
+        self.medir('pdf', 'GET', '/factura/pdf/%s?fecha=%s' % factura)
+
+
+class DatosCarga:
+    """Clientes, productos y facturas conocidas, compartidos por los usuarios."""
+
+    MAX_FACTURAS = 1000
+
+    def __init__(self, cliente_ids, producto_ids, clientes):
+        self.cliente_ids = cliente_ids
+        self.producto_ids = producto_ids
+        self.clientes = clientes     # prefijos de nombres para la búsqueda
+        self._lock = threading.Lock()
+        self._facturas = []
+
+    def agregar_facturas(self, facturas):
+        with self._lock:
+            self._facturas.extend(facturas)
+            del self._facturas[:-self.MAX_FACTURAS]
+
+    def factura(self, azar):
+        with self._lock:
+            return azar.choice(self._facturas) if self._facturas else None
+
+
+def preparar_datos(cliente, args):
+    # Ids de clientes y productos desde la API de búsqueda, con una sesión aparte
+    estado, destino, _ = cliente.pedir('POST', '/login', {'username': args.usuario, 'password': args.password})
+    if estado != 302 or not destino.endswith('/facturas'):
+        raise SystemExit("No se pudo iniciar sesión: revise --usuario y --password.")
+
+    catalogos = {}
+    for nombre in ('clientes', 'productos'):
+        estado, _, contenido = cliente.pedir('GET', f'/api/{nombre}?limite=100')
+        if estado != 200:
+            raise SystemExit(f"No se pudo leer /api/{nombre} (HTTP {estado}).")
+        catalogos[nombre] = json.loads(contenido)['resultados']
+    if not catalogos['clientes'] or not catalogos['productos']:
+        raise SystemExit("Se necesita al menos un cliente y un producto registrados.")
+
+    datos = DatosCarga(
+        [c['id'] for c in catalogos['clientes']],
+        [p['id'] for p in catalogos['productos']],
+        sorted({c['nombre'].split()[0] for c in catalogos['clientes'] if c['nombre'].split()}),
+    )
+    estado, _, contenido = cliente.pedir('GET', '/facturas')
+    if estado == 200:
+        datos.agregar_facturas(ENLACE_FACTURA.findall(contenido.decode('utf-8', 'replace')))
+    return datos
+
+
+def leer_mezcla(texto):
+    # "listado=50,pdf=0" -> se cambian solo esos pesos
+    mezcla = dict(MEZCLA)
+    for parte in filter(None, (p.strip() for p in texto.split(','))):
+        accion, _, peso = parte.partition('=')
+        if accion not in MEZCLA:
+            raise argparse.ArgumentTypeError(f"Acción desconocida: {accion} (use {', '.join(MEZCLA)})")
+        try:
+            mezcla[accion] = int(peso)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Peso inválido para {accion}: {peso!r}")
+    if not any(mezcla.values()):
+        raise argparse.ArgumentTypeError("La mezcla no tiene ninguna acción con peso.")
+    return {accion: peso for accion, peso in mezcla.items() if peso > 0}
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Prueba de carga del flujo de facturación.")
+    parser.add_argument('--url', help="Servidor local a medir (por defecto, la aplicación en este proceso)")
+    parser.add_argument('--usuario', default=os.environ.get("CARGA_USUARIO"), help="Usuario para iniciar sesión")
+    parser.add_argument('--password', default=os.environ.get("CARGA_PASSWORD"), help="Contraseña del usuario")
+    parser.add_argument('--usuarios', type=int, default=4, help="Usuarios virtuales concurrentes")
+    parser.add_argument('--duracion', type=float, default=30, help="Segundos de medición")
+    parser.add_argument('--calentamiento', type=float, default=0, help="Segundos iniciales que no se miden")
+    parser.add_argument('--pausa', type=float, default=0, help="Pausa media en segundos entre acciones de un usuario")
+    parser.add_argument('--mezcla', type=leer_mezcla, default=dict(MEZCLA),
+                        help="Pesos de las acciones, p. ej. listado=50,pdf=0 (%s)"
+                             % ', '.join(f"{a}={p}" for a, p in MEZCLA.items()))
+    parser.add_argument('--semilla', type=int, default=1, help="Semilla del generador aleatorio")
+    parser.add_argument('--etiqueta', default='', help="Texto libre que se copia al resultado (versión, commit, ...)")
+    parser.add_argument('--salida', help="Archivo JSON de resultados (por defecto, la salida estándar)")
+    args = parser.parse_args(argv)
+    if not args.usuario or not args.password:
+        parser.error("Indique --usuario y --password (o CARGA_USUARIO y CARGA_PASSWORD).")
+
+    if args.url:
+        nuevo_cliente = lambda: ClienteHttp(args.url)
+    else:
+        from app import app
+        nuevo_cliente = lambda: ClienteWsgi(app)
+
+    datos = preparar_datos(nuevo_cliente(), args)
+    resultados = Resultados()
+    inicio = time.monotonic()
+    resultados.registrar_desde = inicio + args.calentamiento
+    fin = resultados.registrar_desde + args.duracion
+    usuarios = [UsuarioVirtual(i, nuevo_cliente(), args, args.mezcla, datos, resultados, fin)
+                for i in range(args.usuarios)]
+    for usuario in usuarios:
+        usuario.start()
+    for usuario in usuarios:
+        usuario.join()
+    # Incluye la última acción de cada usuario, que termina después de `fin`
+    segundos = time.monotonic() - resultados.registrar_desde
+
+    reporte = {
+        'etiqueta': args.etiqueta,
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'destino': args.url or 'wsgi',
+        'usuarios': args.usuarios,
+        'duracion_s': round(segundos, 2),
+        'mezcla': args.mezcla,
+        'semilla': args.semilla,
+        **resultados.resumen(segundos),
+    }
+    texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            f.write(texto + '\n')
+    else:
+        print(texto)
+    return 1 if reporte['total']['errores'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+import select
+import threading
+
+import psycopg2
+from psycopg2 import extensions
+
+from sentencias import ejecutar
+
+
+CANAL = 'catalogo'
+
+# Catálogo -> sentencia del registro (sentencias.py) que lo carga. Sin texto
+# ni cursor, buscar_* devuelve la primera página en el orden de la búsqueda
+# usando el índice (nombre, id): no se lee la tabla completa.
+CONSULTAS = {
+    'clientes': 'buscar_clientes',
+    'productos': 'buscar_productos',
+}
+
+
+class CacheCatalogo:
+    """Caché en proceso de la primera página de los catálogos de clientes y
+    productos (las primeras `filas` filas por nombre).
+
+    Un hilo escucha el canal `catalogo` de PostgreSQL (LISTEN/NOTIFY); los
+    triggers de las tablas envían el nombre de la tabla modificada, así que
+    todos los workers y nodos invalidan su copia cuando el catálogo cambia.
+    Mientras el hilo no está conectado no se puede saber si hubo cambios,
+    por lo que el caché no se usa y cada lectura va a la base de datos.
+    """
+
+    def __init__(self, dsn_config, obtener_conexion, filas, reintento=5.0):
+        self.dsn_config = dsn_config
+        self.obtener_conexion = obtener_conexion   # p. ej. la conexión de la petición
+        self.filas = filas
+        self.reintento = reintento
+
+        self._lock = threading.Lock()
+        self._datos = {}             # nombre -> filas
+        self._generacion = {nombre: 0 for nombre in CONSULTAS}
+        self._escuchando = threading.Event()
+        self._detener = threading.Event()
+
+        self._aciertos = 0
+        self._cargas = 0
+        self._invalidaciones = 0
+        self._notificaciones = 0
+
+        self._hilo = threading.Thread(target=self._escuchar, name='catalogo-listener', daemon=True)
+        self._hilo.start()
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+    def clientes(self):
+        return self._obtener('clientes')
+
+    def productos(self):
+        return self._obtener('productos')
+
+    def _obtener(self, nombre):
+        with self._lock:
+            filas = self._datos.get(nombre)
+            generacion = self._generacion[nombre]
+            if filas is not None and self._escuchando.is_set():
+                self._aciertos += 1
+                return filas
+
+        with self.obtener_conexion().cursor() as cur:
+            ejecutar(cur, CONSULTAS[nombre], (None, self.filas, None, None))
+            filas = cur.fetchall()
+
+        with self._lock:
+            self._cargas += 1
+            # Si llegó una invalidación durante la carga, no se guarda
+            if self._escuchando.is_set() and self._generacion[nombre] == generacion:
+                self._datos[nombre] = filas
+        return filas
+
+    # ------------------------------------------------------------------
+    # Invalidación
+    # ------------------------------------------------------------------
+    def invalidar(self, nombre=None, notificada=False):
+        """Descarta un catálogo (o todos si `nombre` es None).
+
+        `notificada` indica que la invalidación llegó por NOTIFY; se cuenta
+        bajo el mismo lock para que las estadísticas sean coherentes.
+        """
+        with self._lock:
+            if notificada:
+                self._notificaciones += 1
+            for clave in ([nombre] if nombre else list(CONSULTAS)):
+                if clave in self._generacion:
+                    self._generacion[clave] += 1
+                    self._datos.pop(clave, None)
+            self._invalidaciones += 1
+
+    def _escuchar(self):
+        while not self._detener.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.dsn_config)
+                conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN {CANAL};')
+                # Pudo haber cambios mientras no se escuchaba
+                self.invalidar()
+                self._escuchando.set()
+
+                while not self._detener.is_set():
+                    if select.select([conn], [], [], 5.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notificacion = conn.notifies.pop(0)
+                        self.invalidar(notificacion.payload or None, notificada=True)
+            except (psycopg2.Error, OSError) as e:
+                print(f"Catálogo: escucha de notificaciones interrumpida: {e}")
+            finally:
+                self._escuchando.clear()
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except psycopg2.Error:
+                        pass
+            self._detener.wait(self.reintento)
+
+    def detener(self):
+        self._detener.set()
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'escuchando': self._escuchando.is_set(),
+                'en_cache': sorted(self._datos),
+                'filas': self.filas,
+                'aciertos': self._aciertos,
+                'cargas': self._cargas,
+                'invalidaciones': self._invalidaciones,
+                'notificaciones': self._notificaciones,
+            }
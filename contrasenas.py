@@ -0,0 +1,99 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+
+class VerificacionOcupada(Exception):
+    """Hay demasiados hashes de contraseñas pendientes; se rechaza el nuevo."""
+
+
+class PoolContrasenas:
+    """Ejecutor acotado para generar y verificar hashes de contraseñas.
+
+    Los hashes de werkzeug (scrypt/pbkdf2) son costosos a propósito y
+    liberan el GIL, así que se calculan en unos pocos hilos dedicados. Como
+    máximo hay `hilos + max_cola` trabajos en vuelo; si no hay cupo en
+    `timeout` segundos se lanza VerificacionOcupada, de modo que una ráfaga
+    de logins no deja sin CPU al resto de las peticiones.
+    """
+
+    def __init__(self, hilos=2, max_cola=8, timeout=2.0, metodo='scrypt'):
+        self.hilos = hilos
+        self.max_cola = max_cola
+        self.timeout = timeout
+        self.metodo = metodo
+        self._executor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='contrasenas')
+        self._cupos = threading.BoundedSemaphore(hilos + max_cola)
+        self._lock = threading.Lock()
+        self._prefijo = None
+
+        self._en_vuelo = 0
+        self._completados = 0
+        self._rechazados = 0
+        self._rehashes = 0
+        self._tiempo_total = 0.0
+        self._tiempo_max = 0.0
+
+    def _ejecutar(self, funcion, *args):
+        if not self._cupos.acquire(timeout=self.timeout):
+            with self._lock:
+                self._rechazados += 1
+            raise VerificacionOcupada(
+                "Hay %s hashes de contraseñas en curso o en cola" % (self.hilos + self.max_cola)
+            )
+
+        inicio = time.monotonic()
+        with self._lock:
+            self._en_vuelo += 1
+        try:
+            return self._executor.submit(funcion, *args).result()
+        finally:
+            duracion = time.monotonic() - inicio
+            with self._lock:
+                self._en_vuelo -= 1
+                self._completados += 1
+                self._tiempo_total += duracion
+                self._tiempo_max = max(self._tiempo_max, duracion)
+            self._cupos.release()
+
+    def generar(self, password):
+        """Hash de `password` con el método y costo configurados."""
+        return self._ejecutar(generate_password_hash, password, self.metodo)
+
+    def verificar(self, hash_guardado, password):
+        """Devuelve (válida, necesita_rehash)."""
+        valida = self._ejecutar(check_password_hash, hash_guardado, password)
+        return valida, valida and self.necesita_rehash(hash_guardado)
+
+    def necesita_rehash(self, hash_guardado):
+        # El prefijo ("scrypt:32768:8:1", "pbkdf2:sha256:600000") identifica
+        # método y costo; se compara con el de un hash generado con la
+        # configuración actual, que incluye los parámetros por defecto.
+        if self._prefijo is None:
+            self._prefijo = generate_password_hash('', self.metodo).split('$', 1)[0]
+        return hash_guardado.split('$', 1)[0] != self._prefijo
+
+    def registrar_rehash(self):
+        with self._lock:
+            self._rehashes += 1
+
+    def cerrar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'hilos': self.hilos,
+                'max_cola': self.max_cola,
+                'metodo': self.metodo,
+                'en_vuelo': self._en_vuelo,
+                'en_cola': max(0, self._en_vuelo - self.hilos),
+                'completados': self._completados,
+                'rechazados': self._rechazados,
+                'rehashes': self._rehashes,
+                'tiempo_promedio_ms': round(self._tiempo_total * 1000 / self._completados, 3)
+                if self._completados else 0.0,
+                'tiempo_max_ms': round(self._tiempo_max * 1000, 3),
+            }
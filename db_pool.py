@@ -0,0 +1,240 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolAgotado(Exception):
+    """No se pudo obtener una conexión del pool dentro del tiempo de espera."""
+
+
+class PoolConexiones:
+    """Pool de conexiones PostgreSQL con tamaño mínimo/máximo.
+
+    - Las conexiones se validan al entregarse (health check) si estuvieron
+      libres más de `verificar_tras` segundos.
+    - Se reciclan las conexiones que superan su tiempo de vida o que
+      estuvieron inactivas demasiado tiempo.
+    - Lleva estadísticas: conexiones en uso, peticiones esperando y tiempo
+      de espera acumulado.
+    """
+
+    def __init__(self, dsn_config, minimo=1, maximo=10, timeout=10.0,
+                 vida_maxima=1800.0, inactividad_maxima=300.0,
+                 verificar_tras=5.0, connection_factory=None):
+        if minimo < 0 or maximo < 1 or minimo > maximo:
+            raise ValueError("Tamaños de pool inválidos: min=%s max=%s" % (minimo, maximo))
+
+        self.dsn_config = dsn_config
+        self.minimo = minimo
+        self.maximo = maximo
+        self.timeout = timeout
+        self.vida_maxima = vida_maxima
+        self.inactividad_maxima = inactividad_maxima
+        self.verificar_tras = verificar_tras
+        self.connection_factory = connection_factory
+
+        self._cond = threading.Condition()
+        self._libres = []        # [(conn, creada_en, devuelta_en)]
+        self._en_uso = {}        # id(conn) -> creada_en
+        self._creando = 0        # cupos reservados mientras se conecta
+        self._esperando = 0
+        self._cerrado = False
+
+        # Estadísticas
+        self._entregas = 0
+        self._esperas = 0
+        self._tiempo_espera_total = 0.0
+        self._tiempo_espera_max = 0.0
+        self._creadas = 0
+        self._recicladas = 0
+        self._descartadas = 0
+        self._agotado = 0
+
+        for _ in range(minimo):
+            self._libres.append(self._crear())
+            self._creadas += 1
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida de las conexiones
+    # ------------------------------------------------------------------
+    def _crear(self):
+        kwargs = dict(self.dsn_config)
+        if self.connection_factory is not None:
+            kwargs['connection_factory'] = self.connection_factory
+        conn = psycopg2.connect(**kwargs)
+        ahora = time.monotonic()
+        return (conn, ahora, ahora)
+
+    def _total(self):
+        return len(self._libres) + len(self._en_uso) + self._creando
+
+    def _vencida(self, creada_en, devuelta_en, ahora):
+        if self.vida_maxima and ahora - creada_en > self.vida_maxima:
+            return True
+        if self.inactividad_maxima and ahora - devuelta_en > self.inactividad_maxima:
+            return True
+        return False
+
+    @staticmethod
+    def _sana(conn):
+        if conn.closed:
+            return False
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1;')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _cerrar(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+    def obtener(self):
+        """Entrega una conexión sana; espera hasta `timeout` si el pool está lleno."""
+        inicio = time.monotonic()
+        limite = inicio + self.timeout
+        espero = False
+
+        with self._cond:
+            while True:
+                if self._cerrado:
+                    raise PoolAgotado("El pool de conexiones está cerrado")
+
+                if self._libres:
+                    conn, creada_en, devuelta_en = self._libres.pop()
+                    break
+
+                if self._total() < self.maximo:
+                    # Reservar el cupo antes de conectar fuera del lock
+                    self._creando += 1
+                    conn = None
+                    break
+
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._agotado += 1
+                    raise PoolAgotado(
+                        "No hay conexiones disponibles (máximo %s) tras %.1fs" % (self.maximo, self.timeout)
+                    )
+                if not espero:
+                    espero = True
+                    self._esperas += 1
+                self._esperando += 1
+                try:
+                    self._cond.wait(restante)
+                finally:
+                    self._esperando -= 1
+
+        # La validación y la conexión se hacen fuera del lock
+        reservado = conn is None
+        creada = reciclada = descartada = False
+        try:
+            if conn is None:
+                conn, creada_en, _ = self._crear()
+                creada = True
+            elif self._vencida(creada_en, devuelta_en, time.monotonic()):
+                self._cerrar(conn)
+                reciclada = True
+                conn, creada_en, _ = self._crear()
+                creada = True
+            elif (time.monotonic() - devuelta_en > self.verificar_tras
+                  or conn.closed) and not self._sana(conn):
+                self._cerrar(conn)
+                descartada = True
+                conn, creada_en, _ = self._crear()
+                creada = True
+        except Exception:
+            with self._cond:
+                if reservado:
+                    self._creando -= 1
+                self._cond.notify()
+            raise
+
+        esperado = time.monotonic() - inicio
+        with self._cond:
+            if reservado:
+                self._creando -= 1
+            self._en_uso[id(conn)] = creada_en
+            self._entregas += 1
+            self._creadas += creada
+            self._recicladas += reciclada
+            self._descartadas += descartada
+            if espero:
+                self._tiempo_espera_total += esperado
+                self._tiempo_espera_max = max(self._tiempo_espera_max, esperado)
+        return conn
+
+    def devolver(self, conn, descartar=False):
+        """Devuelve la conexión al pool, deshaciendo cualquier transacción abierta."""
+        if not descartar and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                descartar = True
+
+        with self._cond:
+            creada_en = self._en_uso.pop(id(conn), None)
+            if descartar or conn.closed or self._cerrado or creada_en is None:
+                self._cerrar(conn)
+                self._descartadas += 1
+            else:
+                self._libres.append((conn, creada_en, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def conexion(self):
+        """Conexión prestada para código fuera de una petición (CLI, hilos)."""
+        conn = self.obtener()
+        descartar = False
+        try:
+            yield conn
+        except Exception:
+            descartar = conn.closed
+            raise
+        finally:
+            # También si se cierra un generador a medio consumir (GeneratorExit)
+            self.devolver(conn, descartar=descartar)
+
+    def cerrar(self):
+        with self._cond:
+            self._cerrado = True
+            for conn, _, _ in self._libres:
+                self._cerrar(conn)
+            self._libres = []
+            self._cond.notify_all()
+
+    def estadisticas(self):
+        with self._cond:
+            return {
+                'minimo': self.minimo,
+                'maximo': self.maximo,
+                'total': self._total(),
+                'en_uso': len(self._en_uso),
+                'libres': len(self._libres),
+                'esperando': self._esperando,
+                'entregas': self._entregas,
+                'esperas': self._esperas,
+                'tiempo_espera_total_ms': round(self._tiempo_espera_total * 1000, 3),
+                'tiempo_espera_max_ms': round(self._tiempo_espera_max * 1000, 3),
+                'tiempo_espera_promedio_ms': round(
+                    self._tiempo_espera_total * 1000 / self._esperas, 3
+                ) if self._esperas else 0.0,
+                'creadas': self._creadas,
+                'recicladas': self._recicladas,
+                'descartadas': self._descartadas,
+                'agotado': self._agotado,
+            }
@@ -0,0 +1,104 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:
+    # Sin brotli se sirven solo las variantes gzip
+    brotli = None
+
+
+# Los nombres con huella cambian con el contenido: se pueden guardar un año
+CACHE_INMUTABLE = 'public, max-age=31536000, immutable'
+
+EXTENSIONES_COMPRIMIBLES = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+
+
+def codificaciones():
+    """Codificaciones disponibles, en orden de preferencia."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def comprimir(datos, codificacion, rapido=False):
+    # Los estáticos se comprimen una sola vez con el nivel máximo; el HTML
+    # dinámico se comprime en cada respuesta con un nivel rápido
+    if codificacion == 'br':
+        return brotli.compress(datos, quality=4 if rapido else 11)
+    return gzip.compress(datos, compresslevel=6 if rapido else 9, mtime=0)
+
+
+class Estaticos:
+    """Archivos estáticos con huella de contenido en el nombre.
+
+    Al crearse lee `directorio` y publica cada archivo como
+    nombre.<huella>.ext (style.css -> style.3f2a9c1b7e4d.css), junto con sus
+    variantes gzip y brotli ya comprimidas. No hace falta ningún paso de
+    build: un despliegue que cambie un archivo cambia su URL.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        self._manifiesto = {}   # nombre -> nombre con huella
+        self._archivos = {}     # nombre con huella -> (tipo, {codificación: bytes})
+        self._servidos = {'identity': 0, 'gzip': 0, 'br': 0}
+        self._cargar()
+
+    def _cargar(self):
+        for raiz, _, nombres in os.walk(self.directorio):
+            for nombre in sorted(nombres):
+                ruta = os.path.join(raiz, nombre)
+                relativo = os.path.relpath(ruta, self.directorio).replace(os.sep, '/')
+                with open(ruta, 'rb') as f:
+                    datos = f.read()
+
+                base, extension = os.path.splitext(relativo)
+                versionado = f"{base}.{hashlib.sha256(datos).hexdigest()[:12]}{extension}"
+                variantes = {'identity': datos}
+                if extension.lower() in EXTENSIONES_COMPRIMIBLES:
+                    for codificacion in codificaciones():
+                        comprimido = comprimir(datos, codificacion)
+                        if len(comprimido) < len(datos):
+                            variantes[codificacion] = comprimido
+
+                tipo = mimetypes.guess_type(relativo)[0] or 'application/octet-stream'
+                self._manifiesto[relativo] = versionado
+                self._archivos[versionado] = (tipo, variantes)
+
+    def url(self, nombre):
+        """Nombre con huella de `nombre`; el mismo si no es un archivo conocido."""
+        return self._manifiesto.get(nombre, nombre)
+
+    def huella(self):
+        """Cambia si cambia cualquier archivo estático."""
+        return hashlib.sha256(repr(sorted(self._manifiesto.values())).encode('utf-8')).hexdigest()[:16]
+
+    def obtener(self, versionado, aceptadas):
+        """(tipo, codificación, bytes) del archivo con huella `versionado`,
+        en la mejor codificación que acepta el cliente; None si no existe.
+
+        `aceptadas` es el Accept-Encoding ya interpretado (request.accept_encodings).
+        """
+        archivo = self._archivos.get(versionado)
+        if archivo is None:
+            return None
+        tipo, variantes = archivo
+        codificacion = aceptadas.best_match([c for c in codificaciones() if c in variantes]) or 'identity'
+        with self._lock:
+            self._servidos[codificacion] += 1
+        return tipo, codificacion, variantes[codificacion]
+
+    def estadisticas(self):
+        with self._lock:
+            servidos = dict(self._servidos)
+        return {
+            'archivos': len(self._archivos),
+            'bytes': {
+                codificacion: sum(len(v[codificacion]) for _, v in self._archivos.values() if codificacion in v)
+                for codificacion in ('identity',) + codificaciones()
+            },
+            'servidos': servidos,
+        }
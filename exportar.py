@@ -0,0 +1,177 @@
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+
+import psycopg2
+from dotenv import load_dotenv
+
+
+# Consultas de exportación: columnas del archivo y SELECT sin filtros.
+# Los filtros (fechas y cliente) se agregan como condiciones sobre `f`.
+EXPORTACIONES = {
+    'facturas': (
+        ('id', 'numero', 'fecha', 'cliente_id', 'cliente_ruc', 'cliente_nombre', 'total'),
+        """SELECT f.id, f.numero, f.fecha, f.cliente_id, c.ruc, c.nombre, f.total
+           FROM facturas f
+           JOIN clientes c ON c.id = f.cliente_id""",
+        "f.fecha, f.id",
+    ),
+    'items': (
+        ('factura_id', 'factura_numero', 'fecha', 'item_id', 'producto_id', 'producto_nombre',
+         'cantidad', 'precio', 'subtotal'),
+        """SELECT fi.factura_id, f.numero, f.fecha, fi.id, fi.producto_id, p.nombre,
+                  fi.cantidad, fi.precio, fi.subtotal
+           FROM factura_items fi
+           JOIN facturas f ON f.id = fi.factura_id AND f.fecha = fi.fecha
+           JOIN productos p ON p.id = fi.producto_id""",
+        "f.fecha, f.id, fi.id",
+    ),
+}
+FORMATOS = ('csv', 'ndjson')
+
+TAMANO_BLOQUE = 64 * 1024   # bytes acumulados antes de entregar un trozo
+
+
+def consulta_exportacion(tipo, desde=None, hasta=None, cliente_id=None):
+    """(consulta, valores) de la exportación con sus filtros. `hasta` es inclusivo."""
+    _, consulta, orden = EXPORTACIONES[tipo]
+    condiciones = []
+    valores = []
+    if desde:
+        condiciones.append("f.fecha >= %s")
+        valores.append(desde)
+    if hasta:
+        condiciones.append("f.fecha < %s::DATE + 1")
+        valores.append(hasta)
+    if cliente_id:
+        condiciones.append("f.cliente_id = %s")
+        valores.append(cliente_id)
+    if condiciones:
+        consulta += " WHERE " + " AND ".join(condiciones)
+    consulta += " ORDER BY " + orden
+    return consulta, tuple(valores)
+
+
+def filas_exportacion(conn, tipo, desde=None, hasta=None, cliente_id=None, itersize=2000):
+    """Recorre la exportación con un cursor del lado del servidor.
+
+    Solo hay `itersize` filas en memoria a la vez, sea cual sea el tamaño
+    del resultado.
+    """
+    consulta, valores = consulta_exportacion(tipo, desde, hasta, cliente_id)
+    try:
+        # Un cursor con nombre es un DECLARE ... CURSOR: las filas se piden
+        # al servidor de `itersize` en `itersize`
+        with conn.cursor(name=f'exportar_{tipo}') as cur:
+            cur.itersize = itersize
+            cur.execute(consulta, valores)
+            yield from cur
+    finally:
+        conn.rollback()
+
+
+def _valor_json(valor):
+    # Los importes se escriben como texto para no perder precisión
+    if isinstance(valor, Decimal):
+        return str(valor)
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+def en_csv(columnas, filas):
+    """Convierte las filas en trozos de CSV (bytes UTF-8) con cabecera."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator='\n')
+    escritor.writerow(columnas)
+    for fila in filas:
+        escritor.writerow(fila)
+        if buffer.tell() >= TAMANO_BLOQUE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def en_ndjson(columnas, filas):
+    """Convierte las filas en trozos de NDJSON (un objeto por línea)."""
+    partes = []
+    tamano = 0
+    for fila in filas:
+        linea = json.dumps(dict(zip(columnas, fila)), default=_valor_json, ensure_ascii=False) + '\n'
+        partes.append(linea)
+        tamano += len(linea)
+        if tamano >= TAMANO_BLOQUE:
+            yield ''.join(partes).encode('utf-8')
+            partes = []
+            tamano = 0
+    if partes:
+        yield ''.join(partes).encode('utf-8')
+
+
+def comprimir_gzip(trozos, nivel=6):
+    """Comprime al vuelo en formato gzip."""
+    compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)   # 31: cabecera gzip
+    for trozo in trozos:
+        comprimido = compresor.compress(trozo)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+
+def exportar(conn, tipo, formato='csv', gzip=False, itersize=2000, **filtros):
+    """Devuelve un generador de bytes con la exportación completa."""
+    if tipo not in EXPORTACIONES:
+        raise ValueError(f"Tipo de exportación desconocido: {tipo}")
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de exportación desconocido: {formato}")
+
+    columnas = EXPORTACIONES[tipo][0]
+    filas = filas_exportacion(conn, tipo, itersize=itersize, **filtros)
+    trozos = en_csv(columnas, filas) if formato == 'csv' else en_ndjson(columnas, filas)
+    return comprimir_gzip(trozos) if gzip else trozos
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Exporta facturas o ítems de factura en CSV o NDJSON.")
+    parser.add_argument('tipo', choices=sorted(EXPORTACIONES))
+    parser.add_argument('--formato', choices=FORMATOS, default='csv')
+    parser.add_argument('--gzip', action='store_true', help="Comprime la salida con gzip")
+    parser.add_argument('--desde', type=date.fromisoformat, help="Fecha inicial (AAAA-MM-DD)")
+    parser.add_argument('--hasta', type=date.fromisoformat, help="Fecha final inclusive (AAAA-MM-DD)")
+    parser.add_argument('--cliente', type=int, dest='cliente_id', help="ID del cliente")
+    parser.add_argument('--itersize', type=int, default=2000, help="Filas pedidas al servidor por vez")
+    parser.add_argument('-o', '--salida', help="Archivo de salida (por defecto, la salida estándar)")
+    args = parser.parse_args(argv)
+
+    db_config = {
+        'host': os.environ["DB_HOST"],
+        'port': os.environ["DB_PORT"],
+        'database': os.environ["DB_NAME"],
+        'user': os.environ["DB_USER"],
+        'password': os.environ["DB_PASSWORD"]
+    }
+
+    conn = psycopg2.connect(**db_config)
+    salida = open(args.salida, 'wb') if args.salida else sys.stdout.buffer
+    try:
+        for trozo in exportar(conn, args.tipo, args.formato, args.gzip, args.itersize,
+                              desde=args.desde, hasta=args.hasta, cliente_id=args.cliente_id):
+            salida.write(trozo)
+    finally:
+        if args.salida:
+            salida.close()
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
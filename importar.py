@@ -0,0 +1,324 @@
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+
+class ErrorImportacion(Exception):
+    """El archivo no se puede importar (tipo desconocido, cabecera inválida, etc.)."""
+
+
+# Columnas que acepta cada importación; las obligatorias deben venir en la cabecera
+COLUMNAS = {
+    'clientes': ('ruc', 'nombre', 'direccion', 'telefono', 'email'),
+    'productos': ('nombre', 'descripcion', 'precio', 'stock'),
+}
+OBLIGATORIAS = {
+    'clientes': ('ruc', 'nombre'),
+    'productos': ('nombre', 'precio', 'stock'),
+}
+
+# Reglas de validación: cada una es un SELECT (fila, mensaje) sobre la tabla
+# staging, así se valida el archivo completo con unas pocas sentencias.
+VALIDACIONES = {
+    'clientes': (
+        """SELECT fila, 'El RUC debe tener exactamente 11 dígitos'
+           FROM staging WHERE COALESCE(TRIM(ruc), '') !~ '^[0-9]{11}$'""",
+        """SELECT fila, 'El nombre es obligatorio'
+           FROM staging WHERE COALESCE(TRIM(nombre), '') = ''""",
+        """SELECT fila, 'El nombre no puede superar 100 caracteres'
+           FROM staging WHERE LENGTH(TRIM(nombre)) > 100""",
+        """SELECT fila, 'El teléfono no puede superar 20 caracteres'
+           FROM staging WHERE LENGTH(TRIM(telefono)) > 20""",
+        """SELECT fila, 'El email no puede superar 100 caracteres'
+           FROM staging WHERE LENGTH(TRIM(email)) > 100""",
+        """SELECT fila, 'RUC repetido en el archivo (primera aparición en la línea ' || primera || ')'
+           FROM (SELECT fila, MIN(fila) OVER (PARTITION BY TRIM(ruc)) AS primera FROM staging) s
+           WHERE fila > primera""",
+    ),
+    'productos': (
+        """SELECT fila, 'El nombre del producto no puede estar vacío'
+           FROM staging WHERE COALESCE(TRIM(nombre), '') = ''""",
+        """SELECT fila, 'El nombre no puede superar 100 caracteres'
+           FROM staging WHERE LENGTH(TRIM(nombre)) > 100""",
+        """SELECT fila, 'El precio debe ser un número mayor que cero (máximo 2 decimales)'
+           FROM staging
+           WHERE CASE WHEN TRIM(precio) ~ '^[0-9]{1,8}(\\.[0-9]{1,2})?$'
+                      THEN TRIM(precio)::NUMERIC <= 0
+                      ELSE TRUE END""",
+        """SELECT fila, 'El stock debe ser un entero no negativo'
+           FROM staging WHERE COALESCE(TRIM(stock), '') !~ '^[0-9]{1,9}$'""",
+        """SELECT fila, 'Producto repetido en el archivo (primera aparición en la línea ' || primera || ')'
+           FROM (SELECT fila, MIN(fila) OVER (PARTITION BY LOWER(TRIM(nombre))) AS primera FROM staging) s
+           WHERE fila > primera""",
+    ),
+}
+
+# Upsert de las filas válidas: expresión con que se guarda cada columna del
+# staging, columna que identifica la fila (no se actualiza) y destino del
+# ON CONFLICT.
+EXPRESIONES = {
+    'clientes': {
+        'ruc': "TRIM(ruc)",
+        'nombre': "UPPER(TRIM(nombre))",
+        'direccion': "NULLIF(UPPER(TRIM(direccion)), '')",
+        'telefono': "NULLIF(TRIM(telefono), '')",
+        'email': "NULLIF(LOWER(TRIM(email)), '')",
+    },
+    'productos': {
+        'nombre': "TRIM(nombre)",
+        'descripcion': "NULLIF(TRIM(descripcion), '')",
+        'precio': "TRIM(precio)::NUMERIC(10, 2)",
+        'stock': "TRIM(stock)::INT",
+    },
+}
+CLAVES = {'clientes': 'ruc', 'productos': 'nombre'}
+CONFLICTOS = {'clientes': '(ruc)', 'productos': '((LOWER(TRIM(nombre))))'}
+
+
+def _upsert(tipo, cabecera):
+    """INSERT ... ON CONFLICT con las columnas de la cabecera.
+
+    Las columnas que el archivo no trae no se tocan: un CSV sin `email` no
+    borra los emails guardados. Solo se reescriben las filas que cambian;
+    RETURNING (xmax = 0) distingue inserciones de actualizaciones.
+    """
+    columnas = [c for c in COLUMNAS[tipo] if c in cabecera]
+    actualizadas = [c for c in columnas if c != CLAVES[tipo]]
+    return """
+        INSERT INTO {tabla} ({columnas})
+        SELECT {expresiones}
+        FROM staging
+        WHERE fila NOT IN (SELECT fila FROM staging_errores)
+        ON CONFLICT {conflicto} DO UPDATE
+        SET {asignaciones}
+        WHERE ({actuales}) IS DISTINCT FROM ({nuevos})
+        RETURNING (xmax = 0)
+    """.format(
+        tabla=tipo,
+        columnas=', '.join(columnas),
+        expresiones=', '.join(EXPRESIONES[tipo][c] for c in columnas),
+        conflicto=CONFLICTOS[tipo],
+        asignaciones=', '.join('%s = EXCLUDED.%s' % (c, c) for c in actualizadas),
+        actuales=', '.join('%s.%s' % (tipo, c) for c in actualizadas),
+        nuevos=', '.join('EXCLUDED.%s' % c for c in actualizadas),
+    )
+
+
+class _FlujoCopia:
+    """Fuente de COPY con las filas del CSV, ya separadas por csv.reader.
+
+    Cada fila se reescribe en CSV con su número de línea como primera
+    columna: un campo entre comillas puede ocupar varias líneas, así que la
+    línea no se puede deducir del orden de las filas. Las filas con otra
+    cantidad de columnas que la cabecera se anotan en `errores` y no se copian.
+    """
+
+    TROZO = 64 * 1024   # caracteres que se acumulan antes de entregarlos a COPY
+
+    def __init__(self, lector, columnas, errores):
+        self._lector = lector
+        self._columnas = columnas
+        self._errores = errores
+        self._filas = self._generar()
+        self._pendiente = ''
+
+    def _generar(self):
+        salida = io.StringIO()
+        # Con \r\n como fin de línea, csv.writer entrecomilla los campos con \r o \n
+        escritor = csv.writer(salida, lineterminator='\r\n')
+        anterior = self._lector.line_num
+        while True:
+            try:
+                fila = next(self._lector)
+            except StopIteration:
+                break
+            except csv.Error as e:
+                raise ErrorImportacion("CSV inválido en la línea %s: %s" % (self._lector.line_num, e))
+            # line_num es la última línea leída: la fila empieza después de la anterior
+            linea, anterior = anterior + 1, self._lector.line_num
+            if not fila:
+                continue   # línea en blanco
+            if len(fila) != self._columnas:
+                self._errores.append((linea, 'La fila tiene %s columnas y la cabecera %s'
+                                      % (len(fila), self._columnas)))
+                continue
+            escritor.writerow([linea] + fila)
+            if salida.tell() >= self.TROZO:
+                yield salida.getvalue()
+                salida.seek(0)
+                salida.truncate()
+        if salida.tell():
+            yield salida.getvalue()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pendiente) < size:
+            trozo = next(self._filas, None)
+            if trozo is None:
+                break
+            self._pendiente += trozo
+        if size < 0:
+            size = len(self._pendiente)
+        datos, self._pendiente = self._pendiente[:size], self._pendiente[size:]
+        return datos
+
+
+def _leer_cabecera(lector, tipo):
+    try:
+        cabecera = next(lector, None)
+    except csv.Error as e:
+        raise ErrorImportacion("Cabecera inválida: %s" % e)
+    if cabecera is None:
+        raise ErrorImportacion("El archivo está vacío.")
+    cabecera = [c.strip().lower() for c in cabecera]
+
+    desconocidas = [c for c in cabecera if c not in COLUMNAS[tipo]]
+    if desconocidas:
+        raise ErrorImportacion("Columnas desconocidas: %s. Se esperan: %s."
+                               % (', '.join(desconocidas), ', '.join(COLUMNAS[tipo])))
+    faltantes = [c for c in OBLIGATORIAS[tipo] if c not in cabecera]
+    if faltantes:
+        raise ErrorImportacion("Faltan columnas obligatorias: %s." % ', '.join(faltantes))
+    if len(set(cabecera)) != len(cabecera):
+        raise ErrorImportacion("La cabecera tiene columnas repetidas.")
+    return cabecera
+
+
+def importar_csv(conn, tipo, archivo, delimitador=',', estricto=False, max_errores=1000, encoding='utf-8-sig'):
+    """Importa un CSV de clientes o productos y hace commit.
+
+    `archivo` puede ser un flujo de texto o binario; se lee una sola vez con
+    csv.reader y se envía a PostgreSQL con COPY, sin cargarlo entero en
+    memoria. Las filas
+    con errores se omiten (o se cancela todo si `estricto`). Devuelve un
+    resumen con los errores por fila (número de línea del CSV).
+    """
+    if tipo not in COLUMNAS:
+        raise ErrorImportacion("Tipo de importación desconocido: %s" % tipo)
+    if len(delimitador) != 1 or delimitador in '\'"\\\r\n':
+        raise ErrorImportacion("Delimitador inválido: %r" % delimitador)
+    if not isinstance(archivo, io.TextIOBase):
+        # Flujos binarios (archivos subidos, stdin.buffer): se decodifican al vuelo
+        archivo = io.TextIOWrapper(archivo, encoding=encoding, newline='')
+
+    inicio = time.monotonic()
+    lector = csv.reader(archivo, delimiter=delimitador)
+    cabecera = _leer_cabecera(lector, tipo)
+    errores_formato = []
+
+    try:
+        with conn.cursor() as cur:
+            # Todo es TEXT para que COPY no falle con datos inválidos: la
+            # validación se hace después, en SQL. `fila` es la línea del CSV
+            # en la que empieza la fila (la que el usuario ve en su editor).
+            columnas = ', '.join('%s TEXT' % c for c in COLUMNAS[tipo])
+            cur.execute("CREATE TEMP TABLE staging (fila BIGINT, %s) ON COMMIT DROP;" % columnas)
+            cur.execute("CREATE TEMP TABLE staging_errores (fila BIGINT, mensaje TEXT) ON COMMIT DROP;")
+            cur.copy_expert(
+                "COPY staging (fila, %s) FROM STDIN WITH (FORMAT csv)" % ', '.join(cabecera),
+                _FlujoCopia(lector, len(cabecera), errores_formato),
+            )
+            total = cur.rowcount + len(errores_formato)
+
+            if errores_formato:
+                execute_values(cur, "INSERT INTO staging_errores (fila, mensaje) VALUES %s;", errores_formato)
+            for validacion in VALIDACIONES[tipo]:
+                cur.execute("INSERT INTO staging_errores (fila, mensaje) %s;" % validacion)
+            cur.execute("CREATE INDEX ON staging_errores (fila);")
+            cur.execute("ANALYZE staging; ANALYZE staging_errores;")
+
+            cur.execute("SELECT COUNT(*), COUNT(DISTINCT fila) FROM staging_errores;")
+            errores_total, filas_con_error = cur.fetchone()
+            cur.execute(
+                "SELECT fila, mensaje FROM staging_errores ORDER BY fila, mensaje LIMIT %s;",
+                (max_errores,)
+            )
+            errores = cur.fetchall()
+
+            insertados = actualizados = 0
+            if not (estricto and errores_total):
+                cur.execute(_upsert(tipo, cabecera))
+                for (insertado,) in cur:
+                    if insertado:
+                        insertados += 1
+                    else:
+                        actualizados += 1
+
+        if estricto and errores_total:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return {
+        'tipo': tipo,
+        'total': total,
+        'insertados': insertados,
+        'actualizados': actualizados,
+        'sin_cambios': total - filas_con_error - insertados - actualizados if not (estricto and errores_total) else 0,
+        'filas_con_error': filas_con_error,
+        'errores_total': errores_total,
+        'errores': errores,
+        'aplicado': not (estricto and errores_total),
+        'segundos': round(time.monotonic() - inicio, 3),
+    }
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Importa clientes o productos desde un CSV.")
+    parser.add_argument('tipo', choices=sorted(COLUMNAS))
+    parser.add_argument('archivo', help="Ruta del CSV ('-' para leer de la entrada estándar)")
+    parser.add_argument('--delimitador', default=',')
+    parser.add_argument('--encoding', default='utf-8-sig')
+    parser.add_argument('--estricto', action='store_true',
+                        help="No importa nada si alguna fila tiene errores")
+    parser.add_argument('--max-errores', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    db_config = {
+        'host': os.environ["DB_HOST"],
+        'port': os.environ["DB_PORT"],
+        'database': os.environ["DB_NAME"],
+        'user': os.environ["DB_USER"],
+        'password': os.environ["DB_PASSWORD"]
+    }
+
+    conn = psycopg2.connect(**db_config)
+    try:
+        if args.archivo == '-':
+            archivo = sys.stdin.buffer
+            resumen = importar_csv(conn, args.tipo, archivo, args.delimitador, args.estricto,
+                                   args.max_errores, args.encoding)
+        else:
+            with open(args.archivo, 'rb') as archivo:
+                resumen = importar_csv(conn, args.tipo, archivo, args.delimitador, args.estricto,
+                                       args.max_errores, args.encoding)
+    except ErrorImportacion as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    finally:
+        conn.close()
+
+    for linea, mensaje in resumen['errores']:
+        print(f"Línea {linea}: {mensaje}", file=sys.stderr)
+    if resumen['errores_total'] > len(resumen['errores']):
+        print(f"... y {resumen['errores_total'] - len(resumen['errores'])} errores más", file=sys.stderr)
+
+    estado = "Importación aplicada" if resumen['aplicado'] else "Importación cancelada (modo estricto)"
+    print(f"{estado}: {resumen['total']} filas leídas, {resumen['insertados']} insertadas, "
+          f"{resumen['actualizados']} actualizadas, {resumen['sin_cambios']} sin cambios, "
+          f"{resumen['filas_con_error']} con errores ({resumen['segundos']}s).")
+    return 0 if resumen['aplicado'] and not resumen['errores_total'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
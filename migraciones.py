@@ -0,0 +1,1861 @@
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+from dotenv import load_dotenv
+
+from exportar import consulta_exportacion
+
+
+# Migraciones en orden de versión: (versión, descripción, pasos). Cada paso es
+# una sentencia SQL (se ejecuta en su propia transacción) o un índice
+# (nombre, tabla, columnas, único), que se crea con CREATE INDEX CONCURRENTLY
+# para no bloquear las escrituras. Los pasos deben poder repetirse: si una
+# migración falla a medias, se vuelve a ejecutar completa.
+#
+# Todo el esquema sale de aquí: una base vacía y una creada con la primera
+# versión de init_db.py (sin schema_migraciones) llegan al mismo esquema.
+MIGRACIONES = (
+    (1, "Esquema base: clientes, productos, facturas y usuarios", (
+        # Las tablas como las creaba la primera versión de init_db.py; la
+        # migración 2 particiona facturas y factura_items
+        """
+        CREATE TABLE IF NOT EXISTS clientes (
+            id SERIAL PRIMARY KEY,
+            ruc VARCHAR(11) NOT NULL UNIQUE,
+            nombre VARCHAR(100) NOT NULL,
+            direccion TEXT,
+            telefono VARCHAR(20),
+            email VARCHAR(100)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS productos (
+            id SERIAL PRIMARY KEY,
+            nombre VARCHAR(100) NOT NULL,
+            descripcion TEXT,
+            precio DECIMAL(10, 2) NOT NULL,
+            stock INTEGER DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS facturas (
+            id SERIAL PRIMARY KEY,
+            numero VARCHAR(20) NOT NULL UNIQUE,
+            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            cliente_id INTEGER NOT NULL,
+            total DECIMAL(10, 2) NOT NULL,
+            FOREIGN KEY (cliente_id) REFERENCES clientes (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS factura_items (
+            id SERIAL PRIMARY KEY,
+            factura_id INTEGER NOT NULL,
+            producto_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL,
+            precio DECIMAL(10, 2) NOT NULL,
+            subtotal DECIMAL(10, 2) NOT NULL,
+            FOREIGN KEY (factura_id) REFERENCES facturas (id),
+            FOREIGN KEY (producto_id) REFERENCES productos (id)
+        )
+        """,
+        "CREATE SEQUENCE IF NOT EXISTS factura_numero_seq START WITH 1000",
+        """
+        CREATE TABLE IF NOT EXISTS usuario (
+            id SERIAL PRIMARY KEY,
+            username TEXT NOT NULL UNIQUE,
+            email TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION obtener_precio_producto(p_id INT)
+        RETURNS NUMERIC
+        LANGUAGE sql
+        AS $$
+            SELECT precio FROM productos WHERE id = p_id;
+        $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION obtener_siguiente_numero_factura()
+        RETURNS BIGINT
+        LANGUAGE sql
+        AS $$
+            SELECT nextval('factura_numero_seq');
+        $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION insertar_factura(
+            p_numero TEXT,
+            p_cliente_id INT,
+            p_total NUMERIC
+        )
+        RETURNS INT
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            nuevo_id INT;
+        BEGIN
+            INSERT INTO facturas (numero, cliente_id, total)
+            VALUES (p_numero, p_cliente_id, p_total)
+            RETURNING id INTO nuevo_id;
+
+            RETURN nuevo_id;
+        END;
+        $$
+        """,
+        # La primera versión devolvía solo id y nombre: cambia el tipo de
+        # resultado y no alcanza con CREATE OR REPLACE
+        """
+        DROP FUNCTION IF EXISTS obtener_clientes();
+
+        CREATE FUNCTION obtener_clientes()
+        RETURNS TABLE(id INT, nombre TEXT, ruc TEXT)
+        LANGUAGE sql
+        AS $$
+            SELECT id, nombre, ruc FROM clientes ORDER BY nombre, id;
+        $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION obtener_productos()
+        RETURNS TABLE(id INT, nombre TEXT, precio NUMERIC)
+        LANGUAGE sql
+        AS $$
+            SELECT id, nombre, precio FROM productos ORDER BY nombre, id;
+        $$
+        """,
+        """
+        CREATE OR REPLACE PROCEDURE insertar_usuario(
+            p_username TEXT,
+            p_email TEXT,
+            p_password TEXT
+        )
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM usuario WHERE username = p_username) THEN
+                RAISE EXCEPTION 'Usuario con ese nombre ya existe';
+            END IF;
+
+            INSERT INTO usuario (username, email, password)
+            VALUES (p_username, p_email, p_password);
+        END;
+        $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION obtener_usuario_por_username(p_username TEXT)
+        RETURNS TABLE (
+            id INT,
+            username TEXT,
+            password TEXT
+        )
+        LANGUAGE sql
+        AS $$
+            SELECT id, username, password
+            FROM usuario
+            WHERE username = p_username;
+        $$
+        """,
+        """
+        CREATE OR REPLACE PROCEDURE insertar_cliente(
+            p_ruc VARCHAR(11),
+            p_nombre VARCHAR(100),
+            p_direccion TEXT DEFAULT NULL,
+            p_telefono VARCHAR(20) DEFAULT NULL,
+            p_email VARCHAR(100) DEFAULT NULL
+        )
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            -- Validar que el RUC tenga 11 dígitos
+            IF p_ruc !~ '^[0-9]{11}$' THEN
+                RAISE EXCEPTION 'El RUC debe tener exactamente 11 dígitos';
+            END IF;
+
+            -- Insertar el nuevo cliente
+            INSERT INTO clientes (ruc, nombre, direccion, telefono, email)
+            VALUES (p_ruc, p_nombre, p_direccion, p_telefono, p_email);
+
+            RAISE NOTICE 'Cliente insertado correctamente con RUC: %', p_ruc;
+        END;
+        $$
+        """,
+        """
+        CREATE OR REPLACE PROCEDURE registrar_producto(
+            p_nombre VARCHAR(100),
+            p_descripcion TEXT DEFAULT NULL,
+            p_precio NUMERIC(10,2) DEFAULT 0.00,
+            p_stock INTEGER DEFAULT 0
+        )
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            -- Validar que el nombre no esté vacío
+            IF p_nombre IS NULL OR TRIM(p_nombre) = '' THEN
+                RAISE EXCEPTION 'El nombre del producto no puede estar vacío';
+            END IF;
+
+            -- Validar que el precio sea positivo
+            IF p_precio <= 0 THEN
+                RAISE EXCEPTION 'El precio debe ser mayor que cero';
+            END IF;
+
+            -- Validar que el stock no sea negativo
+            IF p_stock < 0 THEN
+                RAISE EXCEPTION 'El stock no puede ser negativo';
+            END IF;
+
+            -- Validar que el nombre no exista (comparación case-insensitive)
+            IF EXISTS (SELECT 1 FROM productos WHERE LOWER(TRIM(nombre)) = LOWER(TRIM(p_nombre))) THEN
+                RAISE EXCEPTION 'El producto "%" ya está registrado', p_nombre;
+            END IF;
+
+            -- Insertar el nuevo producto
+            INSERT INTO productos (nombre, descripcion, precio, stock)
+            VALUES (TRIM(p_nombre), NULLIF(TRIM(p_descripcion), ''), p_precio, p_stock);
+
+            RAISE NOTICE 'Producto registrado exitosamente: %', p_nombre;
+        END;
+        $$
+        """,
+    )),
+    (2, "Facturas e ítems particionados por mes sobre fecha", (
+        """
+        CREATE OR REPLACE FUNCTION crear_particiones_facturas(
+            p_desde DATE DEFAULT CURRENT_DATE,
+            p_meses INT DEFAULT 3
+        )
+        RETURNS INT
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            v_mes DATE;
+            v_tabla TEXT;
+            v_particion TEXT;
+            v_creadas INT := 0;
+            v_en_default BOOLEAN;
+        BEGIN
+            -- Crea las particiones mensuales de facturas y factura_items desde
+            -- el mes de p_desde hasta p_meses meses después. Es idempotente y
+            -- se serializa con un lock para que varios workers puedan llamarla.
+            PERFORM pg_advisory_xact_lock(hashtext('crear_particiones_facturas'));
+
+            FOR i IN 0..p_meses LOOP
+                v_mes := (date_trunc('month', p_desde) + make_interval(months => i))::DATE;
+                FOREACH v_tabla IN ARRAY ARRAY['facturas', 'factura_items'] LOOP
+                    v_particion := v_tabla || '_' || to_char(v_mes, 'YYYY_MM');
+                    CONTINUE WHEN to_regclass(v_particion) IS NOT NULL;
+
+                    -- Si la partición por defecto ya tiene filas de ese mes, no
+                    -- se puede crear la partición (hay que moverlas antes)
+                    EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE fecha >= %L AND fecha < %L)',
+                                   v_tabla || '_default', v_mes, (v_mes + INTERVAL '1 month')::DATE)
+                    INTO v_en_default;
+                    IF v_en_default THEN
+                        RAISE WARNING 'No se creó % : %_default tiene filas de ese mes', v_particion, v_tabla;
+                        CONTINUE;
+                    END IF;
+
+                    EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                                   v_particion, v_tabla, v_mes, (v_mes + INTERVAL '1 month')::DATE);
+                    v_creadas := v_creadas + 1;
+                END LOOP;
+            END LOOP;
+
+            RETURN v_creadas;
+        END;
+        $$
+        """,
+        # Una tabla no se puede convertir en particionada: se crean las nuevas,
+        # se copian las filas y se borran las anteriores, todo en una
+        # transacción y con las tablas bloqueadas. Los ids se conservan y las
+        # secuencias pasan a las tablas nuevas.
+        """
+        DO $$
+        DECLARE
+            v_restriccion RECORD;
+            v_desde DATE;
+        BEGIN
+            IF (SELECT relkind FROM pg_class WHERE oid = 'facturas'::REGCLASS) = 'p' THEN
+                RETURN;
+            END IF;
+
+            LOCK TABLE facturas, factura_items IN ACCESS EXCLUSIVE MODE;
+
+            ALTER TABLE factura_items RENAME TO factura_items_anterior;
+            ALTER TABLE facturas RENAME TO facturas_anterior;
+
+            -- Liberar los nombres de las restricciones (y de sus índices)
+            -- para las tablas nuevas; primero las claves foráneas de los ítems
+            FOR v_restriccion IN
+                SELECT conrelid::REGCLASS AS tabla, conname
+                FROM pg_constraint
+                WHERE conrelid IN ('factura_items_anterior'::REGCLASS, 'facturas_anterior'::REGCLASS)
+                  AND contype IN ('f', 'u', 'p')
+                ORDER BY conrelid = 'facturas_anterior'::REGCLASS, contype = 'p'
+            LOOP
+                EXECUTE format('ALTER TABLE %s DROP CONSTRAINT %I', v_restriccion.tabla, v_restriccion.conname);
+            END LOOP;
+
+            -- Las claves primarias y las únicas deben incluir fecha
+            -- (numeros_factura hace único el número)
+            CREATE TABLE facturas (
+                id INTEGER NOT NULL DEFAULT nextval('facturas_id_seq'),
+                numero VARCHAR(20) NOT NULL,
+                fecha TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                cliente_id INTEGER NOT NULL,
+                total DECIMAL(10, 2) NOT NULL,
+                PRIMARY KEY (id, fecha),
+                UNIQUE (numero, fecha),
+                FOREIGN KEY (cliente_id) REFERENCES clientes (id)
+            ) PARTITION BY RANGE (fecha);
+
+            -- Particionada igual que facturas; fecha es la de su factura
+            CREATE TABLE factura_items (
+                id INTEGER NOT NULL DEFAULT nextval('factura_items_id_seq'),
+                factura_id INTEGER NOT NULL,
+                producto_id INTEGER NOT NULL,
+                cantidad INTEGER NOT NULL,
+                precio DECIMAL(10, 2) NOT NULL,
+                subtotal DECIMAL(10, 2) NOT NULL,
+                fecha TIMESTAMP NOT NULL,
+                PRIMARY KEY (id, fecha),
+                FOREIGN KEY (factura_id, fecha) REFERENCES facturas (id, fecha),
+                FOREIGN KEY (producto_id) REFERENCES productos (id)
+            ) PARTITION BY RANGE (fecha);
+
+            ALTER SEQUENCE facturas_id_seq OWNED BY facturas.id;
+            ALTER SEQUENCE factura_items_id_seq OWNED BY factura_items.id;
+
+            -- Filas fuera de las particiones mensuales (p. ej. fechas antiguas)
+            CREATE TABLE facturas_default PARTITION OF facturas DEFAULT;
+            CREATE TABLE factura_items_default PARTITION OF factura_items DEFAULT;
+
+            -- Un mes por partición desde la factura más antigua hasta el mes
+            -- actual, antes de copiar: así ninguna fila va a las de defecto
+            SELECT date_trunc('month', MIN(fecha))::DATE INTO v_desde FROM facturas_anterior;
+            IF v_desde IS NOT NULL THEN
+                PERFORM crear_particiones_facturas(v_desde, (
+                    SELECT (EXTRACT(YEAR FROM a) * 12 + EXTRACT(MONTH FROM a))::INT
+                    FROM age(date_trunc('month', CURRENT_DATE)::DATE, v_desde) AS a
+                ));
+            END IF;
+
+            -- Las facturas sin fecha (la columna admitía NULL) toman la actual
+            INSERT INTO facturas (id, numero, fecha, cliente_id, total)
+            SELECT id, numero, COALESCE(fecha, CURRENT_TIMESTAMP), cliente_id, total
+            FROM facturas_anterior;
+
+            INSERT INTO factura_items (id, factura_id, producto_id, cantidad, precio, subtotal, fecha)
+            SELECT fi.id, fi.factura_id, fi.producto_id, fi.cantidad, fi.precio, fi.subtotal, f.fecha
+            FROM factura_items_anterior fi
+            JOIN facturas f ON f.id = fi.factura_id;
+
+            DROP TABLE factura_items_anterior;
+            DROP TABLE facturas_anterior;
+        END;
+        $$
+        """,
+        # Particiones iniciales: el mes anterior, el actual y los 3 siguientes
+        "SELECT crear_particiones_facturas((CURRENT_DATE - INTERVAL '1 month')::DATE, 4)",
+        # Los ítems llevan la fecha de su factura
+        """
+        CREATE OR REPLACE PROCEDURE insertar_factura_item(
+            p_factura_id INTEGER,
+            p_producto_id INTEGER,
+            p_cantidad NUMERIC,
+            p_precio NUMERIC,
+            p_subtotal NUMERIC
+        )
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            INSERT INTO factura_items (factura_id, producto_id, cantidad, precio, subtotal, fecha)
+            SELECT p_factura_id, p_producto_id, p_cantidad, p_precio, p_subtotal, f.fecha
+            FROM facturas f
+            WHERE f.id = p_factura_id;
+        END;
+        $$
+        """,
+    )),
+    (3, "Índices de facturas e ítems de factura", (
+        ('idx_facturas_fecha_id', 'facturas', 'fecha DESC, id DESC', False),
+        ('idx_facturas_cliente_fecha', 'facturas', 'cliente_id, fecha DESC, id DESC', False),
+        ('idx_facturas_numero_patron', 'facturas', 'numero varchar_pattern_ops', False),
+        ('idx_factura_items_factura', 'factura_items', 'factura_id, fecha', False),
+        ('idx_factura_items_producto', 'factura_items', 'producto_id', False),
+    )),
+    (4, "Versión de facturas y contadores de cambios para caché HTTP", (
+        # Valores por defecto constantes: PostgreSQL no reescribe la tabla
+        "ALTER TABLE facturas ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1",
+        "ALTER TABLE facturas ADD COLUMN IF NOT EXISTS actualizada_en TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP",
+        """
+        CREATE OR REPLACE FUNCTION marcar_factura_modificada()
+        RETURNS TRIGGER
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            NEW.version := OLD.version + 1;
+            NEW.actualizada_en := CURRENT_TIMESTAMP;
+            RETURN NEW;
+        END;
+        $$
+        """,
+        """
+        DROP TRIGGER IF EXISTS facturas_marcar_modificada ON facturas;
+        CREATE TRIGGER facturas_marcar_modificada
+        BEFORE UPDATE ON facturas
+        FOR EACH ROW EXECUTE FUNCTION marcar_factura_modificada()
+        """,
+        # Cambios por tabla, repartidos en ranuras según la conexión: dos
+        # escrituras concurrentes casi nunca esperan por la misma fila. La
+        # suma de las ranuras cambia con cada escritura confirmada.
+        """
+        CREATE TABLE IF NOT EXISTS contadores_cambios (
+            tabla TEXT NOT NULL,
+            ranura SMALLINT NOT NULL,
+            cambios BIGINT NOT NULL DEFAULT 0,
+            actualizado_en TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (tabla, ranura)
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION contar_cambios()
+        RETURNS TRIGGER
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            INSERT INTO contadores_cambios AS c (tabla, ranura, cambios)
+            VALUES (TG_TABLE_NAME, pg_backend_pid() % 16, 1)
+            ON CONFLICT (tabla, ranura) DO UPDATE
+            SET cambios = c.cambios + 1,
+                actualizado_en = CURRENT_TIMESTAMP;
+            RETURN NULL;
+        END;
+        $$
+        """,
+        """
+        DROP TRIGGER IF EXISTS facturas_contar_cambios ON facturas;
+        CREATE TRIGGER facturas_contar_cambios
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON facturas
+        FOR EACH STATEMENT EXECUTE FUNCTION contar_cambios()
+        """,
+        # De clientes y productos solo importan los datos que muestran las
+        # facturas (no el stock ni los clientes nuevos)
+        """
+        DROP TRIGGER IF EXISTS clientes_contar_cambios ON clientes;
+        CREATE TRIGGER clientes_contar_cambios
+        AFTER UPDATE OR TRUNCATE ON clientes
+        FOR EACH STATEMENT EXECUTE FUNCTION contar_cambios()
+        """,
+        """
+        DROP TRIGGER IF EXISTS productos_contar_cambios ON productos;
+        CREATE TRIGGER productos_contar_cambios
+        AFTER UPDATE OF nombre OR TRUNCATE ON productos
+        FOR EACH STATEMENT EXECUTE FUNCTION contar_cambios()
+        """,
+    )),
+    (5, "Índices del catálogo: búsquedas y nombre único de productos", (
+        # El índice único no se puede crear con nombres repetidos: mejor un
+        # error que diga cuáles que un índice inválido
+        """
+        DO $$
+        DECLARE
+            v_repetidos TEXT;
+        BEGIN
+            IF to_regclass('idx_productos_nombre_unico') IS NULL THEN
+                SELECT string_agg(nombre, ', ') INTO v_repetidos
+                FROM (
+                    SELECT MIN(nombre) AS nombre
+                    FROM productos
+                    GROUP BY LOWER(TRIM(nombre))
+                    HAVING COUNT(*) > 1
+                    LIMIT 20
+                ) r;
+                IF v_repetidos IS NOT NULL THEN
+                    RAISE EXCEPTION 'Hay productos con el mismo nombre: %. Unifíquelos antes de migrar.', v_repetidos;
+                END IF;
+            END IF;
+        END;
+        $$
+        """,
+        ('idx_productos_nombre_unico', 'productos', 'LOWER(TRIM(nombre))', True),
+        ('idx_productos_nombre_id', 'productos', 'nombre, id', False),
+        ('idx_clientes_nombre_id', 'clientes', 'nombre, id', False),
+        ('idx_clientes_ruc_patron', 'clientes', 'ruc varchar_pattern_ops', False),
+        # Búsqueda de nombres por trigramas (ILIKE '%texto%')
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_clientes_nombre_trgm ON clientes USING gin (nombre gin_trgm_ops)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_productos_nombre_trgm ON productos USING gin (nombre gin_trgm_ops)",
+    )),
+    (6, "Consultas del listado y de la búsqueda de clientes verificables con EXPLAIN", (
+        # Versiones anteriores del listado: sin parámetros (la primera) y
+        # con cursor pero sin filtros
+        "DROP FUNCTION IF EXISTS obtener_facturas()",
+        "DROP FUNCTION IF EXISTS obtener_facturas(INTEGER, TIMESTAMP, INTEGER, BOOLEAN)",
+        # El SQL del listado se arma aparte para que `verificar` pueda
+        # preparar y explicar exactamente lo que ejecuta obtener_facturas()
+        """
+        CREATE OR REPLACE FUNCTION consulta_obtener_facturas(
+            p_limite INT DEFAULT 50,
+            p_cursor_fecha TIMESTAMP DEFAULT NULL,
+            p_cursor_id INT DEFAULT NULL,
+            p_anteriores BOOLEAN DEFAULT FALSE,
+            p_numero TEXT DEFAULT NULL,
+            p_cliente TEXT DEFAULT NULL,
+            p_desde DATE DEFAULT NULL,
+            p_hasta DATE DEFAULT NULL
+        )
+        RETURNS TEXT
+        LANGUAGE plpgsql
+        IMMUTABLE
+        AS $$
+        DECLARE
+            v_condiciones TEXT[] := ARRAY['TRUE'];
+            v_orden TEXT := CASE WHEN p_anteriores THEN 'ASC' ELSE 'DESC' END;
+            v_sql TEXT;
+        BEGIN
+            -- Paginación por cursor (keyset) sobre (fecha, id): cada página
+            -- es un recorrido del índice idx_facturas_fecha_id, sin OFFSET.
+            IF p_cursor_fecha IS NOT NULL THEN
+                -- La condición simple sobre fecha permite descartar particiones
+                v_condiciones := array_append(v_condiciones, CASE WHEN p_anteriores
+                    THEN 'f.fecha >= $2 AND (f.fecha, f.id) > ($2, $3)'
+                    ELSE 'f.fecha <= $2 AND (f.fecha, f.id) < ($2, $3)' END);
+            END IF;
+
+            -- Filtros de búsqueda, todos atendibles por índices:
+            --   número  -> prefijo con idx_facturas_numero_patron
+            --   cliente -> trigramas con idx_clientes_nombre_trgm
+            --   fechas  -> rango sobre idx_facturas_fecha_id
+            IF p_numero IS NOT NULL THEN
+                v_condiciones := array_append(v_condiciones, 'f.numero LIKE $4');
+            END IF;
+            IF p_cliente IS NOT NULL THEN
+                v_condiciones := array_append(v_condiciones, 'c.nombre ILIKE $5');
+            END IF;
+            IF p_desde IS NOT NULL THEN
+                v_condiciones := array_append(v_condiciones, 'f.fecha >= $6');
+            END IF;
+            IF p_hasta IS NOT NULL THEN
+                v_condiciones := array_append(v_condiciones, 'f.fecha < $7 + 1');
+            END IF;
+
+            v_sql := format(
+                'SELECT f.id, f.numero::TEXT, f.fecha::DATE, c.nombre::TEXT, f.total, f.fecha
+                 FROM facturas f
+                 JOIN clientes c ON f.cliente_id = c.id
+                 WHERE %s
+                 ORDER BY f.fecha %s, f.id %s
+                 LIMIT $1',
+                array_to_string(v_condiciones, ' AND '), v_orden, v_orden
+            );
+
+            -- Página anterior: se recorre hacia atrás y se devuelve en el
+            -- mismo orden descendente que las demás páginas.
+            IF p_anteriores THEN
+                v_sql := 'SELECT * FROM (' || v_sql || ') a ORDER BY 6 DESC, 1 DESC';
+            END IF;
+            RETURN v_sql;
+        END;
+        $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION obtener_facturas(
+            p_limite INT DEFAULT 50,
+            p_cursor_fecha TIMESTAMP DEFAULT NULL,
+            p_cursor_id INT DEFAULT NULL,
+            p_anteriores BOOLEAN DEFAULT FALSE,
+            p_numero TEXT DEFAULT NULL,
+            p_cliente TEXT DEFAULT NULL,
+            p_desde DATE DEFAULT NULL,
+            p_hasta DATE DEFAULT NULL
+        )
+        RETURNS TABLE(
+            id INT,
+            numero TEXT,
+            fecha DATE,
+            cliente TEXT,
+            total NUMERIC,
+            fecha_orden TIMESTAMP
+        )
+        LANGUAGE plpgsql
+        STABLE
+        AS $$
+        BEGIN
+            -- SQL dinámico: cada búsqueda se planifica con sus filtros reales
+            RETURN QUERY EXECUTE consulta_obtener_facturas(
+                p_limite, p_cursor_fecha, p_cursor_id, p_anteriores,
+                p_numero, p_cliente, p_desde, p_hasta)
+            USING p_limite, p_cursor_fecha, p_cursor_id,
+                  p_numero || '%', '%' || p_cliente || '%', p_desde, p_hasta;
+        END;
+        $$
+        """,
+        # Cada búsqueda de clientes es una función SQL que PostgreSQL expande
+        # dentro de la consulta que la llama: EXPLAIN muestra su plan real
+        """
+        CREATE OR REPLACE FUNCTION buscar_clientes_por_ruc(
+            p_prefijo TEXT,
+            p_limite INT DEFAULT 20,
+            p_cursor_nombre TEXT DEFAULT NULL,
+            p_cursor_id INT DEFAULT NULL
+        )
+        RETURNS TABLE(id INT, nombre TEXT, ruc TEXT)
+        LANGUAGE sql
+        STABLE
+        AS $$
+            -- Prefijo de RUC, solo dígitos (idx_clientes_ruc_patron)
+            SELECT c.id, c.nombre::TEXT, c.ruc::TEXT
+            FROM clientes c
+            WHERE c.ruc LIKE p_prefijo || '%'
+              AND (p_cursor_id IS NULL OR (c.nombre, c.id) > (p_cursor_nombre, p_cursor_id))
+            ORDER BY c.nombre, c.id
+            LIMIT p_limite;
+        $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION buscar_clientes_por_nombre(
+            p_texto TEXT DEFAULT NULL,
+            p_limite INT DEFAULT 20,
+            p_cursor_nombre TEXT DEFAULT NULL,
+            p_cursor_id INT DEFAULT NULL
+        )
+        RETURNS TABLE(id INT, nombre TEXT, ruc TEXT)
+        LANGUAGE sql
+        STABLE
+        AS $$
+            -- Nombre por trigramas (idx_clientes_nombre_trgm); sin texto se
+            -- recorre idx_clientes_nombre_id. Los comodines de LIKE que
+            -- escriba el usuario se buscan literalmente.
+            SELECT c.id, c.nombre::TEXT, c.ruc::TEXT
+            FROM clientes c
+            WHERE (NULLIF(trim(p_texto), '') IS NULL
+                   OR c.nombre ILIKE '%' || replace(replace(replace(trim(p_texto),
+                        '\\', '\\\\'), '%', '\\%'), '_', '\\_') || '%')
+              AND (p_cursor_id IS NULL OR (c.nombre, c.id) > (p_cursor_nombre, p_cursor_id))
+            ORDER BY c.nombre, c.id
+            LIMIT p_limite;
+        $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION buscar_clientes(
+            p_texto TEXT DEFAULT NULL,
+            p_limite INT DEFAULT 20,
+            p_cursor_nombre TEXT DEFAULT NULL,
+            p_cursor_id INT DEFAULT NULL
+        )
+        RETURNS TABLE(id INT, nombre TEXT, ruc TEXT)
+        LANGUAGE plpgsql
+        STABLE
+        AS $$
+        BEGIN
+            -- Solo dígitos: prefijo de RUC; si no, nombre.
+            -- El orden y el cursor van sobre (nombre, id).
+            IF trim(p_texto) ~ '^[0-9]+$' THEN
+                RETURN QUERY
+                SELECT * FROM buscar_clientes_por_ruc(trim(p_texto), p_limite, p_cursor_nombre, p_cursor_id);
+            ELSE
+                RETURN QUERY
+                SELECT * FROM buscar_clientes_por_nombre(p_texto, p_limite, p_cursor_nombre, p_cursor_id);
+            END IF;
+        END;
+        $$
+        """,
+    )),
+    (7, "Edición de facturas por diferencias (actualizar_factura_con_productos)", (
+        # La versión anterior no recibía la fecha; con las dos, una llamada
+        # sin fecha sería ambigua
+        """
+        DROP PROCEDURE IF EXISTS actualizar_factura_con_productos(INTEGER, INTEGER, JSONB);
+
+        CREATE OR REPLACE PROCEDURE actualizar_factura_con_productos(
+            p_factura_id INTEGER,
+            p_cliente_id INTEGER,
+            p_productos JSONB,
+            p_fecha DATE DEFAULT NULL
+        )
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            v_fecha TIMESTAMP;
+            v_producto_id INT;
+            v_cantidad INT;
+            v_stock INT;
+            v_filas INT;
+            v_items_cambiados INT := 0;
+        BEGIN
+            -- Aplica solo las diferencias entre los items guardados y los
+            -- nuevos (agrupados por producto), en sentencias por conjunto,
+            -- y ajusta el stock por la diferencia de cantidad de cada producto.
+            -- Los items nuevos toman el precio del catálogo; los que siguen
+            -- conservan el precio con que se facturaron.
+
+            -- Bloquear la factura: dos ediciones simultáneas se serializan.
+            -- Con la fecha (día) de la factura solo se lee su partición.
+            IF p_fecha IS NOT NULL THEN
+                SELECT fecha INTO v_fecha
+                FROM facturas
+                WHERE id = p_factura_id AND fecha >= p_fecha AND fecha < p_fecha + 1
+                FOR UPDATE;
+            ELSE
+                SELECT fecha INTO v_fecha FROM facturas WHERE id = p_factura_id FOR UPDATE;
+            END IF;
+            IF v_fecha IS NULL THEN
+                RAISE EXCEPTION 'La factura con ID % no existe', p_factura_id;
+            END IF;
+
+            IF NOT EXISTS (SELECT 1 FROM clientes WHERE id = p_cliente_id) THEN
+                RAISE EXCEPTION 'El cliente con ID % no existe', p_cliente_id;
+            END IF;
+
+            IF p_productos IS NULL OR jsonb_typeof(p_productos) <> 'array' OR jsonb_array_length(p_productos) = 0 THEN
+                RAISE EXCEPTION 'Una factura debe tener al menos un producto';
+            END IF;
+
+            IF EXISTS (
+                SELECT 1 FROM jsonb_to_recordset(p_productos) AS x(producto_id INT, cantidad INT)
+                WHERE x.producto_id IS NULL OR x.cantidad IS NULL OR x.cantidad <= 0
+            ) THEN
+                RAISE EXCEPTION 'Todos los items deben tener producto y una cantidad mayor que cero';
+            END IF;
+
+            -- Cantidades nuevas y anteriores por producto, y su diferencia
+            CREATE TEMP TABLE cambios_factura ON COMMIT DROP AS
+            SELECT producto_id,
+                   COALESCE(nuevo.cantidad, 0) AS cantidad,
+                   COALESCE(nuevo.cantidad, 0) - COALESCE(anterior.cantidad, 0) AS diferencia,
+                   nuevo.orden,
+                   anterior.item_id,
+                   anterior.lineas
+            FROM (
+                SELECT x.producto_id, SUM(x.cantidad)::INT AS cantidad, MIN(x.orden) AS orden
+                FROM ROWS FROM (jsonb_to_recordset(p_productos) AS (producto_id INT, cantidad INT))
+                     WITH ORDINALITY AS x(producto_id, cantidad, orden)
+                GROUP BY x.producto_id
+            ) nuevo
+            FULL JOIN (
+                SELECT fi.producto_id, SUM(fi.cantidad)::INT AS cantidad, MIN(fi.id) AS item_id, COUNT(*) AS lineas
+                FROM factura_items fi
+                WHERE fi.factura_id = p_factura_id AND fi.fecha = v_fecha
+                GROUP BY fi.producto_id
+            ) anterior USING (producto_id);
+
+            -- Bloquear en orden de id los productos cuyo stock cambia y
+            -- validar existencia y stock de una vez
+            PERFORM 1 FROM productos
+            WHERE id IN (SELECT c.producto_id FROM cambios_factura c WHERE c.diferencia <> 0)
+            ORDER BY id
+            FOR UPDATE;
+
+            SELECT c.producto_id, c.diferencia, p.stock
+            INTO v_producto_id, v_cantidad, v_stock
+            FROM cambios_factura c
+            LEFT JOIN productos p ON p.id = c.producto_id
+            WHERE c.diferencia > 0 AND (p.id IS NULL OR p.stock < c.diferencia)
+            ORDER BY c.producto_id
+            LIMIT 1;
+
+            IF FOUND THEN
+                IF v_stock IS NULL THEN
+                    RAISE EXCEPTION 'El producto con ID % no existe', v_producto_id;
+                END IF;
+                RAISE EXCEPTION 'La cantidad agregada (%) excede el stock disponible (%) para el producto ID %',
+                    v_cantidad, v_stock, v_producto_id;
+            END IF;
+
+            -- Productos que ya no están y líneas repetidas de un mismo producto
+            DELETE FROM factura_items fi
+            USING cambios_factura c
+            WHERE fi.factura_id = p_factura_id AND fi.fecha = v_fecha
+              AND fi.producto_id = c.producto_id
+              AND (c.cantidad = 0 OR fi.id <> c.item_id);
+            GET DIAGNOSTICS v_filas = ROW_COUNT;
+            v_items_cambiados := v_items_cambiados + v_filas;
+
+            -- Productos que siguen con otra cantidad (o que estaban en varias líneas)
+            UPDATE factura_items fi
+            SET cantidad = c.cantidad,
+                subtotal = c.cantidad * fi.precio
+            FROM cambios_factura c
+            WHERE fi.id = c.item_id AND fi.fecha = v_fecha
+              AND c.cantidad > 0 AND (c.diferencia <> 0 OR c.lineas > 1);
+            GET DIAGNOSTICS v_filas = ROW_COUNT;
+            v_items_cambiados := v_items_cambiados + v_filas;
+
+            -- Productos nuevos, con el precio del catálogo
+            INSERT INTO factura_items (factura_id, producto_id, cantidad, precio, subtotal, fecha)
+            SELECT p_factura_id, c.producto_id, c.cantidad, p.precio, c.cantidad * p.precio, v_fecha
+            FROM cambios_factura c
+            JOIN productos p ON p.id = c.producto_id
+            WHERE c.item_id IS NULL
+            ORDER BY c.orden;
+            GET DIAGNOSTICS v_filas = ROW_COUNT;
+            v_items_cambiados := v_items_cambiados + v_filas;
+
+            -- Stock: se descuenta lo agregado y se devuelve lo quitado
+            UPDATE productos p
+            SET stock = p.stock - c.diferencia
+            FROM cambios_factura c
+            WHERE p.id = c.producto_id AND c.diferencia <> 0;
+
+            -- Cabecera: solo se reescribe si cambia el cliente, el total o
+            -- algún item; al reescribirla sube su versión (caché HTTP)
+            UPDATE facturas f
+            SET cliente_id = p_cliente_id,
+                total = t.total
+            FROM (
+                SELECT COALESCE(SUM(fi.subtotal), 0) AS total
+                FROM factura_items fi
+                WHERE fi.factura_id = p_factura_id AND fi.fecha = v_fecha
+            ) t
+            WHERE f.id = p_factura_id AND f.fecha = v_fecha
+              AND ((f.cliente_id, f.total) IS DISTINCT FROM (p_cliente_id, t.total)
+                   OR v_items_cambiados > 0);
+
+            DROP TABLE cambios_factura;
+        END;
+        $$
+        """,
+    )),
+    (8, "Borrado de varias facturas en una transacción (borrar_facturas)", (
+        """
+        CREATE OR REPLACE FUNCTION borrar_facturas(p_ids INT[])
+        RETURNS INT
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            v_ids INT[];
+            v_fechas TIMESTAMP[];
+            v_borradas INT;
+        BEGIN
+            -- Borra varias facturas con sus items y devuelve su stock, todo
+            -- en una transacción y con una sentencia por tabla. Los ids que
+            -- no existen se ignoran; devuelve cuántas facturas se borraron.
+
+            -- Bloquear las facturas (y luego los productos) en orden de id
+            SELECT array_agg(f.id ORDER BY f.id), array_agg(f.fecha ORDER BY f.id)
+            INTO v_ids, v_fechas
+            FROM (
+                SELECT id, fecha FROM facturas
+                WHERE id = ANY(p_ids)
+                ORDER BY id
+                FOR UPDATE
+            ) f;
+
+            IF v_ids IS NULL THEN
+                RETURN 0;
+            END IF;
+
+            PERFORM 1 FROM productos
+            WHERE id IN (
+                SELECT fi.producto_id FROM factura_items fi
+                WHERE fi.factura_id = ANY(v_ids) AND fi.fecha = ANY(v_fechas)
+            )
+            ORDER BY id
+            FOR UPDATE;
+
+            UPDATE productos p
+            SET stock = p.stock + d.cantidad
+            FROM (
+                SELECT fi.producto_id, SUM(fi.cantidad) AS cantidad
+                FROM factura_items fi
+                WHERE fi.factura_id = ANY(v_ids) AND fi.fecha = ANY(v_fechas)
+                GROUP BY fi.producto_id
+            ) d
+            WHERE p.id = d.producto_id;
+
+            -- La fecha acota las particiones que se recorren
+            DELETE FROM factura_items WHERE factura_id = ANY(v_ids) AND fecha = ANY(v_fechas);
+            DELETE FROM facturas WHERE id = ANY(v_ids) AND fecha = ANY(v_fechas);
+            GET DIAGNOSTICS v_borradas = ROW_COUNT;
+
+            RETURN v_borradas;
+        END;
+        $$
+        """,
+        # Reemplazadas por borrar_facturas(); ya no las llama la aplicación
+        "DROP PROCEDURE IF EXISTS borrar_factura(INTEGER)",
+        "DROP PROCEDURE IF EXISTS borrar_items_factura(INTEGER)",
+    )),
+    (9, "Factura completa en un documento JSON (obtener_factura_json)", (
+        """
+        CREATE OR REPLACE FUNCTION obtener_factura_json(p_id INT, p_fecha DATE DEFAULT NULL)
+        RETURNS JSON
+        LANGUAGE plpgsql
+        STABLE
+        AS $$
+        DECLARE
+            v_fecha TIMESTAMP;
+            v_factura JSON;
+        BEGIN
+            -- Con la fecha (día) de la factura solo se lee su partición;
+            -- sin ella se consulta el índice de cada partición
+            IF p_fecha IS NOT NULL THEN
+                SELECT f.fecha INTO v_fecha
+                FROM facturas f
+                WHERE f.id = p_id AND f.fecha >= p_fecha AND f.fecha < p_fecha + 1;
+            ELSE
+                SELECT f.fecha INTO v_fecha
+                FROM facturas f
+                WHERE f.id = p_id;
+            END IF;
+
+            IF v_fecha IS NULL THEN
+                RETURN NULL;
+            END IF;
+
+            -- Cabecera, cliente e ítems en un solo documento. Con la fecha
+            -- exacta se lee una sola partición de facturas y de factura_items.
+            SELECT json_build_object(
+                'id', f.id,
+                'numero', f.numero,
+                'fecha', f.fecha::DATE,
+                'total', f.total,
+                'cliente', json_build_object(
+                    'id', c.id,
+                    'nombre', c.nombre,
+                    'direccion', c.direccion,
+                    'telefono', c.telefono,
+                    'ruc', c.ruc,
+                    'email', c.email
+                ),
+                'items', COALESCE((
+                    SELECT json_agg(json_build_object(
+                        'id', fi.id,
+                        'producto', p.nombre,
+                        'cantidad', fi.cantidad,
+                        'precio', fi.precio,
+                        'subtotal', fi.subtotal
+                    ) ORDER BY fi.id)
+                    FROM factura_items fi
+                    JOIN productos p ON fi.producto_id = p.id
+                    WHERE fi.factura_id = p_id AND fi.fecha = v_fecha
+                ), '[]'::JSON)
+            )
+            INTO v_factura
+            FROM facturas f
+            JOIN clientes c ON f.cliente_id = c.id
+            WHERE f.id = p_id AND f.fecha = v_fecha;
+
+            RETURN v_factura;
+        END;
+        $$
+        """,
+        # Reemplazadas por obtener_factura_json(): la vista leía cabecera e
+        # ítems con dos consultas
+        "DROP FUNCTION IF EXISTS obtener_factura_por_id(INTEGER)",
+        "DROP FUNCTION IF EXISTS obtener_factura_por_id(INTEGER, DATE)",
+        "DROP FUNCTION IF EXISTS obtener_items_factura(INTEGER)",
+        "DROP FUNCTION IF EXISTS obtener_items_factura(INTEGER, DATE)",
+    )),
+    (10, "Validadores HTTP de una factura (obtener_version_factura)", (
+        """
+        CREATE OR REPLACE FUNCTION obtener_version_factura(p_id INT, p_fecha DATE DEFAULT NULL)
+        RETURNS TABLE(
+            version INT,
+            modificada TIMESTAMPTZ,
+            cambios_catalogo BIGINT
+        )
+        LANGUAGE plpgsql
+        STABLE
+        AS $$
+        DECLARE
+            v_cambios BIGINT;
+            v_modificado TIMESTAMPTZ;
+        BEGIN
+            -- Validadores HTTP de la vista de una factura sin leer sus ítems:
+            -- su versión y los cambios en los clientes y productos que muestra
+            SELECT COALESCE(SUM(c.cambios), 0), MAX(c.actualizado_en)
+            INTO v_cambios, v_modificado
+            FROM contadores_cambios c
+            WHERE c.tabla IN ('clientes', 'productos');
+
+            IF p_fecha IS NOT NULL THEN
+                RETURN QUERY
+                SELECT f.version, GREATEST(f.actualizada_en, v_modificado), v_cambios
+                FROM facturas f
+                WHERE f.id = p_id AND f.fecha >= p_fecha AND f.fecha < p_fecha + 1;
+            ELSE
+                RETURN QUERY
+                SELECT f.version, GREATEST(f.actualizada_en, v_modificado), v_cambios
+                FROM facturas f
+                WHERE f.id = p_id;
+            END IF;
+        END;
+        $$
+        """,
+    )),
+    (11, "Número de factura único en todas las particiones", (
+        # facturas está particionada por fecha y sus únicas deben incluirla:
+        # UNIQUE (numero, fecha) admite el mismo número en dos días. Esta
+        # tabla sin particionar hace único el número en toda la tabla.
+        """
+        CREATE TABLE IF NOT EXISTS numeros_factura (
+            numero VARCHAR(20) PRIMARY KEY,
+            factura_id INTEGER NOT NULL,
+            fecha TIMESTAMP NOT NULL
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION registrar_numeros_factura()
+        RETURNS TRIGGER
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            v_nuevas TEXT := 'SELECT numero, id, fecha FROM nuevas';
+            v_anteriores TEXT := 'SELECT numero, id, fecha FROM anteriores';
+        BEGIN
+            -- Trigger por sentencia con tablas de transición, como los de
+            -- ventas diarias. En un UPDATE solo se tocan las facturas cuyo
+            -- número, id o fecha cambió. Un número repetido viola la clave
+            -- primaria de numeros_factura y la sentencia falla.
+            IF TG_OP <> 'INSERT' THEN
+                EXECUTE format(
+                    'DELETE FROM numeros_factura n USING (%s) AS a(numero, id, fecha) WHERE n.numero = a.numero',
+                    CASE TG_OP WHEN 'DELETE' THEN v_anteriores ELSE v_anteriores || ' EXCEPT ' || v_nuevas END
+                );
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                EXECUTE format(
+                    'INSERT INTO numeros_factura (numero, factura_id, fecha) %s',
+                    CASE TG_OP WHEN 'INSERT' THEN v_nuevas ELSE v_nuevas || ' EXCEPT ' || v_anteriores END
+                );
+            END IF;
+            RETURN NULL;
+        END;
+        $$
+        """,
+        # Un solo paso (una transacción) con las escrituras en facturas
+        # bloqueadas: ninguna factura nueva queda fuera de la carga inicial
+        """
+        LOCK TABLE facturas IN SHARE ROW EXCLUSIVE MODE;
+
+        DO $$
+        DECLARE
+            v_repetidos TEXT;
+        BEGIN
+            SELECT string_agg(numero, ', ') INTO v_repetidos
+            FROM (
+                SELECT numero FROM facturas
+                GROUP BY numero
+                HAVING COUNT(*) > 1
+                LIMIT 20
+            ) r;
+            IF v_repetidos IS NOT NULL THEN
+                RAISE EXCEPTION 'Hay facturas con el mismo número: %. Corríjalas antes de migrar.', v_repetidos;
+            END IF;
+        END;
+        $$;
+
+        INSERT INTO numeros_factura (numero, factura_id, fecha)
+        SELECT numero, id, fecha FROM facturas
+        ON CONFLICT (numero) DO NOTHING;
+
+        DROP TRIGGER IF EXISTS facturas_numeros_insert ON facturas;
+        CREATE TRIGGER facturas_numeros_insert
+        AFTER INSERT ON facturas
+        REFERENCING NEW TABLE AS nuevas
+        FOR EACH STATEMENT EXECUTE FUNCTION registrar_numeros_factura();
+
+        DROP TRIGGER IF EXISTS facturas_numeros_update ON facturas;
+        CREATE TRIGGER facturas_numeros_update
+        AFTER UPDATE ON facturas
+        REFERENCING NEW TABLE AS nuevas OLD TABLE AS anteriores
+        FOR EACH STATEMENT EXECUTE FUNCTION registrar_numeros_factura();
+
+        DROP TRIGGER IF EXISTS facturas_numeros_delete ON facturas;
+        CREATE TRIGGER facturas_numeros_delete
+        AFTER DELETE ON facturas
+        REFERENCING OLD TABLE AS anteriores
+        FOR EACH STATEMENT EXECUTE FUNCTION registrar_numeros_factura();
+        """,
+    )),
+    (12, "Factura completa en una sola llamada (crear_factura)", (
+        """
+        CREATE OR REPLACE FUNCTION crear_factura(
+            p_cliente_id INT,
+            p_items JSONB
+        )
+        RETURNS INT
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            v_factura_id INT;
+            v_fecha TIMESTAMP;
+            v_producto_id INT;
+            v_cantidad INT;
+            v_stock INT;
+        BEGIN
+            -- Crea la factura completa en una sola llamada y transacción:
+            -- número, cabecera, items (con precio de catálogo) y stock.
+            IF NOT EXISTS (SELECT 1 FROM clientes WHERE id = p_cliente_id) THEN
+                RAISE EXCEPTION 'El cliente con ID % no existe', p_cliente_id;
+            END IF;
+
+            IF p_items IS NULL OR jsonb_typeof(p_items) <> 'array' OR jsonb_array_length(p_items) = 0 THEN
+                RAISE EXCEPTION 'Una factura debe tener al menos un producto';
+            END IF;
+
+            IF EXISTS (
+                SELECT 1 FROM jsonb_to_recordset(p_items) AS x(producto_id INT, cantidad INT)
+                WHERE x.producto_id IS NULL OR x.cantidad IS NULL OR x.cantidad <= 0
+            ) THEN
+                RAISE EXCEPTION 'Todos los items deben tener producto y una cantidad mayor que cero';
+            END IF;
+
+            -- Bloquear los productos en orden de id (evita deadlocks entre
+            -- facturas concurrentes) y validar existencia y stock de una vez.
+            PERFORM 1 FROM productos
+            WHERE id IN (SELECT x.producto_id FROM jsonb_to_recordset(p_items) AS x(producto_id INT))
+            ORDER BY id
+            FOR UPDATE;
+
+            SELECT pedido.producto_id, pedido.cantidad, p.stock
+            INTO v_producto_id, v_cantidad, v_stock
+            FROM (
+                SELECT x.producto_id, SUM(x.cantidad) AS cantidad
+                FROM jsonb_to_recordset(p_items) AS x(producto_id INT, cantidad INT)
+                GROUP BY x.producto_id
+            ) pedido
+            LEFT JOIN productos p ON p.id = pedido.producto_id
+            WHERE p.id IS NULL OR p.stock < pedido.cantidad
+            ORDER BY pedido.producto_id
+            LIMIT 1;
+
+            IF FOUND THEN
+                IF v_stock IS NULL THEN
+                    RAISE EXCEPTION 'El producto con ID % no existe', v_producto_id;
+                END IF;
+                RAISE EXCEPTION 'La cantidad solicitada (%) excede el stock disponible (%) para el producto ID %',
+                    v_cantidad, v_stock, v_producto_id;
+            END IF;
+
+            -- Cabecera con número de la secuencia y total según el catálogo
+            INSERT INTO facturas (numero, cliente_id, total)
+            SELECT 'FACT-' || nextval('factura_numero_seq'), p_cliente_id, SUM(x.cantidad * p.precio)
+            FROM jsonb_to_recordset(p_items) AS x(producto_id INT, cantidad INT)
+            JOIN productos p ON p.id = x.producto_id
+            RETURNING id, fecha INTO v_factura_id, v_fecha;
+
+            -- Items como conjunto, en el orden en que llegaron
+            INSERT INTO factura_items (factura_id, producto_id, cantidad, precio, subtotal, fecha)
+            SELECT v_factura_id, x.producto_id, x.cantidad, p.precio, x.cantidad * p.precio, v_fecha
+            FROM ROWS FROM (jsonb_to_recordset(p_items) AS (producto_id INT, cantidad INT))
+                 WITH ORDINALITY AS x(producto_id, cantidad, orden)
+            JOIN productos p ON p.id = x.producto_id
+            ORDER BY x.orden;
+
+            -- Descontar stock por producto (las filas ya están bloqueadas)
+            UPDATE productos p
+            SET stock = p.stock - pedido.cantidad
+            FROM (
+                SELECT x.producto_id, SUM(x.cantidad) AS cantidad
+                FROM jsonb_to_recordset(p_items) AS x(producto_id INT, cantidad INT)
+                GROUP BY x.producto_id
+            ) pedido
+            WHERE p.id = pedido.producto_id;
+
+            RETURN v_factura_id;
+        END;
+        $$
+        """,
+    )),
+    (13, "Aviso a los workers cuando cambia el catálogo (notificar_catalogo)", (
+        """
+        CREATE OR REPLACE FUNCTION notificar_catalogo()
+        RETURNS TRIGGER
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            -- Avisa a los workers que el catálogo (clientes o productos) cambió
+            PERFORM pg_notify('catalogo', TG_TABLE_NAME);
+            RETURN NULL;
+        END;
+        $$
+        """,
+        """
+        DROP TRIGGER IF EXISTS clientes_notificar_catalogo ON clientes;
+        CREATE TRIGGER clientes_notificar_catalogo
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON clientes
+        FOR EACH STATEMENT EXECUTE FUNCTION notificar_catalogo()
+        """,
+        # El stock no forma parte del catálogo en caché: solo se avisa cuando
+        # cambian las columnas que se muestran (nombre y precio)
+        """
+        DROP TRIGGER IF EXISTS productos_notificar_catalogo ON productos;
+        CREATE TRIGGER productos_notificar_catalogo
+        AFTER INSERT OR DELETE OR TRUNCATE OR UPDATE OF nombre, precio ON productos
+        FOR EACH STATEMENT EXECUTE FUNCTION notificar_catalogo()
+        """,
+    )),
+    (14, "Búsqueda de productos por nombre con cursor (buscar_productos)", (
+        """
+        CREATE OR REPLACE FUNCTION buscar_productos(
+            p_texto TEXT DEFAULT NULL,
+            p_limite INT DEFAULT 20,
+            p_cursor_nombre TEXT DEFAULT NULL,
+            p_cursor_id INT DEFAULT NULL
+        )
+        RETURNS TABLE(id INT, nombre TEXT, precio NUMERIC, stock INT)
+        LANGUAGE sql
+        STABLE
+        AS $$
+            -- Nombre por trigramas (idx_productos_nombre_trgm); sin texto se
+            -- recorre idx_productos_nombre_id. Cursor sobre (nombre, id).
+            SELECT p.id, p.nombre::TEXT, p.precio, p.stock
+            FROM productos p
+            WHERE (NULLIF(trim(p_texto), '') IS NULL
+                   OR p.nombre ILIKE '%' || replace(replace(replace(trim(p_texto),
+                        '\\', '\\\\'), '%', '\\%'), '_', '\\_') || '%')
+              AND (p_cursor_id IS NULL OR (p.nombre, p.id) > (p_cursor_nombre, p_cursor_id))
+            ORDER BY p.nombre, p.id
+            LIMIT p_limite;
+        $$
+        """,
+    )),
+    (15, "Intentos de login fallidos compartidos entre workers", (
+        """
+        CREATE TABLE IF NOT EXISTS intentos_login (
+            clave TEXT PRIMARY KEY,
+            fallos INTEGER NOT NULL DEFAULT 0,
+            ventana_inicio TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            bloqueado_hasta TIMESTAMP
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION segundos_bloqueo_login(p_claves TEXT[])
+        RETURNS INT
+        LANGUAGE sql
+        STABLE
+        AS $$
+            -- Segundos que faltan para poder intentar de nuevo (0 = permitido)
+            SELECT COALESCE(CEIL(MAX(EXTRACT(EPOCH FROM bloqueado_hasta - CURRENT_TIMESTAMP)))::INT, 0)
+            FROM intentos_login
+            WHERE clave = ANY(p_claves) AND bloqueado_hasta > CURRENT_TIMESTAMP;
+        $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION registrar_fallo_login(
+            p_claves TEXT[],
+            p_max_fallos INT[],
+            p_ventana INT,
+            p_bloqueo INT
+        )
+        RETURNS INT
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            -- Contadores compartidos por todos los workers: uno por clave
+            -- (usuario, IP) con su propio máximo de fallos en la ventana.
+            -- Al llegar al máximo la clave queda bloqueada p_bloqueo segundos.
+            INSERT INTO intentos_login AS i (clave, fallos, ventana_inicio)
+            SELECT clave, 1, CURRENT_TIMESTAMP
+            FROM unnest(p_claves) AS clave
+            ON CONFLICT (clave) DO UPDATE
+            SET fallos = CASE WHEN i.ventana_inicio < CURRENT_TIMESTAMP - make_interval(secs => p_ventana)
+                              THEN 1 ELSE i.fallos + 1 END,
+                ventana_inicio = CASE WHEN i.ventana_inicio < CURRENT_TIMESTAMP - make_interval(secs => p_ventana)
+                                      THEN CURRENT_TIMESTAMP ELSE i.ventana_inicio END;
+
+            UPDATE intentos_login i
+            SET bloqueado_hasta = CURRENT_TIMESTAMP + make_interval(secs => p_bloqueo),
+                fallos = 0,
+                ventana_inicio = CURRENT_TIMESTAMP
+            FROM unnest(p_claves, p_max_fallos) AS m(clave, maximo)
+            WHERE i.clave = m.clave AND i.fallos >= m.maximo;
+
+            -- Limpieza ocasional de contadores vencidos
+            IF random() < 0.01 THEN
+                DELETE FROM intentos_login
+                WHERE ventana_inicio < CURRENT_TIMESTAMP - make_interval(secs => p_ventana)
+                  AND (bloqueado_hasta IS NULL OR bloqueado_hasta < CURRENT_TIMESTAMP);
+            END IF;
+
+            RETURN segundos_bloqueo_login(p_claves);
+        END;
+        $$
+        """,
+    )),
+    (16, "Resúmenes de ventas diarias mantenidos por triggers (panel de ventas)", (
+        """
+        CREATE TABLE IF NOT EXISTS ventas_diarias_producto (
+            dia DATE NOT NULL,
+            producto_id INTEGER NOT NULL REFERENCES productos (id),
+            cantidad BIGINT NOT NULL DEFAULT 0,
+            importe DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, producto_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ventas_diarias_cliente (
+            dia DATE NOT NULL,
+            cliente_id INTEGER NOT NULL REFERENCES clientes (id),
+            facturas INTEGER NOT NULL DEFAULT 0,
+            importe DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, cliente_id)
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION acumular_ventas_producto()
+        RETURNS TRIGGER
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            v_nuevos TEXT := 'SELECT fecha, producto_id, cantidad, subtotal FROM nuevos';
+            v_anteriores TEXT := 'SELECT fecha, producto_id, -cantidad, -subtotal FROM anteriores';
+        BEGIN
+            -- Trigger por sentencia con tablas de transición: las filas
+            -- nuevas suman y las anteriores restan, agrupadas por día y
+            -- producto, con un solo upsert. Las llaves se actualizan en orden
+            -- para que facturas concurrentes no se bloqueen en ciclo.
+            -- (SQL dinámico: cada evento solo tiene sus tablas de transición)
+            EXECUTE format(
+                'INSERT INTO ventas_diarias_producto AS v (dia, producto_id, cantidad, importe)
+                 SELECT d.fecha::DATE, d.producto_id, SUM(d.cantidad), SUM(d.importe)
+                 FROM (%s) AS d(fecha, producto_id, cantidad, importe)
+                 GROUP BY 1, 2
+                 HAVING SUM(d.cantidad) <> 0 OR SUM(d.importe) <> 0
+                 ORDER BY 1, 2
+                 ON CONFLICT (dia, producto_id) DO UPDATE
+                 SET cantidad = v.cantidad + EXCLUDED.cantidad,
+                     importe = v.importe + EXCLUDED.importe',
+                CASE TG_OP
+                    WHEN 'INSERT' THEN v_nuevos
+                    WHEN 'DELETE' THEN v_anteriores
+                    ELSE v_nuevos || ' UNION ALL ' || v_anteriores
+                END
+            );
+            RETURN NULL;
+        END;
+        $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION acumular_ventas_cliente()
+        RETURNS TRIGGER
+        LANGUAGE plpgsql
+        AS $$
+        DECLARE
+            v_nuevas TEXT := 'SELECT fecha, cliente_id, 1, total FROM nuevas';
+            v_anteriores TEXT := 'SELECT fecha, cliente_id, -1, -total FROM anteriores';
+        BEGIN
+            -- Igual que acumular_ventas_producto, por día y cliente
+            EXECUTE format(
+                'INSERT INTO ventas_diarias_cliente AS v (dia, cliente_id, facturas, importe)
+                 SELECT d.fecha::DATE, d.cliente_id, SUM(d.facturas), SUM(d.importe)
+                 FROM (%s) AS d(fecha, cliente_id, facturas, importe)
+                 GROUP BY 1, 2
+                 HAVING SUM(d.facturas) <> 0 OR SUM(d.importe) <> 0
+                 ORDER BY 1, 2
+                 ON CONFLICT (dia, cliente_id) DO UPDATE
+                 SET facturas = v.facturas + EXCLUDED.facturas,
+                     importe = v.importe + EXCLUDED.importe',
+                CASE TG_OP
+                    WHEN 'INSERT' THEN v_nuevas
+                    WHEN 'DELETE' THEN v_anteriores
+                    ELSE v_nuevas || ' UNION ALL ' || v_anteriores
+                END
+            );
+            RETURN NULL;
+        END;
+        $$
+        """,
+        """
+        DROP TRIGGER IF EXISTS factura_items_ventas_insert ON factura_items;
+        CREATE TRIGGER factura_items_ventas_insert
+        AFTER INSERT ON factura_items
+        REFERENCING NEW TABLE AS nuevos
+        FOR EACH STATEMENT EXECUTE FUNCTION acumular_ventas_producto()
+        """,
+        """
+        DROP TRIGGER IF EXISTS factura_items_ventas_update ON factura_items;
+        CREATE TRIGGER factura_items_ventas_update
+        AFTER UPDATE ON factura_items
+        REFERENCING NEW TABLE AS nuevos OLD TABLE AS anteriores
+        FOR EACH STATEMENT EXECUTE FUNCTION acumular_ventas_producto()
+        """,
+        """
+        DROP TRIGGER IF EXISTS factura_items_ventas_delete ON factura_items;
+        CREATE TRIGGER factura_items_ventas_delete
+        AFTER DELETE ON factura_items
+        REFERENCING OLD TABLE AS anteriores
+        FOR EACH STATEMENT EXECUTE FUNCTION acumular_ventas_producto()
+        """,
+        """
+        DROP TRIGGER IF EXISTS facturas_ventas_insert ON facturas;
+        CREATE TRIGGER facturas_ventas_insert
+        AFTER INSERT ON facturas
+        REFERENCING NEW TABLE AS nuevas
+        FOR EACH STATEMENT EXECUTE FUNCTION acumular_ventas_cliente()
+        """,
+        """
+        DROP TRIGGER IF EXISTS facturas_ventas_update ON facturas;
+        CREATE TRIGGER facturas_ventas_update
+        AFTER UPDATE ON facturas
+        REFERENCING NEW TABLE AS nuevas OLD TABLE AS anteriores
+        FOR EACH STATEMENT EXECUTE FUNCTION acumular_ventas_cliente()
+        """,
+        """
+        DROP TRIGGER IF EXISTS facturas_ventas_delete ON facturas;
+        CREATE TRIGGER facturas_ventas_delete
+        AFTER DELETE ON facturas
+        REFERENCING OLD TABLE AS anteriores
+        FOR EACH STATEMENT EXECUTE FUNCTION acumular_ventas_cliente()
+        """,
+        """
+        CREATE OR REPLACE FUNCTION recalcular_ventas_diarias()
+        RETURNS VOID
+        LANGUAGE plpgsql
+        AS $$
+        BEGIN
+            -- Reconstruye los resúmenes desde cero (carga inicial o reparación)
+            LOCK TABLE facturas, factura_items IN SHARE MODE;
+
+            TRUNCATE ventas_diarias_producto, ventas_diarias_cliente;
+
+            INSERT INTO ventas_diarias_producto (dia, producto_id, cantidad, importe)
+            SELECT fecha::DATE, producto_id, SUM(cantidad), SUM(subtotal)
+            FROM factura_items
+            GROUP BY 1, 2;
+
+            INSERT INTO ventas_diarias_cliente (dia, cliente_id, facturas, importe)
+            SELECT fecha::DATE, cliente_id, COUNT(*), SUM(total)
+            FROM facturas
+            GROUP BY 1, 2;
+        END;
+        $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION dashboard_ventas_por_dia(p_desde DATE, p_hasta DATE)
+        RETURNS TABLE(dia DATE, facturas BIGINT, importe NUMERIC)
+        LANGUAGE sql
+        STABLE
+        AS $$
+            SELECT v.dia, SUM(v.facturas)::BIGINT, SUM(v.importe)
+            FROM ventas_diarias_cliente v
+            WHERE v.dia BETWEEN p_desde AND p_hasta
+            GROUP BY v.dia
+            HAVING SUM(v.facturas) > 0
+            ORDER BY v.dia;
+        $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION dashboard_top_productos(p_desde DATE, p_hasta DATE, p_limite INT DEFAULT 10)
+        RETURNS TABLE(id INT, nombre TEXT, cantidad BIGINT, importe NUMERIC)
+        LANGUAGE sql
+        STABLE
+        AS $$
+            SELECT p.id, p.nombre::TEXT, t.cantidad, t.importe
+            FROM (
+                SELECT v.producto_id, SUM(v.cantidad)::BIGINT AS cantidad, SUM(v.importe) AS importe
+                FROM ventas_diarias_producto v
+                WHERE v.dia BETWEEN p_desde AND p_hasta
+                GROUP BY v.producto_id
+                HAVING SUM(v.cantidad) > 0
+                ORDER BY importe DESC, v.producto_id
+                LIMIT p_limite
+            ) t
+            JOIN productos p ON p.id = t.producto_id
+            ORDER BY t.importe DESC, p.id;
+        $$
+        """,
+        """
+        CREATE OR REPLACE FUNCTION dashboard_top_clientes(p_desde DATE, p_hasta DATE, p_limite INT DEFAULT 10)
+        RETURNS TABLE(id INT, nombre TEXT, facturas BIGINT, importe NUMERIC)
+        LANGUAGE sql
+        STABLE
+        AS $$
+            SELECT c.id, c.nombre::TEXT, t.facturas, t.importe
+            FROM (
+                SELECT v.cliente_id, SUM(v.facturas)::BIGINT AS facturas, SUM(v.importe) AS importe
+                FROM ventas_diarias_cliente v
+                WHERE v.dia BETWEEN p_desde AND p_hasta
+                GROUP BY v.cliente_id
+                HAVING SUM(v.facturas) > 0
+                ORDER BY importe DESC, v.cliente_id
+                LIMIT p_limite
+            ) t
+            JOIN clientes c ON c.id = t.cliente_id
+            ORDER BY t.importe DESC, c.id;
+        $$
+        """,
+        # Carga inicial desde las facturas existentes
+        "SELECT recalcular_ventas_diarias()",
+    )),
+)
+
+def _plan(cur, consulta, parametros):
+    cur.execute("EXPLAIN (FORMAT JSON) " + consulta, parametros)
+    return cur.fetchone()[0][0]['Plan']
+
+
+def _listado(**filtros):
+    """Plan del SQL que arma obtener_facturas() con estos filtros.
+
+    `filtros` asocia argumentos de la función (sin el prefijo p_) con claves
+    de los datos de verificación. El SQL se prepara y se explica su EXECUTE
+    con los mismos parámetros que pasa la función en su USING.
+    """
+    def plan(cur, datos):
+        argumentos = dict.fromkeys(('cursor_fecha', 'cursor_id', 'numero', 'cliente', 'desde', 'hasta'))
+        argumentos.update({argumento: datos[clave] for argumento, clave in filtros.items()}, limite=51)
+        cur.execute("""SELECT consulta_obtener_facturas(%(limite)s, %(cursor_fecha)s, %(cursor_id)s, FALSE,
+                                                        %(numero)s, %(cliente)s, %(desde)s, %(hasta)s)""",
+                    argumentos)
+        cur.execute("PREPARE verificar_listado (INT, TIMESTAMP, INT, TEXT, TEXT, DATE, DATE) AS "
+                    + cur.fetchone()[0])
+        try:
+            return _plan(cur, """EXECUTE verificar_listado(%(limite)s, %(cursor_fecha)s, %(cursor_id)s,
+                                     %(numero)s || '%%', '%%' || %(cliente)s || '%%', %(desde)s, %(hasta)s)""",
+                         argumentos)
+        finally:
+            cur.execute("DEALLOCATE verificar_listado")
+    return plan
+
+
+def _exportacion(tipo, **filtros):
+    """Plan de la consulta de exportar.py, declarada como cursor igual que al exportar."""
+    def plan(cur, datos):
+        consulta, valores = consulta_exportacion(tipo, **{f: datos[clave] for f, clave in filtros.items()})
+        return _plan(cur, "DECLARE verificar_exportacion CURSOR FOR " + consulta, valores)
+    return plan
+
+
+# Consultas frecuentes de la aplicación y los índices que pueden usar:
+# (descripción, consulta, índices esperados). Las consultas salen de las
+# funciones que usa la aplicación: el SQL que arma obtener_facturas(), las
+# funciones SQL de búsqueda (PostgreSQL las expande en la consulta) y las de
+# exportar.py. Las que están dentro de funciones PL/pgSQL se copian tal cual.
+# Los parámetros salen de los datos existentes (ver DATOS_VERIFICACION).
+CONSULTAS_VERIFICACION = (
+    ("Listado de facturas (obtener_facturas)",
+     _listado(),
+     ('idx_facturas_fecha_id',)),
+    ("Siguiente página del listado (obtener_facturas con cursor)",
+     _listado(cursor_fecha='fecha', cursor_id='factura_id'),
+     ('idx_facturas_fecha_id',)),
+    ("Listado por rango de fechas (obtener_facturas)",
+     _listado(desde='dia', hasta='dia'),
+     ('idx_facturas_fecha_id',)),
+    ("Búsqueda por número de factura (obtener_facturas)",
+     _listado(numero='numero'),
+     ('idx_facturas_numero_patron',)),
+    ("Exportación de un cliente (exportar.py)",
+     _exportacion('facturas', cliente_id='cliente_id'),
+     ('idx_facturas_cliente_fecha',)),
+    ("Ítems de una factura (obtener_factura_json)",
+     """SELECT fi.id FROM factura_items fi
+        JOIN productos p ON fi.producto_id = p.id
+        WHERE fi.factura_id = %(factura_id)s AND fi.fecha = %(fecha)s""",
+     ('idx_factura_items_factura',)),
+    ("Ítems de un producto (clave foránea de productos)",
+     # La consulta que hace PostgreSQL al borrar un producto
+     "SELECT 1 FROM factura_items x WHERE %(producto_id)s OPERATOR(pg_catalog.=) producto_id FOR KEY SHARE OF x",
+     ('idx_factura_items_producto',)),
+    ("Producto por nombre (registrar_producto)",
+     "SELECT 1 FROM productos WHERE LOWER(TRIM(nombre)) = LOWER(TRIM(%(producto)s))",
+     ('idx_productos_nombre_unico',)),
+    ("Catálogo de productos (buscar_productos)",
+     "SELECT * FROM buscar_productos(NULL, 20, NULL, NULL)",
+     ('idx_productos_nombre_id',)),
+    ("Catálogo de clientes (buscar_clientes_por_nombre)",
+     "SELECT * FROM buscar_clientes_por_nombre(NULL, 20, NULL, NULL)",
+     ('idx_clientes_nombre_id',)),
+    ("Cliente por prefijo de RUC (buscar_clientes_por_ruc)",
+     "SELECT * FROM buscar_clientes_por_ruc(%(ruc)s, 20, NULL, NULL)",
+     # Con collation C el índice único de ruc también sirve para LIKE
+     ('idx_clientes_ruc_patron', 'clientes_ruc_key')),
+)
+
+DATOS_VERIFICACION = """
+    SELECT f.id, f.fecha, f.fecha::DATE, f.cliente_id, f.numero,
+           fi.producto_id, p.nombre, LEFT(c.ruc, 10)
+    FROM facturas f
+    JOIN factura_items fi ON fi.factura_id = f.id AND fi.fecha = f.fecha
+    JOIN productos p ON p.id = fi.producto_id
+    JOIN clientes c ON c.id = f.cliente_id
+    ORDER BY f.fecha DESC, f.id DESC
+    LIMIT 1
+"""
+
+# Datos de prueba para --sembrar: %(facturas)s facturas de los últimos 12
+# meses con 3 ítems cada una, sobre clientes y productos nuevos
+SEMBRAR = (
+    """INSERT INTO clientes (ruc, nombre)
+       SELECT '9' || LPAD(g::TEXT, 10, '0'), 'CLIENTE PRUEBA ' || g
+       FROM generate_series(1, GREATEST(%(facturas)s / 20, 100)) g
+       ON CONFLICT DO NOTHING""",
+    """INSERT INTO productos (nombre, precio, stock)
+       SELECT 'Producto prueba ' || g, 1 + g %% 100, 1000
+       FROM generate_series(1, 1000) g
+       ON CONFLICT DO NOTHING""",
+    """INSERT INTO facturas (numero, fecha, cliente_id, total)
+       SELECT 'PRUEBA-' || g,
+              date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
+                  - (%(facturas)s + 1 - g) * INTERVAL '365 days' / %(facturas)s,
+              c.ids[1 + g %% array_length(c.ids, 1)], 0
+       FROM generate_series(1, %(facturas)s) g,
+            (SELECT array_agg(id) AS ids FROM clientes WHERE nombre LIKE 'CLIENTE PRUEBA %%') c""",
+    """INSERT INTO factura_items (factura_id, producto_id, cantidad, precio, subtotal, fecha)
+       SELECT f.id, p.ids[1 + (f.id * 7 + n) %% array_length(p.ids, 1)], n, 10, 10 * n, f.fecha
+       FROM facturas f
+       CROSS JOIN generate_series(1, 3) n,
+            (SELECT array_agg(id) AS ids FROM productos WHERE nombre LIKE 'Producto prueba %%') p
+       WHERE f.numero LIKE 'PRUEBA-%%'""",
+    "ANALYZE clientes, productos, facturas, factura_items",
+)
+
+
+def _tabla_migraciones(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migraciones (
+            version INTEGER PRIMARY KEY,
+            descripcion TEXT NOT NULL,
+            aplicada_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            segundos NUMERIC(10, 3) NOT NULL
+        )
+    """)
+
+
+def _indice_valido(cur, nombre):
+    # True/False según el índice sea válido, o None si no existe
+    cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (nombre,))
+    fila = cur.fetchone()
+    return fila[0] if fila else None
+
+
+def _crear_indice_simple(cur, nombre, tabla, columnas, unico):
+    valido = _indice_valido(cur, nombre)
+    if valido:
+        return False
+    if valido is not None:
+        # Un CREATE INDEX CONCURRENTLY interrumpido deja el índice inválido
+        cur.execute('DROP INDEX CONCURRENTLY "%s"' % nombre)
+    cur.execute('CREATE %sINDEX CONCURRENTLY "%s" ON "%s" (%s)'
+                % ('UNIQUE ' if unico else '', nombre, tabla, columnas))
+    return True
+
+
+def _crear_indice(cur, nombre, tabla, columnas, unico):
+    """Crea el índice sin bloquear escrituras. Devuelve True si lo creó.
+
+    En tablas particionadas PostgreSQL no admite CONCURRENTLY: se crea el
+    índice solo en la tabla padre (inválido), se construye concurrentemente
+    en cada partición y se adjunta; al adjuntar la última queda válido.
+    """
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (tabla,))
+    if cur.fetchone()[0] != 'p':
+        return _crear_indice_simple(cur, nombre, tabla, columnas, unico)
+
+    valido = _indice_valido(cur, nombre)
+    if valido:
+        return False
+    if valido is None:
+        cur.execute('CREATE %sINDEX "%s" ON ONLY "%s" (%s)'
+                    % ('UNIQUE ' if unico else '', nombre, tabla, columnas))
+
+    # Particiones que todavía no tienen el índice adjunto
+    cur.execute("""
+        SELECT t.relname
+        FROM pg_inherits h
+        JOIN pg_class t ON t.oid = h.inhrelid
+        WHERE h.inhparent = to_regclass(%s)
+          AND NOT EXISTS (
+              SELECT 1
+              FROM pg_inherits hi
+              JOIN pg_index i ON i.indexrelid = hi.inhrelid
+              WHERE hi.inhparent = to_regclass(%s) AND i.indrelid = t.oid
+          )
+        ORDER BY t.relname
+    """, (tabla, nombre))
+    for (particion,) in cur.fetchall():
+        sufijo = particion[len(tabla) + 1:] if particion.startswith(tabla + '_') else particion
+        indice_particion = '%s_%s' % (nombre, sufijo)
+        _crear_indice_simple(cur, indice_particion, particion, columnas, unico)
+        cur.execute('ALTER INDEX "%s" ATTACH PARTITION "%s"' % (nombre, indice_particion))
+    return True
+
+
+def pendientes(conn):
+    """Migraciones aún no aplicadas, en orden."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migraciones') IS NOT NULL")
+        aplicadas = set()
+        if cur.fetchone()[0]:
+            cur.execute("SELECT version FROM schema_migraciones")
+            aplicadas = {version for (version,) in cur.fetchall()}
+    conn.rollback()
+    return [m for m in MIGRACIONES if m[0] not in aplicadas]
+
+
+def aplicar_migraciones(conn, hasta=None, salida=print):
+    """Aplica en orden las migraciones pendientes (hasta la versión `hasta`).
+
+    Usa autocommit, necesario para CREATE INDEX CONCURRENTLY, y un lock de
+    sesión para que dos procesos no migren a la vez. Devuelve las versiones
+    aplicadas.
+    """
+    autocommit = conn.autocommit
+    conn.commit()
+    conn.autocommit = True
+    aplicadas = []
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(hashtext('schema_migraciones'))")
+            try:
+                _tabla_migraciones(cur)
+                for version, descripcion, pasos in pendientes(conn):
+                    if hasta is not None and version > hasta:
+                        break
+                    salida(f"Aplicando migración {version}: {descripcion}")
+                    inicio = time.monotonic()
+                    for paso in pasos:
+                        if isinstance(paso, str):
+                            cur.execute(paso)
+                        elif _crear_indice(cur, *paso):
+                            salida(f"  índice {paso[0]} creado en {paso[1]}")
+                        else:
+                            salida(f"  índice {paso[0]} ya existía")
+                    cur.execute(
+                        "INSERT INTO schema_migraciones (version, descripcion, segundos) VALUES (%s, %s, %s)",
+                        (version, descripcion, round(time.monotonic() - inicio, 3))
+                    )
+                    aplicadas.append(version)
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(hashtext('schema_migraciones'))")
+    finally:
+        conn.autocommit = autocommit
+    return aplicadas
+
+
+def crear_particiones(conn, meses, salida=print):
+    """Crea las particiones mensuales de facturas que falten, desde este mes
+    hasta `meses` meses después. Devuelve cuántas creó.
+
+    Se ejecuta a diario fuera de la aplicación (cron o similar); es
+    idempotente y puede correr con la aplicación en marcha.
+    """
+    avisos = len(conn.notices)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT crear_particiones_facturas(CURRENT_DATE, %s)", (meses,))
+            creadas = cur.fetchone()[0]
+        conn.commit()
+    finally:
+        # Meses que no se pudieron crear porque la partición por defecto tiene filas
+        for aviso in conn.notices[avisos:]:
+            salida(aviso.strip())
+    return creadas
+
+
+def _indices_del_plan(plan, encontrados):
+    if 'Index Name' in plan:
+        encontrados.add(plan['Index Name'])
+    for hijo in plan.get('Plans', ()):
+        _indices_del_plan(hijo, encontrados)
+    return encontrados
+
+
+def _indice_raiz(cur, nombre):
+    # Los planes sobre particiones nombran el índice de cada partición
+    cur.execute("""
+        WITH RECURSIVE padres(oid) AS (
+            SELECT to_regclass(%s)::OID
+            UNION ALL
+            SELECT h.inhparent FROM pg_inherits h JOIN padres p ON h.inhrelid = p.oid
+        )
+        SELECT p.oid::regclass::TEXT
+        FROM padres p
+        WHERE NOT EXISTS (SELECT 1 FROM pg_inherits h WHERE h.inhrelid = p.oid)
+    """, (nombre,))
+    fila = cur.fetchone()
+    return fila[0] if fila else nombre
+
+
+def verificar_indices(conn, sembrar=0, salida=print):
+    """Ejecuta EXPLAIN sobre las consultas frecuentes y comprueba que usen sus índices.
+
+    Con `sembrar` se insertan antes esa cantidad de facturas de prueba. Todo
+    ocurre en una transacción que se deshace al terminar. Devuelve la lista de
+    consultas que no usan el índice esperado.
+    """
+    fallidas = []
+    try:
+        with conn.cursor() as cur:
+            if sembrar:
+                inicio = time.monotonic()
+                for sentencia in SEMBRAR:
+                    cur.execute(sentencia, {'facturas': sembrar})
+                salida(f"Datos de prueba: {sembrar} facturas ({time.monotonic() - inicio:.1f}s)")
+
+            cur.execute(DATOS_VERIFICACION)
+            fila = cur.fetchone()
+            if not fila:
+                raise RuntimeError("No hay facturas con ítems; use --sembrar para generar datos de prueba.")
+            datos = dict(zip(('factura_id', 'fecha', 'dia', 'cliente_id', 'numero', 'producto_id', 'producto', 'ruc'),
+                             fila))
+
+            for descripcion, consulta, esperados in CONSULTAS_VERIFICACION:
+                plan = consulta(cur, datos) if callable(consulta) else _plan(cur, consulta, datos)
+                usados = sorted({_indice_raiz(cur, i) for i in _indices_del_plan(plan, set())})
+                correcto = any(indice in usados for indice in esperados)
+                if not correcto:
+                    fallidas.append(descripcion)
+                salida(f"{'OK   ' if correcto else 'FALTA'} {descripcion}: espera {esperados[0]}, "
+                       f"usa {', '.join(usados) or 'ningún índice'} (costo {plan['Total Cost']})")
+    finally:
+        conn.rollback()
+    return fallidas
+
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Migraciones del esquema de la base de datos.")
+    subcomandos = parser.add_subparsers(dest='comando')
+    aplicar = subcomandos.add_parser('aplicar', help="Aplica las migraciones pendientes (por defecto)")
+    aplicar.add_argument('--hasta', type=int, help="Aplica solo hasta esta versión")
+    subcomandos.add_parser('estado', help="Muestra las migraciones aplicadas y pendientes")
+    verificar = subcomandos.add_parser('verificar', help="Comprueba con EXPLAIN que las consultas usen los índices")
+    verificar.add_argument('--sembrar', type=int, default=0, metavar='FACTURAS',
+                           help="Genera antes esta cantidad de facturas de prueba (se deshacen al terminar)")
+    particiones = subcomandos.add_parser('particiones', help="Crea las particiones de facturas de los próximos meses")
+    particiones.add_argument('--meses', type=int, default=int(os.environ.get("PARTICIONES_MESES_ADELANTE", 3)),
+                             help="Meses futuros con partición (por defecto PARTICIONES_MESES_ADELANTE o 3)")
+    args = parser.parse_args(argv)
+
+    db_config = {
+        'host': os.environ["DB_HOST"],
+        'port': os.environ["DB_PORT"],
+        'database': os.environ["DB_NAME"],
+        'user': os.environ["DB_USER"],
+        'password': os.environ["DB_PASSWORD"]
+    }
+
+    conn = psycopg2.connect(**db_config)
+    try:
+        if args.comando == 'estado':
+            por_aplicar = pendientes(conn)
+            for version, descripcion, _ in MIGRACIONES:
+                estado = "pendiente" if any(m[0] == version for m in por_aplicar) else "aplicada"
+                print(f"{version:>4}  {estado:<9}  {descripcion}")
+            return 1 if por_aplicar else 0
+        if args.comando == 'verificar':
+            fallidas = verificar_indices(conn, args.sembrar)
+            return 1 if fallidas else 0
+        if args.comando == 'particiones':
+            creadas = crear_particiones(conn, args.meses)
+            print(f"Particiones de facturas creadas: {creadas}")
+            return 0
+
+        aplicadas = aplicar_migraciones(conn, getattr(args, 'hasta', None))
+        print(f"Migraciones aplicadas: {len(aplicadas)}" if aplicadas else "El esquema está al día.")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import tempfile
+import zipfile
+from io import BytesIO
+
+from pypdf import PdfWriter
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
+
+
+# Estilos, paleta y medidas: se construyen una sola vez al importar el módulo
+# y se reutilizan en cada PDF (no se modifica la hoja de estilos compartida).
+AZUL_OSCURO = colors.HexColor("#2c3e50")
+BLANCO = colors.white
+GRIS_CLARO = colors.HexColor("#f4f4f4")
+
+_ESTILOS = getSampleStyleSheet()
+ESTILO_TITULO = ParagraphStyle('TituloFactura', parent=_ESTILOS['Title'], textColor=AZUL_OSCURO)
+ESTILO_NORMAL = _ESTILOS['Normal']
+
+# Ancho útil de una página carta con los márgenes por defecto
+ANCHO_UTIL = SimpleDocTemplate(BytesIO(), pagesize=letter).width
+ANCHOS_INFO = [100, 300]
+ANCHOS_CUATRO_COLUMNAS = [ANCHO_UTIL / 4.0] * 4
+
+ESTILO_TABLA_INFO = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), AZUL_OSCURO),
+    ('TEXTCOLOR', (0, 0), (-1, 0), BLANCO),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('BACKGROUND', (0, 1), (-1, -1), GRIS_CLARO),
+    ('GRID', (0, 0), (-1, -1), 0.5, AZUL_OSCURO),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+])
+
+ESTILO_TABLA_ITEMS = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), AZUL_OSCURO),
+    ('TEXTCOLOR', (0, 0), (-1, 0), BLANCO),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('ALIGN', (0, 1), (-1, -1), 'CENTER'),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.whitesmoke),
+    ('GRID', (0, 0), (-1, -1), 0.5, AZUL_OSCURO),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+])
+
+ESTILO_TABLA_TOTAL = TableStyle([
+    ('BACKGROUND', (2, 0), (3, 0), AZUL_OSCURO),
+    ('TEXTCOLOR', (2, 0), (3, 0), BLANCO),
+    ('FONTNAME', (2, 0), (3, 0), 'Helvetica-Bold'),
+    ('ALIGN', (2, 0), (3, 0), 'RIGHT'),
+    ('GRID', (2, 0), (3, 0), 0.5, AZUL_OSCURO),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 10),
+])
+
+
+def generar_pdf_factura(factura):
+    """Genera el PDF de una factura y devuelve sus bytes.
+
+    `factura` es el documento de obtener_factura_json() ya decodificado
+    (cabecera, `cliente` e `items`).
+    """
+    pdf_buffer = BytesIO()
+    doc = SimpleDocTemplate(pdf_buffer, pagesize=letter)
+    elements = []
+
+    elements.append(Paragraph(f"<b>Factura #{factura['numero']}</b>", ESTILO_TITULO))
+
+    # Datos de factura
+    cliente = factura['cliente']
+    factura_info = [
+        ["Fecha:", str(factura['fecha'])],
+        ["Cliente:", cliente['nombre']],
+        ["Dirección:", cliente['direccion']],
+        ["Teléfono:", cliente['telefono']],
+        ["RUC:", cliente['ruc']],
+        ["Email:", cliente['email']],
+    ]
+
+    table_factura_info = Table(factura_info, hAlign='LEFT', colWidths=ANCHOS_INFO)
+    table_factura_info.setStyle(ESTILO_TABLA_INFO)
+    elements.append(table_factura_info)
+    elements.append(Paragraph("<br/><br/>", ESTILO_NORMAL))
+
+    # Ítems
+    items_data = [["Producto", "Cantidad", "Precio Unitario", "Subtotal"]]
+    for item in factura['items']:
+        items_data.append([
+            item['producto'],
+            item['cantidad'],
+            f"S/.{item['precio']:.2f}",
+            f"S/.{item['subtotal']:.2f}"
+        ])
+
+    table_items = Table(items_data, colWidths=ANCHOS_CUATRO_COLUMNAS, hAlign='LEFT')
+    table_items.setStyle(ESTILO_TABLA_ITEMS)
+    elements.append(table_items)
+    elements.append(Paragraph("<br/><br/>", ESTILO_NORMAL))
+
+    # Total
+    total_data = [["", "", "Total:", f"S/.{factura['total']:.2f}"]]
+    table_total = Table(total_data, colWidths=ANCHOS_CUATRO_COLUMNAS, hAlign='LEFT')
+    table_total.setStyle(ESTILO_TABLA_TOTAL)
+    elements.append(table_total)
+
+    doc.build(elements)
+    return pdf_buffer.getvalue()
+
+
+class _FlujoZip:
+    """Destino de escritura no posicionable para ZipFile: acumula lo escrito
+    hasta que se vacía, de modo que el ZIP puede enviarse por partes."""
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+def zip_en_flujo(archivos):
+    """Genera un ZIP por partes a partir de pares (nombre, bytes).
+
+    Cada archivo se emite en cuanto se agrega, así la memoria usada no
+    depende de la cantidad de archivos.
+    """
+    flujo = _FlujoZip()
+    with zipfile.ZipFile(flujo, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for nombre, datos in archivos:
+            zf.writestr(nombre, datos)
+            parte = flujo.vaciar()
+            if parte:
+                yield parte
+    # Directorio central del ZIP
+    yield flujo.vaciar()
+
+
+def pdf_unido_en_flujo(archivos, tamano_parte=64 * 1024):
+    """Une varios PDFs en uno solo y lo emite por partes.
+
+    El formato PDF necesita la tabla de referencias al final, por lo que el
+    documento unido se arma completo (en un archivo temporal si es grande)
+    antes de empezar a enviarlo.
+    """
+    writer = PdfWriter()
+    for _, datos in archivos:
+        writer.append(BytesIO(datos))
+
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as salida:
+        writer.write(salida)
+        writer.close()
+        salida.seek(0)
+        while True:
+            parte = salida.read(tamano_parte)
+            if not parte:
+                break
+            yield parte
@@ -0,0 +1,112 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class ColaLlena(Exception):
+    """Hay demasiados trabajos de render pendientes; se rechaza el nuevo."""
+
+
+class PoolRender:
+    """Pool de procesos acotado para trabajos CPU intensivos (PDFs).
+
+    Admite como máximo `procesos + max_cola` trabajos en vuelo; si no hay
+    cupo en `timeout` segundos se lanza ColaLlena, así una ráfaga de
+    descargas no acapara los workers web. Lleva métricas de la cola.
+    """
+
+    def __init__(self, procesos=2, max_cola=8, timeout=5.0):
+        self.procesos = procesos
+        self.max_cola = max_cola
+        self.timeout = timeout
+        self._executor = self._crear_executor()
+        self._cupos = threading.BoundedSemaphore(procesos + max_cola)
+        self._lock = threading.Lock()
+
+        self._en_vuelo = 0
+        self._en_vuelo_max = 0
+        self._completados = 0
+        self._fallidos = 0
+        self._rechazados = 0
+        self._tiempo_total = 0.0
+        self._tiempo_max = 0.0
+
+    def _crear_executor(self):
+        return ProcessPoolExecutor(
+            max_workers=self.procesos,
+            # "spawn": los procesos no heredan conexiones ni hilos del worker web
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+
+    def enviar(self, funcion, *args, timeout=-1):
+        """Encola `funcion(*args)` y devuelve su Future.
+
+        timeout=-1 usa el timeout del pool; None espera cupo indefinidamente.
+        """
+        if timeout == -1:
+            timeout = self.timeout
+        if not self._cupos.acquire(timeout=timeout):
+            with self._lock:
+                self._rechazados += 1
+            raise ColaLlena(
+                "Hay %s trabajos de render en curso o en cola" % (self.procesos + self.max_cola)
+            )
+
+        inicio = time.monotonic()
+        with self._lock:
+            self._en_vuelo += 1
+            self._en_vuelo_max = max(self._en_vuelo_max, self._en_vuelo)
+
+        def terminado(futuro):
+            duracion = time.monotonic() - inicio
+            with self._lock:
+                self._en_vuelo -= 1
+                if futuro.exception() is None:
+                    self._completados += 1
+                else:
+                    self._fallidos += 1
+                self._tiempo_total += duracion
+                self._tiempo_max = max(self._tiempo_max, duracion)
+            self._cupos.release()
+
+        try:
+            try:
+                futuro = self._executor.submit(funcion, *args)
+            except BrokenProcessPool:
+                # Un proceso murió (p. ej. por memoria): se recrea el pool
+                with self._lock:
+                    self._executor = self._crear_executor()
+                futuro = self._executor.submit(funcion, *args)
+        except Exception:
+            with self._lock:
+                self._en_vuelo -= 1
+            self._cupos.release()
+            raise
+        futuro.add_done_callback(terminado)
+        return futuro
+
+    def ejecutar(self, funcion, *args):
+        """Ejecuta `funcion(*args)` en el pool y espera el resultado."""
+        return self.enviar(funcion, *args).result()
+
+    def cerrar(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def estadisticas(self):
+        with self._lock:
+            terminados = self._completados + self._fallidos
+            return {
+                'procesos': self.procesos,
+                'max_cola': self.max_cola,
+                'en_vuelo': self._en_vuelo,
+                'en_ejecucion': min(self._en_vuelo, self.procesos),
+                'en_cola': max(0, self._en_vuelo - self.procesos),
+                'en_vuelo_max': self._en_vuelo_max,
+                'completados': self._completados,
+                'fallidos': self._fallidos,
+                'rechazados': self._rechazados,
+                'tiempo_promedio_ms': round(self._tiempo_total * 1000 / terminados, 3) if terminados else 0.0,
+                'tiempo_max_ms': round(self._tiempo_max * 1000, 3),
+            }
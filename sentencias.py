@@ -0,0 +1,125 @@
+import re
+import threading
+import time
+
+from psycopg2 import extensions
+
+
+# Registro de sentencias frecuentes: nombre -> (tipos de los parámetros, SQL).
+# El SQL usa %s como cualquier consulta de psycopg2; al preparar se cambia
+# por $1, $2, ... Los nombres son identificadores SQL (PREPARE <nombre>).
+SENTENCIAS = {
+    # Como texto: el JSON se decodifica en la aplicación con los montos como Decimal
+    'factura_json': (
+        ('INT', 'DATE'),
+        'SELECT obtener_factura_json(%s, %s)::TEXT',
+    ),
+    'version_factura': (
+        ('INT', 'DATE'),
+        'SELECT * FROM obtener_version_factura(%s, %s)',
+    ),
+    # Cambia con cualquier escritura en facturas o en los clientes que muestra el listado
+    'version_facturas': (
+        (),
+        """SELECT COALESCE(SUM(cambios), 0), MAX(actualizado_en)
+           FROM contadores_cambios
+           WHERE tabla IN ('facturas', 'clientes')""",
+    ),
+    # Solo para enlaces sin la fecha de la factura: la busca en cada partición
+    'fecha_factura': (
+        ('INT',),
+        'SELECT fecha::DATE FROM facturas WHERE id = %s',
+    ),
+    # (id, día, día): con el día se lee una sola partición
+    'factura_edicion': (
+        ('INT', 'DATE', 'DATE'),
+        """SELECT f.id, f.cliente_id, f.total, f.numero, c.nombre, f.fecha
+           FROM facturas f
+           JOIN clientes c ON c.id = f.cliente_id
+           WHERE f.id = %s AND f.fecha >= %s AND f.fecha < %s::DATE + 1""",
+    ),
+    # (id, fecha exacta de la factura)
+    'items_edicion': (
+        ('INT', 'TIMESTAMP'),
+        """SELECT fi.id, fi.producto_id, p.nombre, fi.cantidad, fi.precio, fi.subtotal
+           FROM factura_items fi
+           JOIN productos p ON fi.producto_id = p.id
+           WHERE fi.factura_id = %s AND fi.fecha = %s
+           ORDER BY fi.id""",
+    ),
+    'buscar_clientes': (
+        ('TEXT', 'INT', 'TEXT', 'INT'),
+        'SELECT * FROM buscar_clientes(%s, %s, %s, %s)',
+    ),
+    'buscar_productos': (
+        ('TEXT', 'INT', 'TEXT', 'INT'),
+        'SELECT * FROM buscar_productos(%s, %s, %s, %s)',
+    ),
+}
+
+
+class _Contadores:
+    # Preparaciones y ejecuciones por sentencia, sumadas en todas las conexiones
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datos = {nombre: [0, 0, 0.0] for nombre in SENTENCIAS}   # [preparadas, ejecuciones, segundos]
+
+    def sumar(self, nombre, preparada, duracion):
+        with self._lock:
+            datos = self._datos[nombre]
+            datos[0] += preparada
+            datos[1] += 1
+            datos[2] += duracion
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                nombre: {
+                    'preparadas': preparadas,
+                    'ejecuciones': ejecuciones,
+                    # Cada ejecución tras la primera en una conexión se ahorra el parseo y análisis
+                    'reutilizadas': ejecuciones - preparadas,
+                    'tiempo_promedio_ms': round(segundos * 1000 / ejecuciones, 3) if ejecuciones else 0.0,
+                }
+                for nombre, (preparadas, ejecuciones, segundos) in self._datos.items()
+            }
+
+
+contadores = _Contadores()
+
+
+class ConexionPreparada(extensions.connection):
+    """Conexión que prepara cada sentencia del registro la primera vez que se usa.
+
+    Las sentencias preparadas viven lo que la sesión de PostgreSQL, así que
+    con conexiones de larga vida (el pool) cada una se prepara una sola vez
+    por conexión y después se ejecuta con EXECUTE. PREPARE no es
+    transaccional: sobrevive a los rollback.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.preparadas = set()
+
+
+def ejecutar(cur, nombre, params=()):
+    """Ejecuta la sentencia `nombre` del registro en el cursor `cur`.
+
+    Con una ConexionPreparada usa PREPARE/EXECUTE; con cualquier otra
+    conexión (scripts, pruebas) ejecuta el SQL directamente.
+    """
+    tipos, consulta = SENTENCIAS[nombre]
+    conn = cur.connection
+    if not isinstance(conn, ConexionPreparada):
+        cur.execute(consulta, params)
+        return
+
+    inicio = time.monotonic()
+    preparada = nombre not in conn.preparadas
+    if preparada:
+        numeros = iter(range(1, len(tipos) + 1))
+        cuerpo = re.sub(r'%s', lambda _: '$%d' % next(numeros), consulta)
+        cur.execute('PREPARE %s%s AS %s' % (nombre, '(%s)' % ', '.join(tipos) if tipos else '', cuerpo))
+        conn.preparadas.add(nombre)
+    cur.execute('EXECUTE %s%s' % (nombre, '(%s)' % ', '.join(['%s'] * len(tipos)) if tipos else ''), params)
+    contadores.sumar(nombre, preparada, time.monotonic() - inicio)
@@ -0,0 +1,137 @@
+// =============================================
+// BUSCADOR INCREMENTAL (TYPEAHEAD)
+// =============================================
+// Conecta un campo de texto con /api/clientes o /api/productos: mientras se
+// escribe consulta el servidor (con una pequeña espera entre teclas), muestra
+// los resultados en una lista y, al elegir uno, guarda su id en el campo oculto.
+//
+//   crearBuscador(inputTexto, inputOculto, {
+//       url: '/api/productos',
+//       etiqueta: r => r.nombre,            // texto de cada resultado
+//       alElegir: r => { ... },             // opcional
+//   });
+function crearBuscador(texto, oculto, opciones) {
+    const espera = opciones.espera || 250;
+    const lista = document.createElement('ul');
+    lista.className = 'buscador-resultados';
+    lista.hidden = true;
+    texto.parentElement.classList.add('buscador');
+    texto.insertAdjacentElement('afterend', lista);
+    texto.setAttribute('autocomplete', 'off');
+
+    let temporizador = null;
+    let peticion = null;   // AbortController de la consulta en curso
+    let activo = -1;       // índice resaltado con el teclado
+
+    function consultar(despues) {
+        if (peticion) peticion.abort();
+        peticion = new AbortController();
+
+        const params = new URLSearchParams({ q: texto.value.trim() });
+        if (despues) params.set('despues', despues);
+
+        fetch(`${opciones.url}?${params}`, { signal: peticion.signal, credentials: 'same-origin' })
+            .then(respuesta => respuesta.ok ? respuesta.json() : Promise.reject(respuesta.status))
+            .then(datos => mostrar(datos, Boolean(despues)))
+            .catch(error => {
+                if (error.name !== 'AbortError') console.error('Error en la búsqueda:', error);
+            });
+    }
+
+    function mostrar(datos, agregar) {
+        if (!agregar) {
+            lista.innerHTML = '';
+            activo = -1;
+        }
+        lista.querySelector('.buscador-mas')?.remove();
+
+        datos.resultados.forEach(resultado => {
+            const item = document.createElement('li');
+            item.textContent = opciones.etiqueta(resultado);
+            // mousedown en lugar de click: se dispara antes del blur del campo
+            item.addEventListener('mousedown', evento => {
+                evento.preventDefault();
+                elegir(resultado);
+            });
+            lista.appendChild(item);
+        });
+
+        if (!lista.children.length) {
+            const vacio = document.createElement('li');
+            vacio.className = 'buscador-vacio';
+            vacio.textContent = 'Sin resultados';
+            lista.appendChild(vacio);
+        }
+
+        if (datos.siguiente) {
+            const mas = document.createElement('li');
+            mas.className = 'buscador-mas';
+            mas.textContent = 'Ver más resultados…';
+            mas.addEventListener('mousedown', evento => {
+                evento.preventDefault();
+                consultar(datos.siguiente);
+            });
+            lista.appendChild(mas);
+        }
+        lista.hidden = false;
+    }
+
+    function elegir(resultado) {
+        texto.value = opciones.etiqueta(resultado);
+        oculto.value = resultado.id;
+        lista.hidden = true;
+        if (opciones.alElegir) opciones.alElegir(resultado);
+    }
+
+    function limpiar() {
+        if (!oculto.value) return;
+        oculto.value = '';
+        if (opciones.alLimpiar) opciones.alLimpiar();
+    }
+
+    texto.addEventListener('input', () => {
+        // Lo escrito ya no corresponde al elemento elegido
+        limpiar();
+        clearTimeout(temporizador);
+        temporizador = setTimeout(() => consultar(null), espera);
+    });
+
+    texto.addEventListener('focus', () => {
+        if (!oculto.value) consultar(null);
+    });
+
+    texto.addEventListener('blur', () => {
+        lista.hidden = true;
+    });
+
+    texto.addEventListener('keydown', evento => {
+        const items = lista.querySelectorAll('li:not(.buscador-vacio)');
+        if (lista.hidden || !items.length) return;
+
+        if (evento.key === 'ArrowDown' || evento.key === 'ArrowUp') {
+            evento.preventDefault();
+            items[activo]?.classList.remove('activo');
+            activo = (activo + (evento.key === 'ArrowDown' ? 1 : -1) + items.length) % items.length;
+            items[activo].classList.add('activo');
+            items[activo].scrollIntoView({ block: 'nearest' });
+        } else if (evento.key === 'Enter' && activo >= 0) {
+            evento.preventDefault();
+            items[activo].dispatchEvent(new MouseEvent('mousedown'));
+        } else if (evento.key === 'Escape') {
+            lista.hidden = true;
+        }
+    });
+}
+
+// Los campos ocultos no se validan con "required": se comprueba al enviar
+function validarBuscadores(formulario) {
+    formulario.addEventListener('submit', evento => {
+        for (const oculto of formulario.querySelectorAll('input[type="hidden"][data-requerido]')) {
+            if (!oculto.value) {
+                evento.preventDefault();
+                alert(oculto.dataset.requerido);
+                return;
+            }
+        }
+    });
+}
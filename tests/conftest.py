@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Los módulos de la aplicación están en la raíz del repositorio
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# app.py lee su configuración al importarse; estos valores solo permiten
+# importarlo en las pruebas (ninguna prueba de app.py abre conexiones)
+for variable, valor in (('FLASK_SECRET_KEY', 'pruebas'), ('DB_HOST', 'localhost'), ('DB_PORT', '5432'),
+                        ('DB_NAME', 'facturacion_db'), ('DB_USER', 'postgres'), ('DB_PASSWORD', '')):
+    os.environ.setdefault(variable, valor)
@@ -0,0 +1,57 @@
+import os
+
+from cache_pdf import CachePdf, version_factura
+
+
+def test_version_cambia_con_el_contenido():
+    factura = (1, 'FACT-1001', 'CLIENTE', [(1, 'Producto', 2, '10.00')])
+    assert version_factura(factura) == version_factura(tuple(factura))
+    assert version_factura(factura) != version_factura(factura[:3] + ([(1, 'Producto', 3, '10.00')],))
+
+
+def test_expulsa_la_menos_usada_al_superar_el_tamano():
+    cache = CachePdf(max_bytes=10)
+    cache.guardar((1, 'a'), b'1111')
+    cache.guardar((2, 'a'), b'2222')
+    assert cache.obtener((1, 'a')) == b'1111'   # la 2 pasa a ser la menos usada
+
+    cache.guardar((3, 'a'), b'3333')
+    assert cache.obtener((2, 'a')) is None
+    assert cache.obtener((1, 'a')) == b'1111'
+    assert cache.obtener((3, 'a')) == b'3333'
+
+    estadisticas = cache.estadisticas()
+    assert (estadisticas['bytes'], estadisticas['expulsadas']) == (8, 1)
+
+
+def test_no_guarda_pdfs_mayores_que_el_maximo():
+    cache = CachePdf(max_bytes=4)
+    cache.guardar((1, 'a'), b'12345')
+    assert cache.obtener((1, 'a')) is None
+    assert cache.estadisticas()['bytes'] == 0
+
+
+def test_una_version_nueva_reemplaza_a_la_anterior():
+    cache = CachePdf(max_bytes=100)
+    cache.guardar((1, 'v1'), b'antes')
+    cache.guardar((1, 'v2'), b'despues')
+
+    assert cache.obtener((1, 'v1')) is None
+    assert cache.estadisticas()['bytes'] == len(b'despues')
+
+
+def test_nivel_en_disco(tmp_path):
+    directorio = str(tmp_path)
+    CachePdf(max_bytes=100, directorio=directorio).guardar((1, 'v1'), b'pdf v1')
+
+    # Otro proceso (otra instancia) lo lee del disco
+    cache = CachePdf(max_bytes=100, directorio=directorio)
+    assert cache.obtener((1, 'v1')) == b'pdf v1'
+    assert cache.estadisticas()['aciertos_disco'] == 1
+
+    cache.guardar((1, 'v2'), b'pdf v2')
+    assert os.listdir(directorio) == ['factura_1_v2.pdf']
+
+    cache.invalidar(1)
+    assert os.listdir(directorio) == []
+    assert cache.obtener((1, 'v2')) is None
@@ -0,0 +1,87 @@
+from datetime import datetime
+
+from app import (app, buscar_en_catalogo, escribir_cursor, leer_cursor, leer_cursor_nombre, pagina_catalogo,
+                 pagina_facturas, BUSQUEDA_POR_PAGINA, BUSQUEDA_POR_PAGINA_MAX)
+
+
+def factura(id_, fecha):
+    # Solo importan el id (columna 0) y la fecha de orden (columna 5)
+    return (id_, None, None, None, None, fecha)
+
+
+def clientes(cantidad):
+    return [(i, f'CLIENTE {i:03d}', f'20{i:09d}') for i in range(1, cantidad + 1)]
+
+
+def primera_pagina(url, filas):
+    # Sin texto ni cursor la página sale del caché: no se consulta la base de datos
+    with app.test_request_context(url):
+        return buscar_en_catalogo('buscar_clientes', ('id', 'nombre', 'ruc'), lambda: filas)
+
+
+def test_cursor_de_facturas_ida_y_vuelta():
+    fila = factura(42, datetime(2024, 3, 5, 14, 30, 15, 123456))
+    assert leer_cursor(escribir_cursor(fila)) == (fila[5], 42)
+
+
+def test_cursor_de_facturas_invalido():
+    for valor in (None, '', 'abc', '2024-03-05', '2024-13-05T00:00:00_1', '2024-03-05T00:00:00_x'):
+        assert leer_cursor(valor) is None
+
+
+def test_cursor_de_catalogo_con_guiones_bajos_en_el_nombre():
+    assert leer_cursor_nombre('COMERCIAL_EL_SOL S.A.C._15') == ('COMERCIAL_EL_SOL S.A.C.', 15)
+    assert leer_cursor_nombre('sin_id_') is None
+    assert leer_cursor_nombre('sinid') is None
+    assert leer_cursor_nombre('') is None
+
+
+def test_primera_pagina_del_catalogo():
+    pagina = primera_pagina('/api/clientes?limite=2', clientes(5))
+    assert pagina['resultados'] == [{'id': 1, 'nombre': 'CLIENTE 001', 'ruc': '20000000001'},
+                                    {'id': 2, 'nombre': 'CLIENTE 002', 'ruc': '20000000002'}]
+    assert pagina['siguiente'] == 'CLIENTE 002_2'
+    assert primera_pagina('/api/clientes?limite=5', clientes(5))['siguiente'] is None
+
+
+def test_limite_del_catalogo_acotado():
+    filas = clientes(BUSQUEDA_POR_PAGINA_MAX + 10)
+    assert len(primera_pagina('/api/clientes?limite=0', filas)['resultados']) == 1
+    assert len(primera_pagina('/api/clientes?limite=x', filas)['resultados']) == BUSQUEDA_POR_PAGINA
+    assert len(primera_pagina('/api/clientes?limite=100000', filas)['resultados']) == BUSQUEDA_POR_PAGINA_MAX
+
+
+def test_cursor_de_catalogo_invalido_se_ignora():
+    assert primera_pagina('/api/clientes?despues=sin_id', clientes(3))['resultados'][0]['id'] == 1
+
+
+def test_pagina_de_catalogo():
+    filas = [(1, 'A', '10.50'), (2, 'B', '3'), (3, 'C', '1')]
+    pagina = pagina_catalogo(filas, ('id', 'nombre', 'precio'), 2)
+    assert pagina['resultados'] == [{'id': 1, 'nombre': 'A', 'precio': 10.5}, {'id': 2, 'nombre': 'B', 'precio': 3.0}]
+    assert leer_cursor_nombre(pagina['siguiente']) == ('B', 2)
+
+
+def test_pagina_de_facturas_hacia_adelante():
+    filas = [factura(i, datetime(2024, 1, 10 - i)) for i in (1, 2, 3)]
+
+    primera, paginacion = pagina_facturas(filas, 2, False, None)
+    assert [f[0] for f in primera] == [1, 2]
+    assert leer_cursor(paginacion['siguiente']) == (filas[1][5], 2)
+    assert paginacion['anterior'] is None
+
+    ultima, paginacion = pagina_facturas(filas[2:], 2, False, (filas[1][5], 2))
+    assert [f[0] for f in ultima] == [3]
+    assert paginacion['siguiente'] is None
+    assert leer_cursor(paginacion['anterior']) == (filas[2][5], 3)
+
+
+def test_pagina_de_facturas_hacia_atras():
+    # Al retroceder la fila extra es la primera
+    filas = [factura(i, datetime(2024, 1, 10 - i)) for i in (1, 2, 3)]
+    pagina, paginacion = pagina_facturas(filas, 2, True, (datetime(2024, 1, 6), 4))
+    assert [f[0] for f in pagina] == [2, 3]
+    assert leer_cursor(paginacion['anterior']) == (filas[1][5], 2)
+    assert leer_cursor(paginacion['siguiente']) == (filas[2][5], 3)
+
+    assert pagina_facturas([], 2, True, None) == ([], None)
@@ -0,0 +1,162 @@
+import threading
+import time
+
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+import db_pool
+from db_pool import PoolAgotado, PoolConexiones
+
+
+class CursorFalso:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, consulta):
+        if self.conn.caida:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+
+class ConexionFalsa:
+    def __init__(self):
+        self.closed = 0
+        self.caida = False
+        self.estado = extensions.TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.estado
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.estado = extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return CursorFalso(self)
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def conexiones(monkeypatch):
+    # Todas las conexiones que abre el pool, en orden
+    creadas = []
+
+    def conectar(**kwargs):
+        creadas.append(ConexionFalsa())
+        return creadas[-1]
+
+    monkeypatch.setattr(db_pool.psycopg2, 'connect', conectar)
+    return creadas
+
+
+def test_tamanos_invalidos():
+    with pytest.raises(ValueError):
+        PoolConexiones({}, minimo=3, maximo=2)
+
+
+def test_crea_el_minimo_y_reutiliza(conexiones):
+    pool = PoolConexiones({}, minimo=2, maximo=4)
+    assert len(conexiones) == 2
+
+    conn = pool.obtener()
+    pool.devolver(conn)
+    assert pool.obtener() is conn
+    assert pool.estadisticas()['creadas'] == 2
+
+
+def test_timeout_con_el_pool_lleno(conexiones):
+    pool = PoolConexiones({}, minimo=0, maximo=1, timeout=0.05)
+    conn = pool.obtener()
+
+    with pytest.raises(PoolAgotado):
+        pool.obtener()
+    assert pool.estadisticas()['agotado'] == 1
+
+    pool.devolver(conn)
+    assert pool.obtener() is conn
+
+
+def test_espera_a_que_se_devuelva_una_conexion(conexiones):
+    pool = PoolConexiones({}, minimo=0, maximo=1, timeout=5)
+    conn = pool.obtener()
+    threading.Timer(0.05, pool.devolver, (conn,)).start()
+
+    assert pool.obtener() is conn
+    estadisticas = pool.estadisticas()
+    assert estadisticas['esperas'] == 1
+    assert estadisticas['tiempo_espera_max_ms'] > 0
+
+
+def test_recicla_por_vida_maxima(conexiones):
+    pool = PoolConexiones({}, minimo=0, maximo=1, vida_maxima=0.05)
+    vieja = pool.obtener()
+    pool.devolver(vieja)
+    time.sleep(0.1)
+
+    nueva = pool.obtener()
+    assert nueva is not vieja
+    assert vieja.closed
+    assert pool.estadisticas()['recicladas'] == 1
+
+
+def test_recicla_por_inactividad(conexiones):
+    pool = PoolConexiones({}, minimo=0, maximo=1, vida_maxima=0, inactividad_maxima=0.05)
+    vieja = pool.obtener()
+    pool.devolver(vieja)
+    time.sleep(0.1)
+
+    assert pool.obtener() is not vieja
+    assert vieja.closed
+    assert pool.estadisticas()['recicladas'] == 1
+
+
+def test_descarta_la_conexion_que_no_responde(conexiones):
+    pool = PoolConexiones({}, minimo=0, maximo=1, verificar_tras=0)
+    caida = pool.obtener()
+    pool.devolver(caida)
+    caida.caida = True
+
+    conn = pool.obtener()
+    assert conn is not caida
+    assert caida.closed
+    assert pool.estadisticas()['descartadas'] == 1
+
+
+def test_devolver_deshace_la_transaccion_abierta(conexiones):
+    pool = PoolConexiones({}, minimo=0, maximo=1)
+    conn = pool.obtener()
+    conn.estado = extensions.TRANSACTION_STATUS_INTRANS
+
+    pool.devolver(conn)
+    assert conn.rollbacks == 1
+    assert pool.estadisticas()['libres'] == 1
+
+
+def test_devolver_descartando(conexiones):
+    pool = PoolConexiones({}, minimo=0, maximo=1)
+    conn = pool.obtener()
+
+    pool.devolver(conn, descartar=True)
+    assert conn.closed
+    estadisticas = pool.estadisticas()
+    assert (estadisticas['libres'], estadisticas['descartadas']) == (0, 1)
+
+
+def test_conexion_cerrada_durante_el_uso_se_descarta(conexiones):
+    pool = PoolConexiones({}, minimo=0, maximo=1)
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.conexion() as conn:
+            conn.close()
+            raise psycopg2.OperationalError("conexión perdida")
+
+    assert pool.estadisticas()['libres'] == 0
+    assert pool.obtener() is not conn
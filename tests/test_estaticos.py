@@ -0,0 +1,59 @@
+import gzip
+import re
+
+import pytest
+from werkzeug.datastructures import Accept
+from werkzeug.http import parse_accept_header
+
+import estaticos
+from estaticos import Estaticos
+
+CSS = b'body { margin: 0; }\n' * 50
+
+
+@pytest.fixture
+def directorio(tmp_path):
+    (tmp_path / 'style.css').write_bytes(CSS)
+    (tmp_path / 'img').mkdir()
+    (tmp_path / 'img' / 'logo.png').write_bytes(b'\x89PNG\r\n\x1a\n' + bytes(range(64)))
+    return tmp_path
+
+
+def test_nombre_con_huella(directorio):
+    publicados = Estaticos(str(directorio))
+    assert re.fullmatch(r'style\.[0-9a-f]{12}\.css', publicados.url('style.css'))
+    assert re.fullmatch(r'img/logo\.[0-9a-f]{12}\.png', publicados.url('img/logo.png'))
+    assert publicados.url('no_existe.js') == 'no_existe.js'
+
+
+def test_la_huella_cambia_con_el_contenido(directorio):
+    antes = Estaticos(str(directorio))
+    (directorio / 'style.css').write_bytes(CSS + b'p { color: red; }\n')
+    despues = Estaticos(str(directorio))
+
+    assert despues.url('style.css') != antes.url('style.css')
+    assert despues.url('img/logo.png') == antes.url('img/logo.png')
+    assert despues.huella() != antes.huella()
+
+
+def test_sirve_la_variante_comprimida(directorio):
+    publicados = Estaticos(str(directorio))
+    url = publicados.url('style.css')
+
+    tipo, codificacion, datos = publicados.obtener(url, parse_accept_header('gzip', Accept))
+    assert (tipo, codificacion) == ('text/css', 'gzip')
+    assert gzip.decompress(datos) == CSS
+
+    assert publicados.obtener(url, Accept())[1:] == ('identity', CSS)
+    if estaticos.brotli is not None:
+        assert publicados.obtener(url, parse_accept_header('gzip, br', Accept))[1] == 'br'
+
+
+def test_no_comprime_binarios(directorio):
+    publicados = Estaticos(str(directorio))
+    _, codificacion, _ = publicados.obtener(publicados.url('img/logo.png'), parse_accept_header('gzip', Accept))
+    assert codificacion == 'identity'
+
+
+def test_archivo_desconocido(directorio):
+    assert Estaticos(str(directorio)).obtener('style.000000000000.css', Accept()) is None
@@ -0,0 +1,137 @@
+import io
+import os
+
+import psycopg2
+import pytest
+
+from importar import ErrorImportacion, importar_csv
+
+
+def importar(texto, tipo='clientes', conn=None, **opciones):
+    return importar_csv(conn, tipo, io.BytesIO(texto.encode('utf-8')), **opciones)
+
+
+@pytest.mark.parametrize('tipo, texto, delimitador, mensaje', [
+    ('proveedores', 'ruc,nombre\n', ',', 'Tipo de importación desconocido'),
+    ('clientes', 'ruc,nombre\n', '"', 'Delimitador inválido'),
+    ('clientes', 'ruc,nombre\n', ';;', 'Delimitador inválido'),
+    ('clientes', '', ',', 'El archivo está vacío'),
+    ('clientes', 'ruc,nombre,fax\n', ',', 'Columnas desconocidas: fax'),
+    ('productos', 'nombre,precio\n', ',', 'Faltan columnas obligatorias: stock'),
+    ('clientes', 'ruc,nombre,RUC\n', ',', 'columnas repetidas'),
+])
+def test_cabecera_invalida(tipo, texto, delimitador, mensaje):
+    # Se rechaza antes de usar la conexión
+    with pytest.raises(ErrorImportacion, match=mensaje):
+        importar(texto, tipo, delimitador=delimitador)
+
+
+@pytest.fixture
+def conn():
+    try:
+        conn = psycopg2.connect(host=os.environ['DB_HOST'], port=os.environ['DB_PORT'], dbname=os.environ['DB_NAME'],
+                                user=os.environ['DB_USER'], password=os.environ['DB_PASSWORD'], connect_timeout=3)
+    except psycopg2.Error as e:
+        pytest.skip(f"Sin base de datos: {e}")
+    yield conn
+    conn.close()
+
+
+def test_errores_por_linea_de_clientes(conn):
+    resumen = importar(
+        ' RUC ;Nombre;Email\n'
+        '20123456789;ACME;ventas@acme.pe\n'
+        '2012345678;CORTO;\n'
+        '20999999991; ;\n'
+        '20123456789;ACME DUPLICADO;\n',
+        conn=conn, delimitador=';', estricto=True,
+    )
+    assert resumen['total'] == 4
+    assert not resumen['aplicado']
+    assert resumen['errores'] == [
+        (3, 'El RUC debe tener exactamente 11 dígitos'),
+        (4, 'El nombre es obligatorio'),
+        (5, 'RUC repetido en el archivo (primera aparición en la línea 2)'),
+    ]
+    assert (resumen['filas_con_error'], resumen['insertados'], resumen['actualizados']) == (3, 0, 0)
+
+
+def test_errores_por_linea_de_productos(conn):
+    resumen = importar(
+        'nombre,precio,stock\n'
+        'Tornillo,0.50,100\n'
+        'Tuerca,0,10\n'
+        'Arandela,1.234,10\n'
+        'Clavo,1,-5\n'
+        'TORNILLO ,2,1\n',
+        tipo='productos', conn=conn, estricto=True,
+    )
+    mensaje_precio = 'El precio debe ser un número mayor que cero (máximo 2 decimales)'
+    assert resumen['errores'] == [
+        (3, mensaje_precio),
+        (4, mensaje_precio),
+        (5, 'El stock debe ser un entero no negativo'),
+        (6, 'Producto repetido en el archivo (primera aparición en la línea 2)'),
+    ]
+    assert not resumen['aplicado']
+
+
+def test_estricto_no_aplica_nada(conn):
+    importar('ruc,nombre\n20555555551,PRUEBA ESTRICTO\n2055,MAL\n', conn=conn, estricto=True)
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM clientes WHERE ruc = '20555555551'")
+        assert cur.fetchone()[0] == 0
+    conn.rollback()
+
+
+def test_lineas_con_campos_de_varias_lineas(conn):
+    resumen = importar(
+        'ruc,nombre,direccion\n'
+        '20123456789,ACME,"Av. Uno 123\n'
+        'Piso 2\n'
+        'Oficina 5"\n'
+        '2012,CORTO,\n'
+        '\n'
+        '20123456780,EXTRA,Calle 1,999\n',
+        conn=conn, estricto=True,
+    )
+    assert resumen['total'] == 3
+    assert resumen['errores'] == [
+        (5, 'El RUC debe tener exactamente 11 dígitos'),
+        (7, 'La fila tiene 4 columnas y la cabecera 3'),
+    ]
+
+
+@pytest.fixture
+def limpiar(conn):
+    yield
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM clientes WHERE ruc = '20444444441'")
+        cur.execute("DELETE FROM productos WHERE LOWER(nombre) = 'producto de prueba importar'")
+    conn.commit()
+
+
+def test_reimportar_sin_columnas_opcionales_las_conserva(conn, limpiar):
+    resumen = importar('ruc,nombre,direccion,telefono,email\n'
+                       '20444444441,Prueba,Av. Uno,999888777,Ventas@Prueba.pe\n', conn=conn)
+    assert resumen['insertados'] == 1
+
+    # Una exportación que solo trae RUC y nombre actualiza el nombre y nada más
+    resumen = importar('ruc,nombre\n20444444441,Prueba Renombrada\n', conn=conn)
+    assert (resumen['insertados'], resumen['actualizados']) == (0, 1)
+    resumen = importar('ruc,nombre\n20444444441,Prueba Renombrada\n', conn=conn)
+    assert resumen['sin_cambios'] == 1
+
+    resumen = importar('nombre,descripcion,precio,stock\nProducto de prueba importar,Caja x 12,5.50,10\n',
+                       tipo='productos', conn=conn)
+    assert resumen['insertados'] == 1
+    resumen = importar('nombre,precio,stock\nProducto de prueba importar,6,12\n', tipo='productos', conn=conn)
+    assert resumen['actualizados'] == 1
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT nombre, direccion, telefono, email FROM clientes WHERE ruc = '20444444441'")
+        assert cur.fetchone() == ('PRUEBA RENOMBRADA', 'AV. UNO', '999888777', 'ventas@prueba.pe')
+        cur.execute("SELECT descripcion, precio, stock FROM productos "
+                    "WHERE LOWER(nombre) = 'producto de prueba importar'")
+        assert cur.fetchone() == ('Caja x 12', 6, 12)
+    conn.rollback()
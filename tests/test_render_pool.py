@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+from render_pool import ColaLlena, PoolRender
+
+
+@pytest.fixture
+def pool():
+    pool = PoolRender(procesos=1, max_cola=0, timeout=0.05)
+    yield pool
+    pool.cerrar()
+
+
+def esperar_terminados(pool, cantidad):
+    # Las métricas se actualizan en el callback del Future, justo después del resultado
+    limite = time.monotonic() + 5
+    while time.monotonic() < limite:
+        estadisticas = pool.estadisticas()
+        if estadisticas['completados'] + estadisticas['fallidos'] >= cantidad:
+            return estadisticas
+        time.sleep(0.01)
+    raise AssertionError("El pool no terminó los trabajos")
+
+
+def test_ejecuta_en_otro_proceso(pool):
+    assert pool.ejecutar(divmod, 7, 2) == (3, 1)
+    assert esperar_terminados(pool, 1)['completados'] == 1
+
+
+def test_rechaza_sin_cupo(pool):
+    ocupado = pool.enviar(time.sleep, 0.5)
+    with pytest.raises(ColaLlena):
+        pool.enviar(divmod, 7, 2)
+    assert pool.estadisticas()['rechazados'] == 1
+
+    ocupado.result()
+    # Al terminar se libera el cupo
+    assert pool.enviar(divmod, 7, 2, timeout=5).result() == (3, 1)
+
+
+def test_cuenta_los_trabajos_fallidos(pool):
+    with pytest.raises(ZeroDivisionError):
+        pool.ejecutar(divmod, 1, 0)
+    estadisticas = esperar_terminados(pool, 1)
+    assert (estadisticas['fallidos'], estadisticas['en_vuelo']) == (1, 0)